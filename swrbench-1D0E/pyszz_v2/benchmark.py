@@ -0,0 +1,352 @@
+import argparse
+import json
+import logging as log
+import os
+import random
+import re
+import shutil
+import subprocess
+import tempfile
+from collections import Counter
+from time import time as ts
+from typing import Dict, List
+
+import yaml
+
+log.basicConfig(level=log.INFO, format='%(asctime)s :: %(funcName)s - %(levelname)s :: %(message)s')
+log.getLogger('pydriller').setLevel(log.WARNING)
+
+# szz_name -> default configuration file of the variant
+VARIANT_CONFS = {
+    'b': 'conf/bszz.yml',
+    'ag': 'conf/agszz.yml',
+    'ma': 'conf/maszz.yml',
+    'r': 'conf/rszz.yml',
+    'l': 'conf/lszz.yml',
+    'ra': 'conf/raszz.yml',
+    'pd': 'conf/pdszz.yml',
+    'a': 'conf/aszz.yml',
+    'df': 'conf/dfszz.yml',
+}
+
+# source templates used to fill the synthetic files, '{k}' is the block id and '{v}' a mutable value
+BLOCK_TEMPLATES = {
+    'py': ['def func_{k}(x):',
+           '    if x > {v}:',
+           '        return x + {v}',
+           '    return x - {v}',
+           ''],
+    'c': ['int func_{k}(int x) {',
+          '    if (x > {v}) {',
+          '        return x + {v};',
+          '    }',
+          '    return x - {v};',
+          '}',
+          ''],
+}
+
+SYNTHETIC_BASE_DATE = 1262304000  # 2010-01-01T00:00:00Z
+SYNTHETIC_COMMIT_INTERVAL = 60 * 60
+
+
+class SyntheticRepoParams:
+    """ Shape of a synthetic repository history """
+
+    def __init__(self, depth: int = 200, files: int = 10, blocks_per_file: int = 20, lines_per_commit: int = 3,
+                 rename_density: float = 0.05, mode_change_density: float = 0.05, revert_density: float = 0.02,
+                 fix_size: int = 5, lang: str = 'py', seed: int = 0):
+        """
+        :param int depth: number of commits between the initial commit and the fix commit
+        :param int files: number of source files in the initial commit
+        :param int blocks_per_file: number of code blocks (functions) in each initial file
+        :param int lines_per_commit: number of lines modified by each commit of the history
+        :param float rename_density: probability that a history commit also renames the modified file
+        :param float mode_change_density: probability that a history commit also toggles the executable bit
+        :param float revert_density: probability that a history commit is followed by its revert
+        :param int fix_size: number of lines modified by the fix commit
+        :param str lang: language of the generated files (py, c)
+        :param int seed: seed of the random generator, the same params always produce the same history
+        """
+        assert lang in BLOCK_TEMPLATES, f'unsupported synthetic language: {lang}'
+        self.depth = depth
+        self.files = files
+        self.blocks_per_file = blocks_per_file
+        self.lines_per_commit = lines_per_commit
+        self.rename_density = rename_density
+        self.mode_change_density = mode_change_density
+        self.revert_density = revert_density
+        self.fix_size = fix_size
+        self.lang = lang
+        self.seed = seed
+
+    def to_dict(self) -> Dict:
+        return dict(self.__dict__)
+
+
+class SyntheticRepo:
+    """
+    Generates a git repository with a reproducible history: an initial commit with `files` source files, `depth`
+    commits modifying, renaming, changing the mode of and reverting them, and a final fix commit at HEAD.
+    """
+
+    def __init__(self, path: str, params: 'SyntheticRepoParams'):
+        self.path = path
+        self.params = params
+        self.__rnd = random.Random(params.seed)
+        self.__commit_count = 0
+        self.__block_count = 0
+
+    def _git(self, *args: str) -> str:
+        commit_date = f'{SYNTHETIC_BASE_DATE + self.__commit_count * SYNTHETIC_COMMIT_INTERVAL} +0000'
+        env = dict(os.environ, GIT_AUTHOR_DATE=commit_date, GIT_COMMITTER_DATE=commit_date)
+        out = subprocess.run(['git', *args], cwd=self.path, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        if out.returncode != 0:
+            raise Exception(out.stdout.decode('utf-8', 'replace'))
+
+        return out.stdout.decode('utf-8', 'replace')
+
+    def _commit(self, message: str):
+        self.__commit_count += 1
+        self._git('commit', '-q', '-a', '-m', message)
+
+    def _new_block(self) -> List[str]:
+        self.__block_count += 1
+        return [line.format(k=self.__block_count, v=self.__rnd.randint(0, 1000)) for line in BLOCK_TEMPLATES[self.params.lang]]
+
+    def _tracked_files(self) -> List[str]:
+        return sorted(self._git('ls-files').splitlines())
+
+    def _mutate_lines(self, file_path: str, count: int):
+        """ Change the value of `count` random mutable lines of the given file """
+        abs_path = os.path.join(self.path, file_path)
+        with open(abs_path) as f:
+            lines = f.read().split('\n')
+
+        mutable = [i for i, line in enumerate(lines) if line.startswith(' ') and re.search(r'\d', line)]
+        for i in self.__rnd.sample(mutable, min(count, len(mutable))):
+            lines[i] = re.sub(r'\d+(?=\D*$)', str(self.__rnd.randint(0, 1000)), lines[i], count=1)
+
+        with open(abs_path, 'w') as f:
+            f.write('\n'.join(lines))
+
+    def generate(self) -> str:
+        """
+        Create the repository and its history.
+
+        :returns str the hash of the fix commit
+        """
+        p = self.params
+        os.makedirs(self.path, exist_ok=True)
+        self._git('init', '-q')
+        self._git('config', 'user.name', 'pyszz-bench')
+        self._git('config', 'user.email', 'pyszz-bench@example.com')
+        self._git('config', 'core.fileMode', 'true')
+
+        for i in range(p.files):
+            lines = list()
+            for _ in range(p.blocks_per_file):
+                lines.extend(self._new_block())
+            with open(os.path.join(self.path, f'module_{i}.{p.lang}'), 'w') as f:
+                f.write('\n'.join(lines))
+        self._git('add', '-A')
+        self._commit('Initial commit')
+
+        renames = 0
+        for i in range(p.depth):
+            file_path = self.__rnd.choice(self._tracked_files())
+            self._mutate_lines(file_path, p.lines_per_commit)
+
+            if self.__rnd.random() < p.mode_change_density:
+                abs_path = os.path.join(self.path, file_path)
+                os.chmod(abs_path, os.stat(abs_path).st_mode ^ 0o111)
+            if self.__rnd.random() < p.rename_density:
+                renames += 1
+                self._git('mv', file_path, f'renamed_{renames}_{os.path.basename(file_path)}')
+            self._commit(f'Change {i}')
+
+            if self.__rnd.random() < p.revert_density:
+                self.__commit_count += 1
+                self._git('revert', '--no-edit', 'HEAD')
+
+        for file_path in self.__rnd.sample(self._tracked_files(), min(p.fix_size, p.files)):
+            self._mutate_lines(file_path, max(1, p.fix_size // min(p.fix_size, p.files)))
+        self._commit('Fix bug')
+
+        return self._git('rev-parse', 'HEAD').strip()
+
+    @property
+    def fix_date(self) -> str:
+        return self._git('show', '-s', '--format=%aI', 'HEAD').strip()
+
+
+class GitCallCounter:
+    """
+    Counts the git subprocesses spawned through GitPython (and so PyDriller) while active.
+    Usage: `with GitCallCounter() as counter: ...`, then read `counter.total` and `counter.by_command`.
+    """
+
+    def __init__(self):
+        self.by_command = Counter()
+        self.__orig_execute = None
+
+    @property
+    def total(self) -> int:
+        return sum(self.by_command.values())
+
+    @staticmethod
+    def _git_subcommand(command) -> str:
+        if isinstance(command, str):
+            command = command.split()
+        args = iter(command[1:])
+        for arg in args:
+            if arg == '-c':
+                next(args, None)
+            elif not arg.startswith('-'):
+                return arg
+        return '?'
+
+    def __enter__(self) -> 'GitCallCounter':
+        from git.cmd import Git
+
+        self.__orig_execute = Git.execute
+        orig_execute = self.__orig_execute
+        by_command = self.by_command
+
+        def counting_execute(git_self, command, *args, **kwargs):
+            by_command[GitCallCounter._git_subcommand(command)] += 1
+            return orig_execute(git_self, command, *args, **kwargs)
+
+        Git.execute = counting_execute
+        return self
+
+    def __exit__(self, *exc):
+        from git.cmd import Git
+
+        Git.execute = self.__orig_execute
+
+
+def load_variant_conf(szz_name: str, lang: str) -> Dict:
+    with open(os.path.join(os.path.dirname(os.path.realpath(__file__)), VARIANT_CONFS[szz_name])) as f:
+        conf = yaml.safe_load(f)
+    conf['file_ext_to_parse'] = [lang]
+
+    return conf
+
+
+def run_variant(szz_name: str, conf: Dict, input_json: str, repos_dir: str, work_dir: str) -> Dict:
+    """
+    Run main.main() for a single SZZ variant on the given bug-fix commits, counting time and git subprocesses.
+
+    :returns Dict with the measures of the run
+    """
+    import main
+
+    out_json = os.path.join(work_dir, f'bic_{szz_name}.json')
+    result = {'szz_name': szz_name, 'status': 'ok'}
+    start = ts()
+    with GitCallCounter() as counter:
+        try:
+            main.main(input_json, out_json, conf, repos_dir)
+        except (Exception, SystemExit) as e:
+            log.error(f'{szz_name}-szz failed: {e}')
+            result['status'] = f'error: {e.__class__.__name__}: {e}'
+    result['time'] = ts() - start
+    result['git_calls'] = counter.total
+    result['git_calls_by_command'] = dict(counter.by_command.most_common())
+
+    if os.path.isfile(out_json):
+        with open(out_json) as f:
+            out = json.load(f)
+        result['inducing_commit_hash'] = [c['inducing_commit_hash'] for c in out]
+        result['timed_out'] = [c.get('timed_out', False) for c in out]
+        os.remove(out_json)
+
+    return result
+
+
+def benchmark(params_list: List['SyntheticRepoParams'], variants: List[str], repeat: int = 1) -> Dict:
+    """
+    Generate one synthetic repository for each params set and run the given SZZ variants on their fix commits.
+
+    :param List[SyntheticRepoParams] params_list: one entry for each repository to generate
+    :param List[str] variants: szz_name of the variants to run
+    :param int repeat: number of runs for each variant, the reported time is the minimum
+    :returns Dict the benchmark report
+    """
+    report = {'repos': list(), 'variants': dict()}
+    work_dir = tempfile.mkdtemp(prefix='pyszz_bench_')
+    try:
+        repos_dir = os.path.join(work_dir, 'repos')
+        bugfix_commits = list()
+        for i, params in enumerate(params_list):
+            repo_name = f'synthetic/repo_{i}'
+            start = ts()
+            repo = SyntheticRepo(os.path.join(repos_dir, repo_name), params)
+            fix_commit = repo.generate()
+            log.info(f'generated {repo_name} in {ts() - start:.2f}s, fix commit: {fix_commit}')
+            bugfix_commits.append({
+                'repo_name': repo_name,
+                'fix_commit_hash': fix_commit,
+                'earliest_issue_date': repo.fix_date
+            })
+            report['repos'].append({'repo_name': repo_name, 'fix_commit_hash': fix_commit, 'params': params.to_dict()})
+
+        input_json = os.path.join(work_dir, 'bugfix_commits.json')
+        with open(input_json, 'w') as f:
+            json.dump(bugfix_commits, f)
+
+        for szz_name in variants:
+            runs = list()
+            for _ in range(repeat):
+                conf = load_variant_conf(szz_name, params_list[0].lang)
+                runs.append(run_variant(szz_name, conf, input_json, repos_dir, work_dir))
+
+            result = runs[-1]
+            result['times'] = [r['time'] for r in runs]
+            result['time'] = min(result['times'])
+            result['time_per_commit'] = result['time'] / len(bugfix_commits)
+            result['git_calls_per_commit'] = result['git_calls'] / len(bugfix_commits)
+            report['variants'][szz_name] = result
+            log.info(f"{szz_name}-szz: {result['time']:.2f}s, {result['git_calls']} git calls, {result['status']}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the SZZ variants on synthetic git repositories')
+    parser.add_argument('--variants', type=str, nargs='+', default=list(VARIANT_CONFS.keys()), choices=list(VARIANT_CONFS.keys()), help='szz_name of the variants to run')
+    parser.add_argument('--repos', type=int, default=1, help='number of synthetic repositories (one fix commit each)')
+    parser.add_argument('--depth', type=int, default=200, help='number of commits in the history')
+    parser.add_argument('--files', type=int, default=10, help='number of files')
+    parser.add_argument('--blocks-per-file', type=int, default=20, help='number of code blocks for each file')
+    parser.add_argument('--lines-per-commit', type=int, default=3, help='modified lines for each history commit')
+    parser.add_argument('--rename-density', type=float, default=0.05, help='probability of a file rename in each commit')
+    parser.add_argument('--mode-change-density', type=float, default=0.05, help='probability of a file mode change in each commit')
+    parser.add_argument('--revert-density', type=float, default=0.02, help='probability of a revert after each commit')
+    parser.add_argument('--fix-size', type=int, default=5, help='modified lines in the fix commit')
+    parser.add_argument('--lang', type=str, default='py', choices=list(BLOCK_TEMPLATES.keys()), help='language of the synthetic files')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the first repository, the following ones use seed + i')
+    parser.add_argument('--repeat', type=int, default=1, help='runs for each variant, the minimum time is reported')
+    parser.add_argument('--out', type=str, default=None, help='/path/to/report.json (default: stdout)')
+    parser.add_argument('--verbose', action='store_true', help='keep the INFO logs of the SZZ variants')
+    args = parser.parse_args()
+
+    if not args.verbose:
+        log.getLogger().setLevel(log.WARNING)
+
+    params_list = [SyntheticRepoParams(depth=args.depth, files=args.files, blocks_per_file=args.blocks_per_file,
+                                       lines_per_commit=args.lines_per_commit, rename_density=args.rename_density,
+                                       mode_change_density=args.mode_change_density, revert_density=args.revert_density,
+                                       fix_size=args.fix_size, lang=args.lang, seed=args.seed + i)
+                   for i in range(args.repos)]
+
+    report = benchmark(params_list, args.variants, args.repeat)
+
+    if args.out:
+        with open(args.out, 'w') as out:
+            json.dump(report, out, indent=4)
+        log.warning(f'benchmark report saved in {args.out}')
+    else:
+        print(json.dumps(report, indent=4))
@@ -0,0 +1,79 @@
+import argparse
+import json
+import logging as log
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from szz.service import SZZService
+from szz.util.check_requirements import check_requirements
+
+log.basicConfig(level=log.INFO, format='%(asctime)s :: %(funcName)s - %(levelname)s :: %(message)s')
+log.getLogger('pydriller').setLevel(log.WARNING)
+
+
+class SZZRequestHandler(BaseHTTPRequestHandler):
+    """
+    * POST /find_bic: body is a request {repo, fix_commit, conf} or a list of requests. The results are streamed
+      back as JSON lines (application/x-ndjson), in completion order.
+    * GET /status: list of the warm SZZ instances.
+    """
+
+    service: SZZService = None
+
+    def _send_json(self, status: int, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/status':
+            self._send_json(200, {'warm_instances': self.service.warm_instances})
+        else:
+            self._send_json(404, {'error': f'unknown path: {self.path}'})
+
+    def do_POST(self):
+        if self.path != '/find_bic':
+            self._send_json(404, {'error': f'unknown path: {self.path}'})
+            return
+
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            requests = json.loads(self.rfile.read(length).decode('utf-8'))
+        except ValueError as e:
+            self._send_json(400, {'error': f'invalid json: {e}'})
+            return
+        if isinstance(requests, dict):
+            requests = [requests]
+
+        # HTTP/1.0 response without Content-Length: the connection is closed after the last result
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.end_headers()
+        for result in self.service.run_many(requests):
+            self.wfile.write((json.dumps(result) + '\n').encode('utf-8'))
+            self.wfile.flush()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Long-running SZZ daemon keeping the repositories warm')
+    parser.add_argument('repos_dir', type=str, nargs='?', help='/path/to/repo-directory')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='address to bind')
+    parser.add_argument('--port', type=int, default=8765, help='port to bind')
+    parser.add_argument('--max-instances', type=int, default=16, help='max number of warm SZZ instances')
+    parser.add_argument('--max-workers', type=int, default=4, help='max number of concurrent requests for each POST')
+    args = parser.parse_args()
+
+    check_requirements()
+
+    SZZRequestHandler.service = SZZService(repos_dir=args.repos_dir, max_instances=args.max_instances, max_workers=args.max_workers)
+    server = ThreadingHTTPServer((args.host, args.port), SZZRequestHandler)
+    log.info(f'SZZ server listening on http://{args.host}:{args.port}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        log.info('shutting down')
+    finally:
+        SZZRequestHandler.service.evict()
+        server.server_close()
@@ -1,7 +1,6 @@
 import logging as log
 import traceback
 from typing import List, Set
-from time import time as ts
 from git import Commit
 from pydriller import RepositoryMining
 from szz.common.issue_date import filter_by_date
@@ -26,6 +25,8 @@ class AGSZZ(AbstractSZZ):
         to_exclude = set()
         repo_mining = RepositoryMining(self.repository_path, to_commit=commit_hash, order='reverse').traverse_commits()
         for commit in repo_mining:
+            if self._is_budget_exceeded():
+                break
             try:
                 if len(commit.modifications) > max_change_size:
                     to_exclude.add(commit.hash)
@@ -67,11 +68,15 @@ class AGSZZ(AbstractSZZ):
         :key ignore_revs_file_path (str): specify ignore revs file for git blame to ignore specific commits.
         :key max_change_size (int): if the number of modified files exceeds the threshold, the commit will be excluded (default 20)
         :key exclude_merge_commits (bool): if true, merge commits will be excluded (default False)
+        :key time_budget (float): max time in seconds for the fix commit, used if set_time_budget() was not called
+            (default DEFAULT_TIME_BUDGET). When exceeded, the partial candidates are returned and timed_out is set
         :returns Set[Commit] a set of bug introducing commits candidates, represented by Commit object
         """
 
         log.info(f"find_bic() kwargs: {kwargs}")
 
+        if self._deadline is None:
+            self.set_time_budget(kwargs.get('time_budget'))
         self._set_working_tree_to_commit(fix_commit_hash)
 
         max_change_size = kwargs.get('max_change_size', 20)
@@ -82,7 +87,6 @@ class AGSZZ(AbstractSZZ):
 
         log.info("staring blame")
         to_blame = True
-        start = ts()
         blame_data = list()
         commits_to_ignore = set()
         while to_blame:
@@ -97,7 +101,7 @@ class AGSZZ(AbstractSZZ):
 
             if len(new_commits_to_ignore) == 0:
                 to_blame = False
-            elif ts() - start > (60 * 60 * 1):  # 1 hour max time
+            elif self._is_budget_exceeded():
                 log.error(f"blame timeout for {self.repository_path}")
                 to_blame = False
 
@@ -36,6 +36,7 @@ class ASZZ(MASZZ):
         issue_date_filter = kwargs.get('issue_date_filter')
         use_rszz_heuristic = kwargs.get('use_rszz_heuristic', True)
         filter_revert_commits = kwargs.get('filter_revert_commits', False)
+        self.set_time_budget(kwargs.get('time_budget'))
 
         imp_files = self.get_impacted_files(fix_commit_hash, file_ext_to_parse, only_deleted_lines)
 
@@ -1,22 +1,39 @@
+import ast
+import hashlib
 import logging as log
 import re
+import threading
+from collections import OrderedDict
 from typing import List
 
 from szz.common.srcml_wrapper import SrcML
 
+PY_AST_CACHE_SIZE = 1024
+
 
 class CodeBlockParser:
 
+    # blob sha -> code blocks of the python file, shared by all the parser instances
+    __py_ast_cache = OrderedDict()
+    # SZZService runs several repos in threads, the lookups and evictions of the cache must not interleave
+    __py_ast_cache_lock = threading.Lock()
+
     def __init__(self):
         # No args constructor
         pass
 
     #todo: add js code block parser
     def parse(self, file_str: str, file_name: str, experimental: bool = False) -> List:
-        if experimental:
-            if file_name.endswith(".py"):
+        if file_name.endswith(".py"):
+            code_block_ranges = self._parse_code_blocks_py_ast(file_str)
+            if code_block_ranges is not None:
+                return code_block_ranges
+            if experimental:
                 return self._parse_code_blocks_py(file_str)
-            elif file_name.endswith(".php") or file_name.endswith(".phpt"):
+            return list()
+
+        if experimental:
+            if file_name.endswith(".php") or file_name.endswith(".phpt"):
                 return self._parse_code_blocks_php(file_str)
             elif file_name.endswith(".rb"):
                 return self._parse_code_blocks_rb(file_str)
@@ -40,9 +57,61 @@ class CodeBlockParser:
 
         return code_block_ranges
 
+    @staticmethod
+    def blob_sha(file_str: str) -> str:
+        """ SHA-1 of the file content, computed as git does for blobs """
+        data = file_str.encode('utf-8', 'surrogateescape')
+        return hashlib.sha1(b'blob %d\0' % len(data) + data).hexdigest()
+
+    def _parse_code_blocks_py_ast(self, file_str: str):
+        """
+        Extract the code blocks of a python file with the ast module, i.e. the line ranges of the bodies of compound
+        statements (def, class, if/elif/else, for, while, with, try/except/finally). Results are cached by blob sha.
+
+        return: list of CodeBlockRange, or None if the file can't be parsed (e.g., python 2 syntax)
+        """
+        cache = CodeBlockParser.__py_ast_cache
+        key = CodeBlockParser.blob_sha(file_str)
+        with CodeBlockParser.__py_ast_cache_lock:
+            code_block_ranges = cache.get(key)
+            if code_block_ranges is not None:
+                cache.move_to_end(key)
+                return code_block_ranges
+
+        try:
+            tree = ast.parse(file_str)
+        except (SyntaxError, ValueError) as e:
+            log.warning(f"Unable to parse python code blocks: {e}")
+            return None
+
+        code_block_ranges = list()
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Module):
+                continue
+            bodies = [getattr(node, field, None) for field in ('body', 'orelse', 'finalbody')]
+            for body in bodies:
+                if isinstance(body, list) and body and isinstance(body[0], ast.stmt):
+                    code_block_ranges.append(CodeBlockRange(start=body[0].lineno, end=CodeBlockParser._end_lineno(body[-1])))
+        code_block_ranges.sort(key=lambda cb: (cb.start, -cb.end))
+
+        with CodeBlockParser.__py_ast_cache_lock:
+            cache[key] = code_block_ranges
+            if len(cache) > PY_AST_CACHE_SIZE:
+                cache.popitem(last=False)
+
+        return code_block_ranges
+
+    @staticmethod
+    def _end_lineno(node: ast.AST) -> int:
+        """ Last line of the node, python < 3.8 has no end_lineno so the max lineno of the subtree is used """
+        end_lineno = getattr(node, 'end_lineno', None)
+        if end_lineno is not None:
+            return end_lineno
+        return max(getattr(n, 'lineno', 0) for n in ast.walk(node))
+
     def _parse_code_blocks_py(self, file_str: str):
         """
-        Experimental!
+        Experimental! Used only when the file can't be parsed with the ast module.
         """
         code_block_ranges = list()
 
@@ -117,4 +186,7 @@ class CodeBlockParser:
 class CodeBlockRange:
     def __init__(self, start: int, end: int):
         self.start = start
-        self.end = end
\ No newline at end of file
+        self.end = end
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}(start={self.start},end={self.end})'
\ No newline at end of file
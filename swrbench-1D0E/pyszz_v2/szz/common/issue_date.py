@@ -1,10 +1,15 @@
 import logging as log
-from typing import Dict
+import re
+from functools import lru_cache
+from typing import TYPE_CHECKING, Dict, Optional
 from typing import Set
 
-import dateparser as dp
 import datetime
-from git import Commit
+
+if TYPE_CHECKING:
+    from git import Commit
+
+ISO_DATE_RE = re.compile(r'^\d{4}-\d{2}-\d{2}([T ]\d{2}:\d{2}(:\d{2}(\.\d{3}(\d{3})?)?)?)?(Z|[+-]\d{2}:\d{2})?$')
 
 
 class IssueDateInfo():
@@ -17,6 +22,57 @@ class IssueDateInfo():
         return f"{self.__class__.__name__}(source_date={self.source},parsed_date={self.parsed},date_tag={self.date_tag}"
 
 
+def _parse_iso_date(source_date: str) -> Optional[datetime.datetime]:
+    """
+    Fast path for strict ISO-8601 dates (e.g., 2015-04-23T07:41:52, 2015-04-23T07:41:52Z, 2015-04-23T07:41:52-07:00).
+    Returns None if the date is not in this format.
+    """
+    if not ISO_DATE_RE.match(source_date):
+        return None
+
+    try:
+        parsed_date = datetime.datetime.fromisoformat(source_date.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+
+    if not parsed_date.tzinfo:
+        parsed_date = parsed_date.replace(tzinfo=datetime.timezone.utc)
+
+    return parsed_date
+
+
+@lru_cache(maxsize=None)
+def _parse_date(source_date: str) -> Optional[datetime.datetime]:
+    """
+    Parse a date string, assuming UTC if it is not timezone aware. ISO-8601 dates are parsed with
+    datetime.fromisoformat, the other formats with dateparser. Results are memoized.
+    Returns None if the date can't be parsed.
+    """
+    parsed_date = _parse_iso_date(source_date)
+    if parsed_date is not None:
+        return parsed_date
+
+    import dateparser as dp  # slow to import, loaded only when an issue date is not ISO-8601
+
+    try:
+        # 使用 dateparser 解析日期，但捕获可能发生的异常
+        parsed_date = dp.parse(source_date)
+        if not parsed_date.tzinfo:
+            parsed_date = dp.parse(source_date + ' UTC')
+    except AttributeError:
+        # 如果出现 ZoneInfo 对象的 localize 错误，使用替代方案
+        log.warning(f"dateparser failed to parse '{source_date}', using fallback parsing method")
+        try:
+            # 尝试简单格式
+            parsed_date = datetime.datetime.strptime(source_date, "%Y-%m-%dT%H:%M:%S")
+            # 添加 UTC 时区信息
+            parsed_date = parsed_date.replace(tzinfo=datetime.timezone.utc)
+        except ValueError:
+            parsed_date = None
+
+    return parsed_date
+
+
 def parse_issue_date(commit: Dict) -> 'IssueDateInfo':
     """
     Reads iso date from commit and returns a MyIssueDate.
@@ -35,35 +91,20 @@ def parse_issue_date(commit: Dict) -> 'IssueDateInfo':
     assert source_date is not None, f'No issue date found in commit {commit}'
     assert date_tag is not None, f'Invalid date tag for commit {commit}'
 
-    try:
-        # 使用 dateparser 解析日期，但捕获可能发生的异常
-        parsed_date = dp.parse(source_date)
-        if not parsed_date.tzinfo:
-            parsed_date = dp.parse(source_date + ' UTC')
-    except AttributeError:
-        # 如果出现 ZoneInfo 对象的 localize 错误，使用替代方案
-        log.warning(f"dateparser failed to parse '{source_date}', using fallback parsing method")
-        try:
-            # 尝试使用 datetime 标准库直接解析
-            parsed_date = datetime.datetime.fromisoformat(source_date.replace('Z', '+00:00'))
-        except ValueError:
-            # 如果仍然失败，尝试简单格式
-            try:
-                parsed_date = datetime.datetime.strptime(source_date, "%Y-%m-%dT%H:%M:%S")
-                # 添加 UTC 时区信息
-                parsed_date = parsed_date.replace(tzinfo=datetime.timezone.utc)
-            except ValueError:
-                # 最后的尝试，使用当前时间作为后备，但记录警告
-                log.error(f"Could not parse date: {source_date}")
-                parsed_date = datetime.datetime.now(datetime.timezone.utc)
+    parsed_date = _parse_date(source_date)
+    if parsed_date is None:
+        # 最后的尝试，使用当前时间作为后备，但记录警告
+        log.error(f"Could not parse date: {source_date}")
+        parsed_date = datetime.datetime.now(datetime.timezone.utc)
 
     return IssueDateInfo(source_date, parsed_date, date_tag)
 
 
-def filter_by_date(bic: Set[Commit], issue_date: 'IssueDateInfo') -> Set[Commit]:
+def filter_by_date(bic: Set['Commit'], issue_date: 'IssueDateInfo') -> Set['Commit']:
     """ Filter commits by authored_date using timestamp of issue date (UTC) """
 
-    bic_new = {commit for commit in bic if commit.authored_date < issue_date.parsed.timestamp()}
+    issue_timestamp = issue_date.parsed.timestamp()
+    bic_new = {commit for commit in bic if commit.authored_date < issue_timestamp}
     log.info(f'Filtering by issue date returned {len(bic_new)} out of {len(bic)}')
 
     return bic_new
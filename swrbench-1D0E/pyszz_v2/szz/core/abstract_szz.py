@@ -6,6 +6,7 @@ from enum import Enum
 from shutil import copytree
 from shutil import rmtree
 from tempfile import mkdtemp
+from time import time as ts
 from typing import List, Set
 
 from git import Commit, Repo
@@ -22,6 +23,8 @@ class AbstractSZZ(ABC):
     commands and PyDriller to parse commit modifications.
     """
 
+    DEFAULT_TIME_BUDGET = 60 * 60  # 1 hour max time for each fix commit
+
     def __init__(self, repo_full_name: str, repo_url: str, repos_dir: str = None):
         """
         Init an abstract SZZ to use as base class for SZZ implementations.
@@ -34,6 +37,8 @@ class AbstractSZZ(ABC):
         :param str repos_dir: temp folder where to clone the given repo
         """
         self._repository = None
+        self._deadline = None
+        self._timed_out = False
 
         os.makedirs(Options.TEMP_WORKING_DIR, exist_ok=True)
         self.__temp_dir = mkdtemp(dir=os.path.join(os.getcwd(), Options.TEMP_WORKING_DIR))
@@ -75,6 +80,42 @@ class AbstractSZZ(ABC):
         """
         return self._repository_path
 
+    @property
+    def timed_out(self) -> bool:
+        """
+         True if the time budget of the current fix commit has been exceeded, i.e. the last result contains only
+         the partial candidates found before the timeout.
+
+         :returns bool timed_out
+        """
+        return self._timed_out
+
+    def set_time_budget(self, seconds: float = None):
+        """
+         Start the time budget for the current fix commit. It must be called for each fix commit when an instance is
+         reused. The budget is checked cooperatively (e.g., between blamed lines), so the partial candidates found
+         before the timeout are returned.
+
+        :param float seconds: max time for the fix commit (default DEFAULT_TIME_BUDGET), 0 or negative to disable it
+        """
+        if seconds is None:
+            seconds = self.DEFAULT_TIME_BUDGET
+        self._deadline = ts() + seconds if seconds > 0 else float('inf')
+        self._timed_out = False
+
+    def _remaining_time(self) -> float:
+        """ Seconds left in the time budget of the current fix commit, the default budget is started if needed """
+        if self._deadline is None:
+            self.set_time_budget()
+        return max(self._deadline - ts(), 0)
+
+    def _is_budget_exceeded(self) -> bool:
+        """ Check the time budget of the current fix commit, the default budget is started if needed """
+        if not self._timed_out and self._remaining_time() <= 0:
+            log.error(f"time budget exceeded for {self.repository_path}")
+            self._timed_out = True
+        return self._timed_out
+
     @abstractmethod
     def find_bic(self, fix_commit_hash: str, impacted_files: List['ImpactedFile'], **kwargs) -> Set[Commit]:
         """
@@ -178,9 +219,16 @@ class AbstractSZZ(ABC):
             kwargs['C'] = [True, True, True]
 
         bug_introd_commits = set()
+        if self._is_budget_exceeded():
+            return bug_introd_commits
+
         mod_line_ranges = self._parse_line_ranges(modified_lines)
         log.info(f"processing file: {file_path}")
         for entry in self.repository.blame_incremental(**kwargs, rev=rev, L=mod_line_ranges, file=file_path):
+            if self._is_budget_exceeded():
+                log.error(f"blame of {file_path} stopped, returning partial results")
+                break
+
             # entry.linenos = input lines to blame (current lines)
             # entry.orig_lineno = output line numbers from blame (previous commit lines from blame)
             for line_num in entry.orig_linenos:
@@ -32,6 +32,7 @@ class DFSZZ(MASZZ):
         detect_move_within_file = kwargs.get('detect_move_within_file', None)
         use_rszz_heuristic = kwargs.get('use_rszz_heuristic', True)
         filter_revert_commits = kwargs.get('filter_revert_commits', False)
+        self.set_time_budget(kwargs.get('time_budget'))
 
         detect_move_from_other_files = kwargs.get('detect_move_from_other_files', None)
         if detect_move_from_other_files:
@@ -1,6 +1,5 @@
 import logging as log
 from typing import List, Set
-from time import time as ts
 from git import Commit
 from pydriller import RepositoryMining, ModificationType
 from szz.common.issue_date import filter_by_date
@@ -43,6 +42,9 @@ class MASZZ(AGSZZ):
         meta_changes = set()
         repo_mining = RepositoryMining(path_to_repo=self.repository_path, single=commit_hash).traverse_commits()
         for commit in repo_mining:
+            if self._is_budget_exceeded():
+                break
+
             # ignore revert commits
             if filter_revert and (commit.msg.startswith("Revert") or "This reverts commit" in commit.msg):
                 log.info(f'exclude meta-change (Revert commit): {current_file} {commit.hash}')
@@ -90,10 +92,14 @@ class MASZZ(AGSZZ):
             excluded (default 20)
         :key detect_move_from_other_files (DetectLineMoved): Detect lines moved or copied from other files that were
             modified in the same commit, from parent commits or from any commit (default DetectLineMoved.SAME_COMMIT)
+        :key time_budget (float): max time in seconds for the fix commit, used if set_time_budget() was not called
+            (default DEFAULT_TIME_BUDGET). When exceeded, the partial candidates are returned and timed_out is set
         :returns Set[Commit] a set of bug introducing commits candidates, represented by Commit object
         """
 
         log.info(f"find_bic() kwargs: {kwargs}")
+        if self._deadline is None:
+            self.set_time_budget(kwargs.get('time_budget'))
         self._set_working_tree_to_commit(fix_commit_hash)
 
         max_change_size = kwargs.get('max_change_size', MASZZ.DEFAULT_MAX_CHANGE_SIZE)
@@ -108,12 +114,14 @@ class MASZZ(AGSZZ):
             params['rev_pointer'] = kwargs['blame_rev_pointer']
 
         log.info("staring blame")
-        start = ts()
         blame_data = list()
         commits_to_ignore = set()
         commits_to_ignore_current_file = set()
         bic = set()
         for imp_file in impacted_files:
+            if self._is_budget_exceeded():
+                log.error(f"skip file {imp_file.file_path}, returning partial results")
+                break
             commits_to_ignore_current_file = commits_to_ignore.copy()
 
             to_blame = True
@@ -132,7 +140,7 @@ class MASZZ(AGSZZ):
 
                 if len(new_commits_to_ignore) == 0 and len(new_commits_to_ignore_current_file) == 0:
                     to_blame = False
-                elif ts() - start > (60 * 60 * 1):  # 1 hour max time
+                elif self._is_budget_exceeded():
                     log.error(f"blame timeout for {self.repository_path}")
                     to_blame = False
 
@@ -1,6 +1,7 @@
 import json
 import logging as log
 import os
+import subprocess
 import tempfile
 from typing import List, Set
 
@@ -31,9 +32,21 @@ class RASZZ(MASZZ):
         refactorings = dict()
         for commit in commits:
             if not commit in refactorings:
+                if self._is_budget_exceeded():
+                    log.error(f'skip RefMiner on {commit}, time budget exceeded')
+                    continue
+
                 with tempfile.NamedTemporaryFile(mode='r+') as tmpfile:
                     log.info(f'Running RefMiner on {commit}')
-                    os.system(f'"{PATH_TO_REFMINER}" -c "{self._repository_path}" {commit} > {tmpfile.name}')
+                    remaining_time = self._remaining_time()
+                    try:
+                        subprocess.run([PATH_TO_REFMINER, '-c', self._repository_path, commit], stdout=tmpfile,
+                                       timeout=remaining_time if remaining_time != float('inf') else None)
+                    except subprocess.TimeoutExpired:
+                        log.error(f'RefMiner timeout on {commit}')
+                        self._is_budget_exceeded()
+                        continue
+                    tmpfile.seek(0)
                     refactorings[commit] = json.loads(tmpfile.read())
 
         return refactorings
@@ -0,0 +1,81 @@
+import importlib
+import logging as log
+from functools import lru_cache
+from typing import TYPE_CHECKING, Dict, Set
+
+if TYPE_CHECKING:
+    from git import Commit
+    from szz.core.abstract_szz import AbstractSZZ
+
+# szz_name -> (module, class) of the SZZ implementation. Modules are imported only when the variant is used, so that
+# the heavy dependencies of the other variants (e.g., networkx and BeautifulSoup for DU-SZZ) are never loaded.
+SZZ_VARIANTS = {
+    'b': ('szz.b_szz', 'BaseSZZ'),
+    'ag': ('szz.ag_szz', 'AGSZZ'),
+    'ma': ('szz.ma_szz', 'MASZZ'),
+    'r': ('szz.r_szz', 'RSZZ'),
+    'l': ('szz.l_szz', 'LSZZ'),
+    'ra': ('szz.ra_szz', 'RASZZ'),
+    'pd': ('szz.pd_szz', 'PyDrillerSZZ'),
+    'a': ('szz.aszz.a_szz', 'ASZZ'),
+    'df': ('szz.dfszz.df_szz', 'DFSZZ'),
+}
+
+
+@lru_cache(maxsize=None)
+def get_szz_class(szz_name: str) -> type:
+    """
+    Import and return the SZZ implementation identified by szz_name.
+
+    :param str szz_name: the szz_name of the configuration file
+    :returns type the AbstractSZZ subclass
+    """
+    if szz_name not in SZZ_VARIANTS:
+        raise ValueError(f'SZZ implementation not found: {szz_name}')
+
+    module_name, class_name = SZZ_VARIANTS[szz_name]
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def create_szz(szz_name: str, repo_full_name: str, repo_url: str, repos_dir: str = None) -> 'AbstractSZZ':
+    """
+    Init the SZZ implementation identified by szz_name.
+
+    :param str szz_name: the szz_name of the configuration file
+    :param str repo_full_name: full name of the Git repository
+    :param str repo_url: url of the Git repository to clone
+    :param str repos_dir: folder containing the local repositories
+    :returns AbstractSZZ
+    """
+    return get_szz_class(szz_name)(repo_full_name=repo_full_name, repo_url=repo_url, repos_dir=repos_dir)
+
+
+def run_szz(szz: 'AbstractSZZ', szz_name: str, fix_commit: str, conf: Dict, issue_date=None) -> Set['Commit']:
+    """
+    Run the given SZZ implementation on a single fix commit, with the params of the configuration file.
+
+    :param AbstractSZZ szz: instance created with create_szz() for the same szz_name
+    :param str szz_name: the szz_name of the configuration file
+    :param str fix_commit: hash of the fix commit
+    :param Dict conf: parsed configuration file
+    :param IssueDateInfo issue_date: issue date of the fix commit, used when issue_date_filter is enabled
+    :returns Set[Commit] a set of bug introducing commits candidates, szz.timed_out is set if they are partial
+    """
+    szz.set_time_budget(conf.get('time_budget'))
+    if szz_name in ('a', 'df'):
+        return szz.start(fix_commit_hash=fix_commit, commit_issue_date=issue_date, **conf)
+
+    imp_files = szz.get_impacted_files(fix_commit_hash=fix_commit, file_ext_to_parse=conf.get('file_ext_to_parse'), only_deleted_lines=True)
+
+    params = dict()
+    params['issue_date_filter'] = conf.get('issue_date_filter')
+    params['issue_date'] = issue_date
+    if szz_name in ('ag', 'ma', 'r', 'l', 'ra'):
+        params['max_change_size'] = conf.get('max_change_size')
+    if szz_name in ('ma', 'r', 'l', 'ra'):
+        from szz.core.abstract_szz import DetectLineMoved
+        params['detect_move_from_other_files'] = DetectLineMoved(conf.get('detect_move_from_other_files'))
+        params['filter_revert_commits'] = conf.get('filter_revert_commits', False)
+
+    log.info(f'running {szz_name}-szz on {fix_commit}')
+    return szz.find_bic(fix_commit_hash=fix_commit, impacted_files=imp_files, **params)
@@ -1,7 +1,12 @@
+import json
+import os
+import shutil
 import subprocess
-from typing import List
+from typing import Dict, List
 
-from packaging.version import parse
+REQUIREMENTS_CACHE_FILE = os.path.join(os.path.expanduser('~'), '.cache', 'pyszz', 'requirements.json')
+
+_requirements_checked = False
 
 
 def run_cmd(cmd: List[str]):
@@ -15,12 +20,52 @@ def run_cmd(cmd: List[str]):
     return stdout.decode('utf-8')
 
 
+def _tools_fingerprint() -> Dict:
+    """ Path and mtime of the external tools, the cached check is valid until one of them changes """
+    fingerprint = dict()
+    for tool in ['git', 'srcml']:
+        tool_path = shutil.which(tool)
+        fingerprint[tool] = [tool_path, os.path.getmtime(tool_path) if tool_path else None]
+
+    return fingerprint
+
+
+def _load_cached_fingerprint() -> Dict:
+    try:
+        with open(REQUIREMENTS_CACHE_FILE, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _save_cached_fingerprint(fingerprint: Dict):
+    try:
+        os.makedirs(os.path.dirname(REQUIREMENTS_CACHE_FILE), exist_ok=True)
+        with open(REQUIREMENTS_CACHE_FILE, 'w') as f:
+            json.dump(fingerprint, f)
+    except OSError:
+        pass
+
+
 def check_requirements():
     """
     * git >= 2.23
 
     * srcML (https://www.srcml.org/) (i.e., the srcml command should be in the system path)
+
+    The checks run the external binaries only once: a successful check is cached in memory and in
+    REQUIREMENTS_CACHE_FILE, together with the path and mtime of the binaries.
     """
+    global _requirements_checked
+    if _requirements_checked:
+        return
+
+    fingerprint = _tools_fingerprint()
+    if _load_cached_fingerprint() == fingerprint:
+        _requirements_checked = True
+        return
+
+    from packaging.version import parse
 
     # check git client
     required_git_version = "2.23.0"
@@ -36,4 +81,7 @@ def check_requirements():
     try:
         run_cmd(['srcml', '--version'])
     except:
-        raise Exception(f"srcML tool is required, and the 'srcml' command should be in the system path. Please, fix")
\ No newline at end of file
+        raise Exception(f"srcML tool is required, and the 'srcml' command should be in the system path. Please, fix")
+
+    _save_cached_fingerprint(fingerprint)
+    _requirements_checked = True
@@ -0,0 +1,47 @@
+# include project root in sys path
+import sys
+import os
+# insert at 1, 0 is the script path (or '' in REPL)
+sys.path.insert(1, os.path.abspath("../../"))
+
+import subprocess
+import tempfile
+
+from benchmark import SyntheticRepo, SyntheticRepoParams
+
+
+def git(repo_path, *args):
+    return subprocess.run(['git', *args], cwd=repo_path, stdout=subprocess.PIPE, check=True).stdout.decode('utf-8')
+
+
+""" test synthetic history shape """
+tmp_dir = tempfile.mkdtemp()
+params = SyntheticRepoParams(depth=30, files=4, rename_density=0.3, mode_change_density=0.3, revert_density=0.0, fix_size=3, seed=1)
+repo = SyntheticRepo(os.path.join(tmp_dir, 'repo'), params)
+fix_commit = repo.generate()
+
+# initial commit + history + fix commit
+assert int(git(repo.path, 'rev-list', '--count', 'HEAD')) == params.depth + 2
+assert git(repo.path, 'log', '-1', '--format=%s').strip() == 'Fix bug'
+assert len(git(repo.path, 'ls-files').splitlines()) == params.files
+
+summary = git(repo.path, 'log', '--summary', '-M')
+assert 'rename' in summary
+assert 'mode change' in summary
+
+fix_stat = git(repo.path, 'show', '--numstat', '--format=', fix_commit).splitlines()
+assert sum(int(line.split()[1]) for line in fix_stat) == params.fix_size
+
+
+""" test reproducibility """
+repo_same = SyntheticRepo(os.path.join(tmp_dir, 'repo_same'), params)
+assert repo_same.generate() == fix_commit
+
+
+""" test reverts """
+params_revert = SyntheticRepoParams(depth=30, files=4, revert_density=1.0, seed=1)
+repo_revert = SyntheticRepo(os.path.join(tmp_dir, 'repo_revert'), params_revert)
+repo_revert.generate()
+assert int(git(repo_revert.path, 'rev-list', '--count', 'HEAD')) == 2 * params_revert.depth + 2
+
+print("+++ Test passed +++")
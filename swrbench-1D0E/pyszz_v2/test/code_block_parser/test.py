@@ -0,0 +1,28 @@
+import os
+
+
+class Parser:
+    """ docstring """
+
+    def parse(self, lines):
+        result = []
+        for line in lines:
+            if line.startswith('#'):
+                continue
+            elif not line:
+                result.append(None)
+            else:
+                result.append(
+                    line.strip()
+                )
+        return result
+
+
+def read(path):
+    try:
+        with open(path) as f:
+            return f.read()
+    except OSError:
+        return None
+    finally:
+        print(path)
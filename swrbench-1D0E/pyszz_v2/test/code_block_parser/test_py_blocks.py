@@ -0,0 +1,49 @@
+# include project root in sys path
+import sys
+import os
+# insert at 1, 0 is the script path (or '' in REPL)
+sys.path.insert(1, os.path.abspath("../../"))
+
+from szz.aszz.code_block_parser import CodeBlockParser
+
+
+""" test python code block parser """
+source_file_name = 'test.py'
+
+with open(source_file_name) as f:
+    source_file_content = f.read()
+
+for i, l in enumerate(source_file_content.split("\n")):
+    print(i + 1, l)
+
+code_blocks = CodeBlockParser().parse(source_file_content, source_file_name)
+
+# code block [start, end]
+blocks = [[5, 18], [8, 18], [10, 17], [11, 11], [12, 17], [13, 13], [15, 17], [22, 28], [23, 24], [24, 24], [26, 26], [28, 28]]
+
+print(code_blocks)
+assert len(blocks) == len(code_blocks)
+for code_block, oracle in zip(code_blocks, blocks):
+    assert code_block.start == oracle[0] and code_block.end == oracle[1]
+
+
+""" test cache by blob sha """
+assert CodeBlockParser().parse(source_file_content, 'other.py') is code_blocks
+assert CodeBlockParser.blob_sha('hello\n') == 'ce013625030ba8dba906f756967f9e9ca394464a'  # git hash-object
+
+
+""" test invalid python syntax """
+assert CodeBlockParser().parse('print "python 2"\n', source_file_name) == []
+
+""" test concurrent parsing with evictions """
+from concurrent.futures import ThreadPoolExecutor
+from szz.aszz import code_block_parser
+
+code_block_parser.PY_AST_CACHE_SIZE = 8
+sources = [f"def f{i}():\n    return {i}\n" for i in range(64)]
+with ThreadPoolExecutor(max_workers=16) as executor:
+    parsed = list(executor.map(lambda source: CodeBlockParser().parse(source, 'thread.py'), sources * 20))
+assert all(len(blocks) == 1 and (blocks[0].start, blocks[0].end) == (2, 2) for blocks in parsed)
+
+
+print("+++ Test passed +++")
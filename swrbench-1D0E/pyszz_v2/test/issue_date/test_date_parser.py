@@ -4,7 +4,7 @@ import os
 # insert at 1, 0 is the script path (or '' in REPL)
 sys.path.insert(1, os.path.abspath("../../"))
 
-from szz.common.issue_date import parse_issue_date, filter_by_date
+from szz.common.issue_date import parse_issue_date, filter_by_date, _parse_date
 import pickle
 
 
@@ -35,6 +35,18 @@ bugfix_commits = [
             "rb"
         ],
         "inducing_commit_hash": []
+    },     {
+        "id": 4,
+        "repo_name": "ahobson/ruby-pcap",
+        "fix_commit_hash": "0ad41d0684c2ec4c2a6b604f7aafbaf9f0459dcc",
+        "bug_commit_hash": [
+            "272f03ff3b5bf79829f80c2febd004904d64006e"
+        ],
+        "earliest_issue_date": "2011-06-01T04:05:04Z",
+        "language": [
+            "rb"
+        ],
+        "inducing_commit_hash": []
     }
 ]
 
@@ -48,4 +60,11 @@ for bc in bugfix_commits:
 
     bic_new = filter_by_date(bic, issue_date)
     print(bic_new)
-    assert bic_new == bic
\ No newline at end of file
+    assert bic_new == bic
+
+
+""" Test memoization of parsed dates """
+cache_hits = _parse_date.cache_info().hits
+for bc in bugfix_commits:
+    assert parse_issue_date(bc).parsed.timestamp() == 1306901104.0
+assert _parse_date.cache_info().hits == cache_hits + len(bugfix_commits)
@@ -0,0 +1,294 @@
+import json
+import random
+import asyncio
+import logging
+from collections import OrderedDict
+
+import httpx
+from tqdm import tqdm
+
+from utils import build_pr_timeline
+from github_graphql import GITHUB_REST_URL, UnknownObjectException, actor_login, utc_isoformat
+
+
+PER_PAGE = 100
+# concurrent PRs fetched with the same token
+PER_TOKEN_CONCURRENCY = 4
+MAX_ATTEMPTS = 8
+# rough number of REST calls made for a PR, reserved on the token until its real quota is known
+PR_REST_COST = 10
+
+
+class AsyncJsonlWriter:
+    """
+    Append rows to a JSONL file from many coroutines. Rows are queued and written by a single task, in batches,
+    so the event loop never blocks on the file and the lines are never interleaved.
+    """
+
+    def __init__(self, path, write_rows=None):
+        """
+        :param write_rows: callable storing a batch of rows (run in a thread), instead of appending them to path
+        """
+        self.path = path
+        self.write_rows = write_rows or self._write_lines
+        self.queue = asyncio.Queue()
+        self.task = None
+
+    async def __aenter__(self):
+        self.task = asyncio.create_task(self._run())
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.queue.put(None)
+        await self.task
+
+    async def write(self, row):
+        await self.queue.put(row)
+
+    def _write_lines(self, rows):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False, default=str) + '\n')
+
+    async def _run(self):
+        done = False
+        while not done:
+            rows = [await self.queue.get()]
+            while not self.queue.empty():
+                rows.append(self.queue.get_nowait())
+            if rows[-1] is None:
+                done = True
+            rows = [row for row in rows if row is not None]
+            if rows:
+                await asyncio.to_thread(self.write_rows, rows)
+
+
+class AsyncRepoHandle:
+    """ REST client of a repository bound to a token, the requests made with it are limited to `concurrency` PRs at a time """
+
+    def __init__(self, client, token, repo_name, token_pool=None, concurrency=PER_TOKEN_CONCURRENCY, http_cache=None,
+                 local_diffs=None):
+        self.client = client
+        self.local_diffs = local_diffs
+        self.http_cache = http_cache
+        self.token = token
+        self.repo_name = repo_name
+        self.token_pool = token_pool
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.headers = {'Authorization': f'Bearer {token}', 'Accept': 'application/vnd.github+json'}
+
+    async def get(self, url, params=None):
+        for attempt in range(MAX_ATTEMPTS):
+            try:
+                if self.http_cache:
+                    response = await self.http_cache.aget(self.client, url, params=params, headers=self.headers)
+                else:
+                    response = await self.client.get(url, params=params, headers=self.headers)
+            except httpx.TransportError:
+                if attempt == MAX_ATTEMPTS - 1:
+                    raise
+                await asyncio.sleep(min(2 ** attempt, 60) * random.uniform(0.5, 1.5))
+                continue
+
+            if self.token_pool:
+                self.token_pool.update_from_headers(self.token, response.headers)
+            if response.status_code == 404:
+                raise UnknownObjectException(f"404 {response.text}")
+            retryable = response.status_code in (429, 500, 502, 503, 504) or (
+                response.status_code == 403 and (response.headers.get('retry-after') or response.headers.get('x-ratelimit-remaining') == '0'))
+            if retryable and attempt < MAX_ATTEMPTS - 1:
+                wait = float(response.headers.get('retry-after') or min(2 ** attempt, 60) * random.uniform(0.5, 1.5))
+                await asyncio.sleep(wait)
+                continue
+            response.raise_for_status()
+            return response
+
+    async def get_json(self, path):
+        response = await self.get(f'{GITHUB_REST_URL}/repos/{self.repo_name}/{path}')
+        return response.json()
+
+    async def get_paginated(self, path):
+        items = []
+        url, params = f'{GITHUB_REST_URL}/repos/{self.repo_name}/{path}', {'per_page': PER_PAGE}
+        while url:
+            response = await self.get(url, params=params)
+            items.extend(response.json())
+            url, params = response.links.get('next', {}).get('url'), None
+        return items
+
+    async def get_pr_info(self, pr_id):
+        """ Same pr_info dict built by collect_repo_pr.get_pr_info(), from the REST API """
+        pr = await self.get_json(f'pulls/{pr_id}')
+        events, commits, comments, review_comments, reviews = await asyncio.gather(
+            self.get_paginated(f'issues/{pr_id}/events'),
+            self.get_paginated(f'pulls/{pr_id}/commits'),
+            self.get_paginated(f'issues/{pr_id}/comments'),
+            self.get_paginated(f'pulls/{pr_id}/comments'),
+            self.get_paginated(f'pulls/{pr_id}/reviews'),
+        )
+        commit_diffs = None
+        if self.local_diffs:
+            commit_diffs = await asyncio.to_thread(self.local_diffs.pr_diffs, pr_id, [commit['sha'] for commit in commits])
+        if commit_diffs is None:
+            commit_files = await asyncio.gather(*[self.get_json(f"commits/{commit['sha']}") for commit in commits])
+            commit_diffs = {commit['sha']: [{'file': f['filename'], 'patch': f['patch']} for f in files.get('files', []) if f.get('patch')]
+                            for commit, files in zip(commits, commit_files)}
+
+        created_at = utc_isoformat(pr['created_at'])
+        user = actor_login(pr['user'])
+        pr_info = {
+            'repo': pr['head']['repo']['full_name'] if pr['head']['repo'] else None,
+            'number': pr['number'],
+            'title': pr['title'],
+            'user': user,
+            'url': pr['html_url'],
+            'commits': pr['commits'],
+            'merge_commit_sha': pr['merge_commit_sha'],
+            'merged': pr['merged'],
+            'created_at': created_at,
+            'merged_at': utc_isoformat(pr['merged_at']),
+            'state': pr['state'],
+            'labels': [label['name'] for label in pr['labels']],
+            'issue_events': [event['event'] for event in events],
+            'base_commit': pr['base']['sha'],
+            'timeline': []
+        }
+
+        timeline_dict = OrderedDict()
+
+        if pr['body']:
+            key = f"description_{created_at}"
+            timeline_dict[key] = {
+                'type': 'description',
+                'user': user,
+                'body': pr['body'],
+                'created_at': created_at
+            }
+
+        for commit in commits:
+            key = f"commit_{commit['sha']}"
+            diff = commit_diffs[commit['sha']]
+            timeline_dict[key] = {
+                'type': 'commit',
+                'sha': commit['sha'],
+                'message': commit['commit']['message'],
+                'author': commit['commit']['author']['name'],
+                'author_email': commit['commit']['author']['email'],
+                'author_raw_date': utc_isoformat(commit['commit']['author']['date']),
+                'author_date': utc_isoformat(commit['commit']['author']['date']),
+                'committer': commit['commit']['committer']['name'],
+                'committer_email': commit['commit']['committer']['email'],
+                'raw_date': utc_isoformat(commit['commit']['committer']['date']),
+                'date': utc_isoformat(commit['commit']['committer']['date']),
+                'diff_text': "\n".join([f"{d['file']}\n{d['patch']}" for d in diff]),
+                'diff': diff
+            }
+
+        for comment in comments:
+            key = f"comment_{comment['id']}"
+            timeline_dict[key] = {
+                'type': 'comment',
+                'id': comment['id'],
+                'user': actor_login(comment['user']),
+                'body': comment['body'],
+                'created_at': utc_isoformat(comment['created_at'])
+            }
+
+        review_comments_dict = {}
+        for comment in review_comments:
+            comment_dict = {
+                'type': 'review_comment',
+                'id': comment['id'],
+                'in_reply_to_id': comment.get('in_reply_to_id'),
+                'user': actor_login(comment['user']),
+                'body': comment['body'],
+                'created_at': utc_isoformat(comment['created_at']),
+                'path': comment.get('path'),
+                'diff_hunk': comment.get('diff_hunk'),
+                'start_line': comment.get('start_line'),
+                'original_start_line': comment.get('original_start_line'),
+                'start_side': comment.get('start_side'),
+                'line': comment.get('line'),
+                'original_line': comment.get('original_line'),
+                'side': comment.get('side'),
+                'original_position': comment.get('original_position'),
+                'position': comment.get('position'),
+                'subject_type': comment.get('subject_type'),
+                'reply': []
+            }
+            comment_dict['reply'].append({
+                'id': comment_dict['id'],
+                'user': comment_dict['user'],
+                'body': comment_dict['body'],
+                'created_at': comment_dict['created_at']
+            })
+            review_comments_dict[comment['id']] = comment_dict
+
+        for review in reviews:
+            key = f"review_{review['id']}"
+            timeline_dict[key] = {
+                'type': 'review',
+                'id': review['id'],
+                'user': actor_login(review['user']),
+                'body': review['body'],
+                'state': review['state'],
+                'created_at': utc_isoformat(review.get('submitted_at'))
+            }
+
+        pr_info['timeline'] = build_pr_timeline(timeline_dict, review_comments_dict)
+        return pr_info
+
+
+async def crawl_prs(repo_name, pr_ids, jsonl_file, tokens, token_pool=None, http_cache=None, local_diffs=None,
+                    write_rows=None, per_token_concurrency=PER_TOKEN_CONCURRENCY, max_connections=100):
+    """
+    Fetch the given PRs concurrently and append them to jsonl_file, with the same rows written by
+    collect_repo_pr.get_all_prs(): the pr_info dict, or {number, ERROR, ERROR_INFO} when the PR fails.
+    All the requests share a pooled HTTP client; each token has its own repo handle and runs at most
+    per_token_concurrency PRs at a time.
+
+    :param token_pool: TokenPool choosing the token of each PR, round robin on the tokens if None
+    :param http_cache: HTTPCache replaying/revalidating the GET responses
+    :param local_diffs: LocalDiffFetcher computing the commit diffs from the local clone
+    :param write_rows: callable storing a batch of rows (e.g., PRStore.put_many), instead of appending them to jsonl_file
+    """
+    limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+    async with httpx.AsyncClient(timeout=300, limits=limits) as client, AsyncJsonlWriter(jsonl_file, write_rows) as writer:
+        handles = {token: AsyncRepoHandle(client, token, repo_name, token_pool, per_token_concurrency, http_cache, local_diffs) for token in tokens}
+        progress = tqdm(total=len(pr_ids), desc="PRs")
+
+        async def fetch(index, pr_id):
+            if token_pool:
+                token = await asyncio.to_thread(token_pool.acquire, 'core', PR_REST_COST)
+            else:
+                token = tokens[index % len(tokens)]
+            handle = handles[token]
+            try:
+                async with handle.semaphore:
+                    pr_info = await handle.get_pr_info(pr_id)
+                await writer.write(pr_info)
+            except Exception as e:
+                logging.warning(f"Failed to fetch PR {repo_name}#{pr_id}: {e}")
+                await writer.write({"number": pr_id, "ERROR": True, "ERROR_INFO": f"{e.__class__.__name__}: {str(e)}"})
+            finally:
+                if token_pool:
+                    token_pool.release(token, 'core', PR_REST_COST)
+                progress.update(1)
+
+        # bound the pending tasks, so that the PR ids are scheduled as the tokens free up
+        queue = asyncio.Queue(maxsize=len(tokens) * per_token_concurrency)
+
+        async def consumer():
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                await fetch(*item)
+
+        consumers = [asyncio.create_task(consumer()) for _ in range(len(tokens) * per_token_concurrency)]
+        for item in enumerate(pr_ids):
+            await queue.put(item)
+        for _ in consumers:
+            await queue.put(None)
+        await asyncio.gather(*consumers)
+        progress.close()
@@ -10,7 +10,8 @@ import threading
 from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 
-from utils import run_chat, safe_parse_time, retry_function, save_jsonl, load_jsonl, save_json, load_json
+from utils import run_chat, safe_parse_time, retry_function, save_jsonl, load_jsonl, save_json, load_json, iter_jsonl
+from llm_metrics import llm_context
 
 
 CHAT_MODEL = 'gemini-2.5-flash-preview-04-17'
@@ -20,13 +21,16 @@ CHAT_MODEL = 'gemini-2.5-flash-preview-04-17'
 PARSER_MODEL = 'gemini-2.5-flash-preview-04-17'
 OPENAI_TEMPERATURE = 0.7
 
-def get_fix_commits(repo_name):
+def get_fix_commits(repo_name, pr_store=None):
     pr_jsonl_file = f'data/prs_raw/{repo_name.replace("/", "__")}__prs.jsonl'
-    if not os.path.exists(pr_jsonl_file):
+    if pr_store is not None:
+        prs = pr_store.iter_prs(repo_name, errors=False)
+    elif not os.path.exists(pr_jsonl_file):
         print(f"{repo_name} has no PR information")
         return
-    prs = load_jsonl(pr_jsonl_file)
-    prs = [pr for pr in prs if not pr.get('ERROR', False)]
+    else:
+        prs = load_jsonl(pr_jsonl_file)
+        prs = [pr for pr in prs if not pr.get('ERROR', False)]
     fix_prs = []
     for pr in prs:
         pr_title = pr['title']
@@ -52,7 +56,53 @@ def get_fix_commits(repo_name):
         json.dump(fix_commits, f, indent=4)
 
 
-def filter_prs(repo_name, prs, max_commits=100, pr_ids_range=None):
+def iter_filtered_prs(prs, filter_count, max_commits=100, pr_ids_range=None):
+    """
+    Streaming version of filter_prs: prs can be any iterable (e.g., iter_jsonl or PRStore.iter_prs), the PRs that
+    pass all the filters are yielded one at a time and the reason of each filtered PR is counted in filter_count
+    (the first failing filter, in the same order as filter_prs). The timeline of each PR is scanned once.
+    """
+    def count(reason):
+        filter_count[reason] = filter_count.get(reason, 0) + 1
+
+    for pr in prs:
+        if pr.get('ERROR', False):  # 跳过失败的PR
+            count('ERROR')
+            continue
+        #不在指定的pr 的 id范围内
+        if pr_ids_range is not None and (pr['number'] < pr_ids_range[0] or pr['number'] > pr_ids_range[1]):
+            count('pr_ids_range')
+            continue
+
+        comments = 0
+        has_description = False
+        has_empty_commit = False
+        for item in pr['timeline']:
+            if 'comment' in item['type']:
+                comments += 1
+            elif item['type'] == 'description':
+                has_description = True
+            elif item['type'] == 'commit' and len(item['diff']) == 0:
+                has_empty_commit = True
+
+        if comments < 2:
+            count('comments')
+        elif 'head_ref_force_pushed' in pr['issue_events']:
+            count('head_ref_force_pushed')
+        elif not has_description:
+            count('pr_description_filter')
+        elif has_empty_commit:
+            count('empty_commit_filter')
+        #不在指定的commit的范围内
+        elif pr['commits'] <= 1:
+            count('commits_1')
+        elif pr['commits'] > max_commits:
+            count('commits_gt_max')
+        else:
+            yield pr
+
+
+def filter_prs(repo_name, prs, max_commits=100, pr_ids_range=None, filter_count=None):
     # target_results_paath = '/SWRBench/data/verified_results_label_0412.jsonl'
     # target_results = load_jsonl(target_results_paath)
     # target_pr_ids = [repo_name + '_' + str(pr['pr_number']) for pr in target_results]
@@ -67,50 +117,9 @@ def filter_prs(repo_name, prs, max_commits=100, pr_ids_range=None):
     #     'astropy/astropy_11664', 'astropy/astropy_11860', 'astropy/astropy_11943', 
     # ]
     
-    filtered_prs = []
-    filter_count = {}
-    for pr in prs:
-        if pr.get('ERROR', False):  # 跳过失败的PR
-            filter_count['ERROR'] = filter_count.get('ERROR', 0) + 1
-            continue
-        #没有合并
-        # if not pr.is_merged:
-        #     continue
-        #不在指定的pr 的 id范围内
-        if pr_ids_range is not None and (pr['number'] < pr_ids_range[0] or pr['number'] > pr_ids_range[1]):
-            filter_count['pr_ids_range'] = filter_count.get('pr_ids_range', 0) + 1
-            continue
-        # 获取PR信息
-        comments = [c for c in pr['timeline'] if 'comment' in c['type']]
-        if len(comments) < 2:
-            filter_count['comments'] = filter_count.get('comments', 0) + 1
-            continue
-        if 'head_ref_force_pushed' in pr['issue_events']:
-            filter_count['head_ref_force_pushed'] = filter_count.get('head_ref_force_pushed', 0) + 1
-            continue
-        
-        pr_description = [e for e in pr['timeline'] if e['type'] == 'description']
-        if len(pr_description) == 0:
-            filter_count['pr_description_filter'] = filter_count.get('pr_description_filter', 0) + 1
-            continue
-        
-        empty_commits = [e for e in pr['timeline'] if e['type'] == 'commit' and len(e['diff']) == 0]
-        if len(empty_commits) > 0:
-            filter_count['empty_commit_filter'] = filter_count.get('empty_commit_filter', 0) + 1
-            continue
-        
-        #不在指定的commit的范围内
-        if pr['commits'] <= 1:
-            filter_count['commits_1'] = filter_count.get('commits_1', 0) + 1
-            continue
-        if pr['commits'] > max_commits:
-            filter_count['commits_gt_max'] = filter_count.get('commits_gt_max', 0) + 1
-            continue
-        # if repo_name + '_' + str(pr['number']) not in target_pr_ids:
-        #     filter_count['target_pr_ids'] = filter_count.get('target_pr_ids', 0) + 1
-        #     continue
-        
-        filtered_prs.append(pr)
+    # filter_count: dict receiving the number of PRs dropped by each filter, for the callers that report it
+    filter_count = {} if filter_count is None else filter_count
+    filtered_prs = list(iter_filtered_prs(prs, filter_count, max_commits=max_commits, pr_ids_range=pr_ids_range))
     
     print(f"过滤统计: {filter_count}")
     return filtered_prs
@@ -515,7 +524,9 @@ def process_pr(pr_info):
         
         try:
             logging.info(f"PR #{pr_info['number']}: 发送初始提问到 { CHAT_MODEL } 模型")
-            parsed = change_analysis(init_prompt, response_format)
+            instance_id = f"{pr_info['repo'].replace('/', '__')}-{pr_info['number']}"
+            with llm_context(stage="collection", instance_id=instance_id):
+                parsed = change_analysis(init_prompt, response_format)
             result['init_answer'] = parsed            
             if parsed is None:
                 logging.error(f"PR #{pr_info['number']}: 解析初始回答失败")
@@ -540,7 +551,7 @@ def is_valid_sha(sha):
     # 检查是否为有效的 SHA-1 值（40个十六进制字符）
     return isinstance(sha, str) and len(sha) == 40 and all(c in '0123456789abcdefABCDEF' for c in sha)
 
-def collect_repo_prs(repo_name, result_path):
+def collect_repo_prs(repo_name, result_path, pr_store=None):
     # 设置日志
     logging.basicConfig(
         level=logging.INFO, 
@@ -554,10 +565,16 @@ def collect_repo_prs(repo_name, result_path):
     logging.info(f"启动分析流程，仓库: {repo_name}，路径: {result_path}")
 
     # Get PRs, using cache if available
-    prs = load_jsonl(f'data_train/prs_raw/{repo_name.replace("/", "__")}__prs.jsonl')
+    # the raw PRs are streamed, only the ones passing the filters are kept in memory
+    if pr_store is not None:
+        prs = pr_store.iter_prs(repo_name)
+    else:
+        prs = iter_jsonl(f'data_train/prs_raw/{repo_name.replace("/", "__")}__prs.jsonl')
     # pr_ids_range = (5000, 15000)
     pr_ids_range = None
-    filtered_prs = filter_prs(repo_name, prs, max_commits=10, pr_ids_range=pr_ids_range)
+    filter_count = {}
+    filtered_prs = filter_prs(repo_name, prs, max_commits=10, pr_ids_range=pr_ids_range, filter_count=filter_count)
+    prs_count = len(filtered_prs) + sum(filter_count.values())
     results = []
     error_count = 0
     fixed_error_prs = []
@@ -608,7 +625,7 @@ def collect_repo_prs(repo_name, result_path):
                     fixed_error_prs.append(result['pr_number'])
     
     logging.info(f"分析完成，结果已保存到 analysis_results.jsonl")
-    logging.info(f"总共处理 {len(prs)} 个PR")
+    logging.info(f"总共处理 {prs_count} 个PR")
     logging.info(f"其中需要分析{len(filtered_prs)}个PR")
     logging.info(f"成功处理 {len(results)} 个PR")
     logging.info(f"处理失败 {error_count} 个PR")
@@ -3,17 +3,19 @@ import json
 import random
 from tqdm import tqdm
 import logging
-from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
-import time
-import requests
+import asyncio
 import threading
 from concurrent.futures import ThreadPoolExecutor
 from github import Github
 from collections import OrderedDict
 from datetime import datetime, timezone
-import itertools  # Add import for itertools
 
-from utils import retry_function, save_jsonl, load_jsonl, safe_parse_time, load_json, save_json
+from utils import retry_function, save_jsonl, load_jsonl, safe_parse_time, load_json, save_json, build_pr_timeline
+from github_graphql import GraphQLPRFetcher, GRAPHQL_BATCH_SIZE
+from token_pool import TokenPool
+from async_crawler import crawl_prs
+from http_cache import HTTPCache
+from local_diffs import LocalDiffFetcher
 
 
 GH_TOKENS = [
@@ -22,32 +24,22 @@ GH_TOKENS = [
 'your_github_token_3',
 ]
 
+# rough number of REST calls made by get_pr_info for a PR, reserved on the token until its real quota is known
+PR_REST_COST = 10
 
-class RateLimiter:
-    def __init__(self, calls_per_second=3):
-        self.min_interval = 1.0 / calls_per_second
-        self.last_call = 0
 
-    def __call__(self):
-        now = time.time()
-        elapsed = now - self.last_call
-        wait = max(self.min_interval - elapsed, 0)
-        if wait > 0:
-            time.sleep(wait)
-        self.last_call = time.time()
+# ERROR rows dropped by clean_error_prs, so that the next run fetches those PRs again
+# (RetryError and UnknownObjectException rows are kept)
+RETRY_ERROR_PREFIXES = (
+    "ProxyError", "ConnectionError", "GithubException", "AssertionError", "GraphQLError", "HTTPError",
+    "HTTPStatusError", "ConnectError", "ConnectTimeout", "ReadTimeout", "ReadError", "RemoteProtocolError",
+)
 
-rate_limiter = RateLimiter()
 
-@retry(stop=stop_after_attempt(10),
-       wait=wait_exponential(multiplier=1, min=4, max=60),
-       retry=retry_if_exception_type((requests.exceptions.RequestException, Exception)),
-       before_sleep=lambda _: rate_limiter())
-def retry_function(func, *args, **kwargs):
-    return func(*args, **kwargs)
-
-
-
-def clean_error_prs(repo_name):
+def clean_error_prs(repo_name, pr_store=None):
+    if pr_store is not None:
+        pr_store.delete_errors(repo_name, RETRY_ERROR_PREFIXES)
+        return
     jsonl_file = f'data/train_prs_raw/{repo_name.replace("/", "__")}__prs.jsonl'
     if not os.path.exists(jsonl_file):
         return
@@ -55,23 +47,19 @@ def clean_error_prs(repo_name):
     new_prs = []
     for pr in prs:
         error_info = pr.get('ERROR_INFO', "")
-        # if error_info.startswith("RetryError"):
-        #     continue
-        if error_info.startswith("ProxyError"):
-            continue
-        if error_info.startswith("ConnectionError"):
-            continue
-        if error_info.startswith("GithubException"):
+        if error_info.startswith(RETRY_ERROR_PREFIXES):
             continue
-        if error_info.startswith("AssertionError"):
-            continue
-        # if error_info.startswith("UnknownObjectException"):
-        #     continue
         new_prs.append(pr)
     save_jsonl(jsonl_file, new_prs)
     
     
-def show_error_prs(repo_name):
+def show_error_prs(repo_name, pr_store=None):
+    if pr_store is not None:
+        prs_error_type = {"SUCCESS": pr_store.count(repo_name, errors=False), **pr_store.error_counts(repo_name)}
+        print(f"{repo_name} has {sum(prs_error_type.values())} PRs")
+        for error_type, count in prs_error_type.items():
+            print(f"{error_type}: {count}")
+        return
     jsonl_file = f'data/train_prs_raw/{repo_name.replace("/", "__")}__prs.jsonl'
     if not os.path.exists(jsonl_file):
         return
@@ -87,7 +75,7 @@ def show_error_prs(repo_name):
         print(f"{error_type}: {count}")
 
 
-def get_pr_info(pr):
+def get_pr_info(pr, local_diffs=None):
     pr_info = {
         'repo': pr.head.repo.full_name,
         'number': pr.number,
@@ -117,12 +105,16 @@ def get_pr_info(pr):
             'created_at': pr.created_at.replace(tzinfo=timezone.utc).isoformat()
         }
 
-    commits = retry_function(pr.get_commits)
+    commits = list(retry_function(pr.get_commits))
+    # all the commit diffs of the PR from the local clone, the API (one call per commit) is the fallback
+    local_commit_diffs = local_diffs.pr_diffs(pr.number, [commit.sha for commit in commits]) if local_diffs else None
     for commit in commits:
         key = f"commit_{commit.sha}"
-        files = commit.files
-        diff_text = "\n".join([f"{f.filename}\n{f.patch}" for f in files if f.patch])
-        diff = [{'file': f.filename, 'patch': f.patch} for f in files if f.patch]
+        if local_commit_diffs is not None:
+            diff = local_commit_diffs[commit.sha]
+        else:
+            diff = [{'file': f.filename, 'patch': f.patch} for f in commit.files if f.patch]
+        diff_text = "\n".join([f"{d['file']}\n{d['patch']}" for d in diff])
         timeline_dict[key] = {
             'type': 'commit',
             'sha': commit.sha,
@@ -181,43 +173,20 @@ def get_pr_info(pr):
         })
         review_comments_dict[comment.id] = comment_dict
     
-    for id, comment in review_comments_dict.items():
-        if comment['in_reply_to_id'] is not None:
-            root_reply_id = comment['in_reply_to_id']
-            while review_comments_dict[root_reply_id]['in_reply_to_id'] is not None:
-                root_reply_id = review_comments_dict[root_reply_id]['in_reply_to_id']
-            review_comments_dict[root_reply_id]['reply'].append({
-                'id': comment['id'],
-                'user': comment['user'],
-                'body': comment['body'],
-                'created_at': comment['created_at']
-            })
-        else:
-            timeline_dict[f"review_comment_{id}"] = comment
-
-    reviews = retry_function(pr.get_reviews)
-    for review in reviews:
-        key = f"review_{review.id}"
-        timeline_dict[key] = {
-            'type': 'review',
-            'id': review.id,
-            'user': review.user.login,
-            'body': review.body,
-            'state': review.state,
-            'created_at': review.submitted_at.replace(tzinfo=timezone.utc).isoformat() if review.submitted_at else None
-        }
-
-    pr_info['timeline'] = sorted(timeline_dict.values(), 
-                                 key=lambda x: safe_parse_time(x.get('date') or x.get('created_at')) or datetime.min.replace(tzinfo=timezone.utc))
-    for item in pr_info['timeline']:
-        if item['type'] == 'review_comment':
-            item['reply'] = sorted(item['reply'], 
-                                   key=lambda x: safe_parse_time(x.get('date') or x.get('created_at')) or datetime.min.replace(tzinfo=timezone.utc))
+    pr_info['timeline'] = build_pr_timeline(timeline_dict, review_comments_dict)
     return pr_info
 
     
         
-def get_all_prs(repo_name, specific_pr_ids_range):
+def get_all_prs(repo_name, specific_pr_ids_range, use_graphql=False, use_async=False, http_cache=None, use_local_diffs=False,
+                pr_store=None):
+    """
+    Fetch the PRs in specific_pr_ids_range not collected yet, and return all the collected PRs of the repo: a list
+    loaded from data/train_prs_raw/<owner>__<name>__prs.jsonl, or a streaming iterator when pr_store (PRStore) is
+    set, in which case the rows are written to the store instead of the JSONL file.
+
+    http_cache (HTTPCache) is only used by the use_async and use_graphql paths, the PyGithub requests bypass it.
+    """
     os.makedirs('data/train_prs_raw', exist_ok=True)
     
     logging.basicConfig(
@@ -231,13 +200,17 @@ def get_all_prs(repo_name, specific_pr_ids_range):
     
     jsonl_file = f'data/train_prs_raw/{repo_name.replace("/", "__")}__prs.jsonl'
     
-    if os.path.exists(jsonl_file):
-        all_pulls = load_jsonl(jsonl_file)
-        all_pulls_ids = [pr['number'] for pr in all_pulls]
-        logging.info(f"Loaded {len(all_pulls)} cached PRs")
+    if pr_store is not None:
+        all_pulls_ids = pr_store.numbers(repo_name)
+        logging.info(f"Found {len(all_pulls_ids)} PRs in the store")
+    elif os.path.exists(jsonl_file):
+        all_pulls_ids = set()
+        with open(jsonl_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                all_pulls_ids.add(json.loads(line)['number'])
+        logging.info(f"Loaded {len(all_pulls_ids)} cached PRs")
     else:
-        all_pulls = []
-        all_pulls_ids = []
+        all_pulls_ids = set()
         logging.info(f"No cached PRs found")
         
     logging.info(f"Getting PRs of {repo_name}")
@@ -247,40 +220,93 @@ def get_all_prs(repo_name, specific_pr_ids_range):
     
     if not missing_pr_ids:
         logging.info("All specified PRs are already cached, no need to download")
-        return all_pulls
+        return pr_store.iter_prs(repo_name) if pr_store is not None else load_jsonl(jsonl_file)
     
-    logging.info(f"Getting {len(missing_pr_ids)} PRs (total {len(specific_pr_ids)}, cached {len(all_pulls)} PRs)")
+    logging.info(f"Getting {len(missing_pr_ids)} PRs (total {len(specific_pr_ids)}, cached {len(all_pulls_ids)} PRs)")
     
     file_lock = threading.Lock()
+    def write_rows(rows):
+        if pr_store is not None:
+            pr_store.put_many(repo_name, rows)
+            return
+        with file_lock:
+            with open(jsonl_file, 'a', encoding='utf-8') as f:
+                for row in rows:
+                    f.write(json.dumps(row, ensure_ascii=False, default=str) + '\n')
     
-    gh_token_cycle = itertools.cycle(GH_TOKENS)
+    token_pool = TokenPool(GH_TOKENS)
+    local_diffs = LocalDiffFetcher(repo_name) if use_local_diffs else None
     def fetch_pr_worker(pr_id):
+        gtoken = token_pool.acquire('core', cost=PR_REST_COST)
         try:
-            gtoken = next(gh_token_cycle)
-            repo = Github(gtoken, timeout=300).get_repo(repo_name)
+            gh = Github(gtoken, timeout=300)
+            repo = gh.get_repo(repo_name)
             pr = repo.get_pull(pr_id)
             logging.info(f"获取到PR: {pr}")
             
-            pr_info = retry_function(get_pr_info, pr)
+            pr_info = retry_function(get_pr_info, pr, local_diffs)
+            remaining, limit = gh.rate_limiting
+            token_pool.update(gtoken, remaining, limit, gh.rate_limiting_resettime, 'core')
             
-            with file_lock:
-                with open(jsonl_file, 'a', encoding='utf-8') as f:
-                    f.write(json.dumps(pr_info, ensure_ascii=False, default=str) + '\n')
+            write_rows([pr_info])
             
         except Exception as e:
-            with file_lock:
-                with open(jsonl_file, 'a', encoding='utf-8') as f:
-                    f.write(json.dumps({"number": pr_id, "ERROR": True, "ERROR_INFO": f"{e.__class__.__name__}: {str(e)}"}, ensure_ascii=False, default=str) + '\n')
+            token_pool.update_from_headers(gtoken, getattr(e, 'headers', None))
+            write_rows([{"number": pr_id, "ERROR": True, "ERROR_INFO": f"{e.__class__.__name__}: {str(e)}"}])
+        finally:
+            token_pool.release(gtoken, 'core', cost=PR_REST_COST)
                     
         return pr_id
     
-    with ThreadPoolExecutor(max_workers=int(len(GH_TOKENS)*0.5)) as executor:
-        results = list(tqdm(
-            executor.map(fetch_pr_worker, missing_pr_ids),
-            total=len(missing_pr_ids),
-            desc="PRs"
-        ))
+    def fetch_pr_batch_worker(pr_ids):
+        # one GraphQL query for the whole batch, the PRs not found are written as ERROR rows like the REST ones
+        try:
+            with token_pool.token('graphql') as gtoken:
+                fetcher = GraphQLPRFetcher(gtoken, repo_name, token_pool=token_pool, http_cache=http_cache,
+                                           local_diffs=local_diffs, timeout=300)
+                results = retry_function(fetcher.fetch_prs, pr_ids)
+        except Exception as e:
+            results = {pr_id: e for pr_id in pr_ids}
+
+        rows = []
+        for pr_id in pr_ids:
+            result = results[pr_id]
+            if isinstance(result, Exception):
+                result = {"number": pr_id, "ERROR": True, "ERROR_INFO": f"{result.__class__.__name__}: {str(result)}"}
+            rows.append(result)
+        write_rows(rows)
+
+        return pr_ids
+
+    if use_async:
+        asyncio.run(crawl_prs(repo_name, missing_pr_ids, jsonl_file, GH_TOKENS, token_pool=token_pool,
+                              http_cache=http_cache, local_diffs=local_diffs, write_rows=write_rows))
+        tasks = []
+        worker = None
+    elif use_graphql:
+        worker = fetch_pr_batch_worker
+        tasks = [missing_pr_ids[i:i + GRAPHQL_BATCH_SIZE] for i in range(0, len(missing_pr_ids), GRAPHQL_BATCH_SIZE)]
+    else:
+        if http_cache:
+            logging.warning("The PyGithub path does not use the HTTP cache, pass use_async=True to revalidate the cached responses")
+        worker = fetch_pr_worker
+        tasks = missing_pr_ids
+
+    if tasks:
+        with ThreadPoolExecutor(max_workers=int(len(GH_TOKENS)*0.5)) as executor:
+            results = list(tqdm(
+                executor.map(worker, tasks),
+                total=len(tasks),
+                desc="PRs"
+            ))
+    token_pool.log_stats()
+    if http_cache:
+        logging.info(f"HTTP cache: {http_cache.stats()}")
     
+    if pr_store is not None:
+        logging.info(f"Got {pr_store.count(repo_name)} PRs")
+        return pr_store.iter_prs(repo_name)
+
     all_pulls = load_jsonl(jsonl_file)
     logging.info(f"Got {len(all_pulls)} PRs")
     
@@ -302,23 +328,26 @@ def get_eval_repo():
         ("sympy/sympy", 28000), # 659
     ]
     
+    # shared by all the repos and by get_train_repo(), so that re-crawls only revalidate the cached responses
+    http_cache = HTTPCache()
     for repo_name, pr_count in repos:
         # clean_error_prs(repo_name)
         # show_error_prs(repo_name)
-        prs = get_all_prs(repo_name, specific_pr_ids_range=(0, pr_count))
+        prs = get_all_prs(repo_name, specific_pr_ids_range=(0, pr_count), use_async=True, http_cache=http_cache)
         print(f"Got {len(prs)} PRs")
 
 
 def get_train_repo():
     data_path = "/SWRBench/data/top_pypi.json"
     data = load_json(data_path)[45:50]
+    http_cache = HTTPCache()
     for item in data:
         repo_name = item["repo_name"]
         pr_count = item["max_pr_count"]
         # show_error_prs(repo_name)
         # clean_error_prs(repo_name)
         # show_error_prs(repo_name)
-        prs = get_all_prs(repo_name, specific_pr_ids_range=(0, pr_count))
+        prs = get_all_prs(repo_name, specific_pr_ids_range=(0, pr_count), use_async=True, http_cache=http_cache)
         print(f"Got {len(prs)} PRs")
 
 
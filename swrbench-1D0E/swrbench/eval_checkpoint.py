@@ -0,0 +1,110 @@
+import os
+import json
+import hashlib
+import threading
+from collections import Counter
+
+from loguru import logger
+
+
+def prediction_key(instance_id, review):
+    # evaluation_struct normalizes the quotes of the review before judging it, the key must not depend on it
+    return instance_id, (review or "").replace("’", "'")
+
+
+def prediction_ids(tasks):
+    """
+    Stable ids of the tasks ({'pred', 'instance'}): <instance_id>-<hash of the review>, with a -<n> suffix for the
+    n-th copy of the same prediction. They don't depend on the position of the task in the list, so the custom ids of
+    a batch still name the same predictions once a resume has dropped the judged ones.
+    """
+    seen = Counter()
+    ids = []
+    for task in tasks:
+        instance_id, review = prediction_key(task['pred']['instance_id'], task['pred'].get('review'))
+        base = f"{instance_id}-{hashlib.sha1(review.encode('utf-8')).hexdigest()[:12]}"
+        ids.append(f"{base}-{seen[base]}" if seen[base] else base)
+        seen[base] += 1
+    return ids
+
+
+def load_checkpoint(path):
+    """ The results in the checkpoint at path, read only (the incomplete lines are skipped) """
+    rows = []
+    with open(path, "r", encoding="utf-8") as f:
+        for n, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                rows.append(json.loads(line))
+            except json.JSONDecodeError:
+                logger.warning(f"Skipping the incomplete line {n} of the checkpoint {path}")
+    return rows
+
+
+def has_results(path):
+    """ Whether the checkpoint at path exists and holds at least one result """
+    return os.path.exists(path) and os.path.getsize(path) > 0
+
+
+class EvalCheckpoint:
+    """
+    Append-only JSONL of the judged results. Each result is written and synced as soon as it is known, so an
+    interrupted run only loses the requests in flight, and the next run with resume skips the predictions already
+    judged (several predictions of the same instance are told apart by their review).
+    """
+
+    def __init__(self, path, resume=True):
+        """
+        :param resume: keep the results already in path, otherwise the checkpoint starts empty (the caller decides
+            whether an existing one may be dropped, see has_results)
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        if resume and os.path.exists(path):
+            # the judged rows are never rewritten, a crash here can't lose them
+            self._truncate_torn_line()
+            self.resumed = len(self.load())
+        else:
+            open(path, "w").close()
+            self.resumed = 0
+
+    def _truncate_torn_line(self):
+        """ Drop the end of the line a crash left unfinished, so that the next append starts on a new line """
+        with open(self.path, "rb+") as f:
+            end = f.seek(0, os.SEEK_END)
+            pos = end
+            while pos > 0:
+                start = max(pos - 65536, 0)
+                f.seek(start)
+                newline = f.read(pos - start).rfind(b"\n")
+                if newline >= 0:
+                    pos = start + newline + 1
+                    break
+                pos = start
+            if pos < end:
+                logger.warning(f"Dropping the incomplete last line of the checkpoint {self.path}")
+                f.truncate(pos)
+
+    def load(self):
+        return load_checkpoint(self.path)
+
+    def pending(self, tasks):
+        """ The tasks ({'pred', 'instance'}) without a result in the checkpoint yet """
+        done = Counter(prediction_key(row['instance_id'], row.get('review')) for row in self.load())
+        pending = []
+        for task in tasks:
+            key = prediction_key(task['pred']['instance_id'], task['pred'].get('review'))
+            if done[key] > 0:
+                done[key] -= 1
+            else:
+                pending.append(task)
+        return pending
+
+    def append(self, result):
+        line = json.dumps(result) + "\n"
+        with self.lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
@@ -1,5 +1,7 @@
 import argparse
+import asyncio
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
 import json
 import os
 import re
@@ -8,7 +10,12 @@ import numpy as np
 import logging
 import random
 from tqdm import tqdm
-from utils import run_chat
+from utils import run_chat, set_llm_cache, set_llm_metrics, configure_llm_calls, OPENAI_API_BASE, OPENAI_API_KEY
+from llm_batch import BatchRunner, batch_request
+from llm_metrics import llm_context
+from llm_dispatcher import configure_dispatcher, parse_model_limits, DEFAULT_MAX_CONCURRENCY
+from eval_checkpoint import EvalCheckpoint, has_results, load_checkpoint, prediction_ids
+from judge_cascade import looks_approved, evaluate_cascade, evaluate_cascade_async, calibration_report
 
 DEFECT_TYPE_TEXT_MAP = {
     'E.1': 'Documentation',
@@ -112,8 +119,8 @@ def create_clean_pr_prompt(item):
     )
     
 
-def parse_clean_pr_answer(args, instance, answer, logger):
-    prompt = (
+def create_clean_pr_parse_prompt(answer):
+    return (
         "You are a data extraction assistant. Your task is to meticulously parse the provided text, which contains an evaluation result for a **clean** pull request, and transform it into a structured JSON object.\n\n"
         "**Input Text Format:**\n"
         "The input text starts with a section indicating if the PR was identified as clean, followed by blocks describing predicted issues (potential false positives), following this pattern:\n"
@@ -178,12 +185,18 @@ def parse_clean_pr_answer(args, instance, answer, logger):
         f"```markdown\n{answer}\n```"
     )
 
+
+def parse_clean_pr_answer(args, instance, answer, logger):
     parsed_answer = run_chat(
         model=args.model, 
-        messages=[{"role": "user", "content": prompt}],
+        messages=[{"role": "user", "content": create_clean_pr_parse_prompt(answer)}],
         temperature=0.0, 
         max_tokens=8192 # Adjusted max_tokens based on potential complexity
     )
+    return extract_clean_pr_answer(instance, parsed_answer, logger)
+
+
+def extract_clean_pr_answer(instance, parsed_answer, logger):
     if parsed_answer is None:
         logger.error("Failed to get parsing response from model.")
         return None
@@ -394,8 +407,8 @@ def create_messages(message, system_message=None):
     return messages
 
 
-def parse_defect_pr_answer(args, instance, answer, logger):
-    prompt = (
+def create_defect_pr_parse_prompt(answer):
+    return (
         "You are a data extraction assistant. Your task is to meticulously parse the provided text, which contains an evaluation result, and transform it into a structured JSON object.\n\n"
         "**Input Text Format:**\n"
         "The input text starts with an assessment of whether the PR was incorrectly identified as clean/good, followed by blocks describing predicted defects and ground truth defects, following this pattern:\n"
@@ -468,12 +481,18 @@ def parse_defect_pr_answer(args, instance, answer, logger):
         f"```markdown\n{answer}\n```"
     )
 
+
+def parse_defect_pr_answer(args, instance, answer, logger):
     parsed_answer = run_chat(
         model=args.model, 
-        messages=[{"role": "user", "content": prompt}],
+        messages=[{"role": "user", "content": create_defect_pr_parse_prompt(answer)}],
         temperature=0.0, 
         max_tokens=8192
     )
+    return extract_defect_pr_answer(instance, parsed_answer, logger)
+
+
+def extract_defect_pr_answer(instance, parsed_answer, logger):
     if parsed_answer is None:
         logger.error("Failed to get parsing response from model for defect task.") # Specific log
         return None
@@ -592,21 +611,39 @@ def parse_defect_pr_answer(args, instance, answer, logger):
         return None
 
 
-def evaluate_one(args, item, logger):
+def create_eval_messages(item):
     # system_message = "You are a helpful assistant."
     system_message = None
-    defect_introduced = item['instance']['defect_introduced']
-    if defect_introduced:
+    if item['instance']['defect_introduced']:
         prompt = create_defect_pr_prompt(item)
     else:
         prompt = create_clean_pr_prompt(item)
-    instance_id = item['instance']['instance_id']
-    messages = create_messages(
+    return create_messages(
         message=prompt,
         system_message=system_message
     )
+
+
+def create_eval_parse_messages(item, response):
+    if item['instance']['defect_introduced']:
+        prompt = create_defect_pr_parse_prompt(response)
+    else:
+        prompt = create_clean_pr_parse_prompt(response)
+    return [{"role": "user", "content": prompt}]
+
+
+def extract_eval_answer(item, parsed_answer, logger):
+    if item['instance']['defect_introduced']:
+        return extract_defect_pr_answer(item['instance'], parsed_answer, logger)
+    return extract_clean_pr_answer(item['instance'], parsed_answer, logger)
+
+
+def evaluate_one(args, item, logger):
+    defect_introduced = item['instance']['defect_introduced']
+    instance_id = item['instance']['instance_id']
+    messages = create_eval_messages(item)
     logger.debug(f"Sending request for instance {instance_id} ...")
-    logger.debug(f"Prompt: \n{prompt}")
+    logger.debug(f"Prompt: \n{messages[-1]['content']}")
     result = None # Initialize result
     response = None # Initialize response
     for i in range(3):
@@ -636,7 +673,212 @@ def evaluate_one(args, item, logger):
             # messages.append({"role": "assistant", "content": response})
             # messages.append({"role": "user", "content": "Parsing failed. Please provide the output strictly in the specified JSON format."})
 
+    return build_eval_result(item, messages, response, result, logger)
+
+
+async def evaluate_one_async(args, item, logger, dispatcher, sample_index=None):
+    """
+    evaluate_one on the dispatcher loop, both the judge and the answer parsing requests are awaited.
+    sample_index keeps the answers of repeated judgments of the same item apart in the LLM cache.
+    """
+    instance_id = item['instance']['instance_id']
+    messages = create_eval_messages(item)
+    logger.debug(f"Sending request for instance {instance_id} ...")
+    result = None
+    response = None
+    for i in range(3):
+        response = await dispatcher.achat(args.model, messages, temperature=args.temperature, max_tokens=args.max_tokens,
+                                          sample_index=sample_index)
+        if response is None:
+            logger.warning(f"Failed to get response for instance {instance_id} (Attempt {i+1})")
+            continue
+        parsed_answer = await dispatcher.achat(args.model, create_eval_parse_messages(item, response),
+                                               temperature=0.0, max_tokens=8192, sample_index=sample_index)
+        result = extract_eval_answer(item, parsed_answer, logger)
+        if result is not None:
+            break
+        logger.warning(f"Failed to parse answer for instance {instance_id} (Attempt {i+1}). Retrying...")
+
+    return build_eval_result(item, messages, response, result, logger)
+
+
+def cascade_check(item, result):
+    """ :returns why the verdict of the cheap judge needs the expensive one (--cascade-model), None when it holds up """
+    approved = looks_approved(item['pred']['review'])
+    if item['instance']['defect_introduced']:
+        if (result['incorrectly_identified_as_good'] == 'YES') != approved:
+            return "stance disagrees with the review"
+        if len(result['gt_issues']) != len(item['instance']['defects']):
+            return "missing ground truth verdicts"
+        for gt_id, gt_info in result['gt_issues'].items():
+            if gt_info['hit'] == 'YES' and gt_info['hit_by'] not in result['pred_issues']:
+                return f"{gt_id} hit by an unknown issue"
+    else:
+        if (result['correctly_identified_as_good'] == 'YES') != approved:
+            return "stance disagrees with the review"
+        if result['correctly_identified_as_good'] == 'YES' and any(issue['severity_score'] >= 7 for issue in result['pred_issues'].values()):
+            return "approved with a severe issue"
+    return None
+
+
+def verdict_summary(result):
+    """ What calibration_report compares between the tiers """
+    stance = result['incorrectly_identified_as_good'] if result['defect_introduced'] else result['correctly_identified_as_good']
+    return {
+        "stance": stance,
+        "hits": {gt_id: gt_info['hit'].upper() for gt_id, gt_info in result.get('gt_issues', {}).items()},
+        "pred_count": len(result['pred_issues']),
+    }
+
+
+GROUP_REVIEW_LABEL = "REVIEW-{}"
+
+
+def group_tasks(tasks, group_size):
+    """ Split the tasks into groups of up to group_size predictions of the same instance, in the order of the tasks """
+    by_instance = {}
+    for item in tasks:
+        by_instance.setdefault(item['instance']['instance_id'], []).append(item)
+    return [items[i:i + group_size] for items in by_instance.values() for i in range(0, len(items), group_size)]
+
+
+def create_group_eval_messages(items):
+    """
+    One judge request for several predictions of the same instance: the PR and ground truth context is sent once,
+    followed by the labelled reviews, and the judge writes one evaluation result per review.
+    """
+    reviews = "\n".join(
+        f"<Review {GROUP_REVIEW_LABEL.format(i + 1)}>\n{item['pred']['review'].strip()}\n</Review {GROUP_REVIEW_LABEL.format(i + 1)}>"
+        for i, item in enumerate(items)
+    )
+    prompt = create_eval_messages({'instance': items[0]['instance'], 'pred': {'review': reviews}})[-1]['content']
+    first, last = GROUP_REVIEW_LABEL.format(1), GROUP_REVIEW_LABEL.format(len(items))
+    prompt += (
+        "**MULTIPLE PREDICTED REVIEWS:**\n"
+        f"The `<Predicted Review>` above contains {len(items)} independent reviews generated by the system being evaluated, labelled from `<Review {first}>` to `<Review {last}>`.\n"
+        "Evaluate each review separately, following the EVALUATION TASK as if it were the only predicted review, and never let one review influence the evaluation of another.\n"
+        f"Write one complete evaluation result in the OUTPUT FORMAT above per review, in order from {first} to {last}. "
+        "Start each of them with a line `**EVALUATION RESULT FOR REVIEW-<number>:**` instead of the EVALUATION RESULT header, and end it with `**END OF EVALUATION RESULT**`.\n"
+    )
+    return create_messages(message=prompt)
+
 
+def split_group_answer(response, n):
+    """ :returns the evaluation result of each of the n reviews in the answer to a group request, None if missing """
+    sections = [None] * n
+    matches = list(re.finditer(r"\*{0,2}EVALUATION RESULT FOR REVIEW-(\d+)[^\n]*", response))
+    for match, following in zip(matches, matches[1:] + [None]):
+        index = int(match.group(1)) - 1
+        if 0 <= index < n and sections[index] is None:
+            sections[index] = response[match.end():following.start() if following else len(response)].strip()
+    return sections
+
+
+def _group_attempt(items, pending):
+    """ (messages, n) of the judge request for the pending items of a group, the plain prompt for a single one """
+    if len(pending) == 1:
+        return create_eval_messages(items[pending[0]]), 1
+    return create_group_eval_messages([items[j] for j in pending]), len(pending)
+
+
+def _group_sections(response, n):
+    return [response] if n == 1 else split_group_answer(response, n)
+
+
+def evaluate_group(args, items, logger):
+    """ evaluate_one for the predictions of one instance, judged together (--group-size), :returns the results in order """
+    instance_id = items[0]['instance']['instance_id']
+    results = [None] * len(items)
+    answers = [None] * len(items)
+    pending = list(range(len(items)))
+    for i in range(3):
+        messages, n = _group_attempt(items, pending)
+        response = run_chat(model=args.model, messages=messages, temperature=args.temperature, max_tokens=args.max_tokens)
+        if response is None:
+            logger.warning(f"Failed to get response for instance {instance_id} (Attempt {i+1})")
+            continue
+        for j, section in zip(pending, _group_sections(response, n)):
+            if section is None:
+                continue
+            parsed_answer = run_chat(model=args.model, messages=create_eval_parse_messages(items[j], section),
+                                     temperature=0.0, max_tokens=8192)
+            results[j] = extract_eval_answer(items[j], parsed_answer, logger)
+            answers[j] = (messages, section)
+        pending = [j for j in pending if results[j] is None]
+        if not pending:
+            break
+        logger.warning(f"Failed to parse {len(pending)}/{len(items)} answers for instance {instance_id} (Attempt {i+1}). Retrying...")
+
+    return [build_eval_result(item, list(answers[j][0]) if answers[j] else None, answers[j][1] if answers[j] else None,
+                              results[j], logger)
+            for j, item in enumerate(items)]
+
+
+async def evaluate_group_async(args, items, logger, dispatcher):
+    """ evaluate_group on the dispatcher loop, the answer parsing requests of the reviews are sent concurrently """
+    instance_id = items[0]['instance']['instance_id']
+    results = [None] * len(items)
+    answers = [None] * len(items)
+    pending = list(range(len(items)))
+    for i in range(3):
+        messages, n = _group_attempt(items, pending)
+        response = await dispatcher.achat(args.model, messages, temperature=args.temperature, max_tokens=args.max_tokens)
+        if response is None:
+            logger.warning(f"Failed to get response for instance {instance_id} (Attempt {i+1})")
+            continue
+        answered = [(j, section) for j, section in zip(pending, _group_sections(response, n)) if section is not None]
+        parsed_answers = await asyncio.gather(*[
+            dispatcher.achat(args.model, create_eval_parse_messages(items[j], section), temperature=0.0, max_tokens=8192)
+            for j, section in answered
+        ])
+        for (j, section), parsed_answer in zip(answered, parsed_answers):
+            results[j] = extract_eval_answer(items[j], parsed_answer, logger)
+            answers[j] = (messages, section)
+        pending = [j for j in pending if results[j] is None]
+        if not pending:
+            break
+        logger.warning(f"Failed to parse {len(pending)}/{len(items)} answers for instance {instance_id} (Attempt {i+1}). Retrying...")
+
+    return [build_eval_result(item, list(answers[j][0]) if answers[j] else None, answers[j][1] if answers[j] else None,
+                              results[j], logger)
+            for j, item in enumerate(items)]
+
+
+def evaluate_batch(args, tasks, logger):
+    """
+    --batch-mode: the judge requests of all the tasks go through the provider batch API, then their answer parsing
+    requests. The tasks without a parsed answer are sent again in the next round, up to 3 rounds as in evaluate_one.
+    :returns the results in the order of the tasks, None for the failed ones
+    """
+    runner = BatchRunner(args.output_file + ".batch", args.batch_api_base or OPENAI_API_BASE[0], OPENAI_API_KEY[0],
+                         poll_interval=args.batch_poll_interval)
+    # the custom ids name the predictions, not their position: a resume drops the judged ones from tasks
+    items = dict(zip(prediction_ids(tasks), tasks))
+    messages = {custom_id: create_eval_messages(item) for custom_id, item in items.items()}
+    results = {}
+    pending = list(items)
+    for i in range(3):
+        if not pending:
+            break
+        responses = runner.run(f"judge-{i}", [batch_request(custom_id, args.model, messages[custom_id], args.temperature, args.max_tokens)
+                                              for custom_id in pending])
+        answered = [custom_id for custom_id in pending if responses[custom_id] is not None]
+        parsed_answers = runner.run(f"parse-{i}", [batch_request(custom_id, args.model, create_eval_parse_messages(items[custom_id], responses[custom_id]), 0.0, 8192)
+                                                   for custom_id in answered]) if answered else {}
+        for custom_id in answered:
+            result = extract_eval_answer(items[custom_id], parsed_answers[custom_id], logger)
+            if result is not None:
+                results[custom_id] = build_eval_result(items[custom_id], messages[custom_id], responses[custom_id], result, logger)
+        pending = [custom_id for custom_id in pending if custom_id not in results]
+        logger.info(f"Batch round {i+1}: {len(results)}/{len(items)} instances evaluated")
+    for custom_id in pending:
+        logger.error(f"Failed to get and parse answer for instance {items[custom_id]['instance']['instance_id']} after 3 batch rounds.")
+    return [results.get(custom_id) for custom_id in items]
+
+
+def build_eval_result(item, messages, response, result, logger):
+    defect_introduced = item['instance']['defect_introduced']
+    instance_id = item['instance']['instance_id']
     if result is None:
         logger.error(f"Failed to get and parse answer for instance {instance_id} after 3 attempts.")
         # Store the last failed response if needed for debugging
@@ -1005,31 +1247,97 @@ def evaluate(args):
     logger.info(f"Output File: {args.output_file}")
     logger.info("="*100)
     
+    judge_one, judge_one_async = evaluate_one, evaluate_one_async
+    if getattr(args, "cascade_model", None) is not None:
+        judge_one = partial(evaluate_cascade, evaluate_one=evaluate_one, check=cascade_check, summarize=verdict_summary)
+        judge_one_async = partial(evaluate_cascade_async, evaluate_one_async=evaluate_one_async, check=cascade_check,
+                                  summarize=verdict_summary)
+
     def process_item(item):
-        result = evaluate_one(args, item, logger)
+        with llm_context(stage="evaluation", instance_id=item['instance']['instance_id']):
+            result = judge_one(args, item, logger)
         return result
 
-    results = []
+    def process_group(items):
+        with llm_context(stage="evaluation", instance_id=items[0]['instance']['instance_id']):
+            return evaluate_group(args, items, logger)
+
     tasks = [{'pred': pred, 'instance': dataset_dict[pred['instance_id']]} for pred in predictions]
-    with ThreadPoolExecutor(max_workers=args.num_threads) as executor:
-        futures = [executor.submit(process_item, item) for item in tasks]
-        for future in tqdm(as_completed(futures), total=len(tasks), desc="Processing"):
-            result = future.result()
-            results.append(result)
+    # each result is appended to the checkpoint as soon as it is judged, --resume skips the ones already there
+    checkpoint_file = args.output_file + ".checkpoint.jsonl"
+    resume = getattr(args, "resume", False)
+    if not resume and not getattr(args, "overwrite", False) and has_results(checkpoint_file):
+        raise FileExistsError(f"{checkpoint_file} already holds judged results, pass --resume to skip them or --overwrite "
+                              f"to judge everything again")
+    checkpoint = EvalCheckpoint(checkpoint_file, resume=resume)
+    if checkpoint.resumed:
+        tasks = checkpoint.pending(tasks)
+        logger.info(f"Resuming from {checkpoint.resumed} judged predictions, {len(tasks)} left")
+
+    def save(result):
+        if result is not None:
+            checkpoint.append(result)
+
+    group_size = getattr(args, "group_size", 1)
+    if group_size > 1 and getattr(args, "batch_mode", False):
+        logger.warning("--group-size is not supported with --batch-mode, judging the predictions one by one")
+    if getattr(args, "batch_mode", False):
+        for result in evaluate_batch(args, tasks, logger):
+            save(result)
+    elif getattr(args, "async_dispatch", False):
+        # all the items in flight on the dispatcher loop, bounded by its concurrency limits instead of num_threads
+        dispatcher = configure_dispatcher(args.max_concurrency, parse_model_limits(args.model_concurrency))
+        async def process_item_async(item):
+            with llm_context(stage="evaluation", instance_id=item['instance']['instance_id']):
+                return await judge_one_async(args, item, logger, dispatcher)
+        async def process_group_async(items):
+            with llm_context(stage="evaluation", instance_id=items[0]['instance']['instance_id']):
+                return await evaluate_group_async(args, items, logger, dispatcher)
+        if group_size > 1:
+            groups = group_tasks(tasks, group_size)
+            for group_results in tqdm(dispatcher.map(process_group_async, groups), total=len(groups), desc="Processing"):
+                for result in group_results:
+                    save(result)
+        else:
+            for result in tqdm(dispatcher.map(process_item_async, tasks), total=len(tasks), desc="Processing"):
+                save(result)
+        logger.info(f"Max LLM requests in flight: {dispatcher.max_in_flight}")
+    elif group_size > 1:
+        # the predictions of an instance (e.g. generation.py --num-samples) share one judge request per group
+        groups = group_tasks(tasks, group_size)
+        logger.info(f"Judging {len(tasks)} predictions in {len(groups)} requests")
+        with ThreadPoolExecutor(max_workers=args.num_threads) as executor:
+            futures = [executor.submit(process_group, items) for items in groups]
+            for future in tqdm(as_completed(futures), total=len(groups), desc="Processing"):
+                for result in future.result():
+                    save(result)
+    else:
+        with ThreadPoolExecutor(max_workers=args.num_threads) as executor:
+            futures = [executor.submit(process_item, item) for item in tasks]
+            for future in tqdm(as_completed(futures), total=len(tasks), desc="Processing"):
+                save(future.result())
     
-    # results = []
     # for item in tqdm(tasks, total=len(tasks), desc="Processing"):
-    #     result = process_item(item)
-    #     results.append(result)
-    
-    if len(results) > 0:
-        save_json(results, args.output_file + ".tmp.json")
-        
-    if len(results) == 0 and os.path.exists(args.output_file + ".tmp.json"):
-        results = load_json(args.output_file + ".tmp.json")
+    #     process_item(item)
     
+    save_analysis(args, checkpoint.load(), logger, submitted=len(predictions))
+    logger.info(f"Finished processing {len(dataset)} instances")
+
+
+def save_analysis(args, results, logger, submitted=None):
+    """
+    analyze_result over the judged results, written to the output file. The predictions that failed are not in the
+    checkpoint, they count as errors out of the submitted ones.
+    """
+    if submitted is not None and submitted > len(results):
+        results = results + [None] * (submitted - len(results))
     analysis_results = analyze_result(results)
     logger.info(f"Analysis Results: \n{json.dumps(analysis_results, indent=4)}")
+
+    if any(result and 'judge_tier' in result for result in results):
+        report = calibration_report(results)
+        logger.info(f"Cascade Calibration: \n{json.dumps(report, indent=4)}")
+        save_json(report, args.output_file + ".calibration.json")
     
     save_result = {
         "analysis_results": analysis_results,
@@ -1037,7 +1345,6 @@ def evaluate(args):
     }
     
     save_json(save_result, args.output_file)
-    logger.info(f"Finished processing {len(dataset)} instances")
     logger.info(f"Output File: {args.output_file}")
 
 
@@ -1052,9 +1359,41 @@ if __name__ == "__main__":
     parser.add_argument("--num-threads", default=1, type=int, help="Number of threads")
     parser.add_argument("--temperature", default=0.0, type=float, help="Temperature")
     parser.add_argument("--max-tokens", default=8192, type=int, help="Max tokens")
+    parser.add_argument("--llm-cache", type=str, help="SQLite cache of the LLM answers, reused by the next runs")
+    parser.add_argument("--llm-cache-replay", action="store_true", help="Only replay the answers in --llm-cache, never call the API")
+    parser.add_argument("--batch-mode", action="store_true", help="Send the requests through the provider batch API, resumable from <output-file>.batch")
+    parser.add_argument("--batch-api-base", type=str, help="Base URL of the batch API (default: the first OPENAI_API_BASE)")
+    parser.add_argument("--batch-poll-interval", default=60, type=float, help="Seconds between two batch status checks")
+    parser.add_argument("--llm-metrics", type=str, help="Metrics JSONL of the LLM calls, see llm_metrics.py summarize")
+    parser.add_argument("--llm-timeout", type=float, help="Timeout in seconds of each LLM request attempt (default SWRBENCH_LLM_TIMEOUT or 600)")
+    parser.add_argument("--hedge-budget", type=float, help="Max ratio of LLM requests duplicated on another endpoint when slower than the p95 latency (0 disables)")
+    parser.add_argument("--async-dispatch", action="store_true", help="Send the requests with async_run_chat on a single event loop instead of --num-threads threads")
+    parser.add_argument("--max-concurrency", default=DEFAULT_MAX_CONCURRENCY, type=int, help="Max LLM requests in flight with --async-dispatch")
+    parser.add_argument("--model-concurrency", nargs="+", help="Max LLM requests in flight per model with --async-dispatch, as <model>=<limit>")
+    parser.add_argument("--group-size", default=1, type=int, help="Judge up to this many predictions of the same instance in a single request, sending the PR and ground truth context once")
+    parser.add_argument("--cascade-model", type=str, help="Cheap judge model tried first, --model only judges the instances it is unsure about")
+    parser.add_argument("--calibration-rate", default=0.05, type=float, help="Share of the cheap verdicts also judged by --model for the calibration report")
+    parser.add_argument("--resume", action="store_true", help="Skip the predictions already judged in <output-file>.checkpoint.jsonl")
+    parser.add_argument("--overwrite", action="store_true", help="Drop the results in <output-file>.checkpoint.jsonl and judge everything again")
+    parser.add_argument("--analyze-only", action="store_true", help="Only analyze the results in <output-file>.checkpoint.jsonl, without judging")
     args = parser.parse_args()
+    if args.cascade_model and (args.batch_mode or args.group_size > 1):
+        parser.error("--cascade-model can't be combined with --batch-mode or --group-size")
+
+    if args.llm_cache:
+        set_llm_cache(args.llm_cache, replay=args.llm_cache_replay)
+    if args.llm_metrics:
+        set_llm_metrics(args.llm_metrics, stage="evaluation")
+    configure_llm_calls(timeout=args.llm_timeout, hedge_budget=args.hedge_budget)
 
     # evaluate
-    evaluate(args)
+    if args.analyze_only:
+        if not os.path.exists(args.output_file + ".checkpoint.jsonl"):
+            parser.error(f"No checkpoint {args.output_file}.checkpoint.jsonl to analyze")
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+        submitted = len(load_jsonl(args.pred_file)) if args.pred_file else None
+        save_analysis(args, load_checkpoint(args.output_file + ".checkpoint.jsonl"), logging.getLogger(__name__), submitted)
+    else:
+        evaluate(args)
     
 # TODO: Add actual modified location and code snippet
\ No newline at end of file
@@ -1,3 +1,10 @@
+import asyncio
+from collections import Counter
+
+from evaluation import evaluate_one_async
+from llm_dispatcher import get_dispatcher
+
+
 def create_round2_prompt(item):
     instance = item['instance']
     pred = item['pred']
@@ -216,38 +223,89 @@ def create_clean_round1_prompt(item):
     )
 
 
-def evaluate_multi(args, item, logger):
-    e1 = evaluate_one(args, item, logger)
-    e2 = evaluate_one(args, item, logger)
-    e3 = evaluate_one(args, item, logger)
-    
-    # Create a copy of gt_defects from e1
-    gt_defects = {}
-    for gt_id, gt_info in e1['gt_defects'].items():
-        gt_defects[gt_id] = gt_info.copy()
-    
-    # Check if each defect is hit in all three evaluations
-    hit_count = 0
-    for gt_id in gt_defects:
-        is_hit_in_all = (
-            e1['gt_defects'].get(gt_id, {}).get('hit', '').lower() == 'yes' and
-            e2['gt_defects'].get(gt_id, {}).get('hit', '').lower() == 'yes' and
-            e3['gt_defects'].get(gt_id, {}).get('hit', '').lower() == 'yes'
-        )
-        
-        if is_hit_in_all:
-            gt_defects[gt_id]['hit'] = 'YES'
-            hit_count += 1
+def settle_votes(gt_ids, votes, pending, quorum):
+    """
+    :returns {gt_id: 'YES' / 'NO' / None} for the judged votes so far: a GT defect is hit when at least quorum votes
+    hit it, missed when the pending votes can't reach the quorum anymore, None while it can still go either way.
+    """
+    outcome = {}
+    for gt_id in gt_ids:
+        hits = sum(1 for vote in votes if vote['gt_issues'].get(gt_id, {}).get('hit', '').lower() == 'yes')
+        if hits >= quorum:
+            outcome[gt_id] = 'YES'
+        elif hits + pending < quorum:
+            outcome[gt_id] = 'NO'
         else:
-            gt_defects[gt_id]['hit'] = 'NO'
-            gt_defects[gt_id]['hit_by'] = 'N/A'
-    
+            outcome[gt_id] = None
+    return outcome
+
+
+async def evaluate_multi_async(args, item, logger, dispatcher, num_votes=3, quorum=None):
+    """
+    Judge the item num_votes times concurrently; a GT defect counts as hit when at least quorum votes (all of them by
+    default) hit it. The votes still running are cancelled as soon as every GT defect is settled, e.g. by the first NO
+    with the default quorum. A vote that fails is not counted: the quorum is lowered to the votes that can still
+    return, so that an API failure is not taken as a NO.
+    """
+    if not item['instance']['defect_introduced']:
+        raise ValueError(f"Multi-vote judging needs GT defects, {item['instance']['instance_id']} is a clean PR")
+    quorum = num_votes if quorum is None else quorum
+    instance_id = item['instance']['instance_id']
+    gt_ids = [f"GT-ISSUE-{i+1}" for i in range(len(item['instance'].get('defects', [])))]
+    tasks = [asyncio.ensure_future(evaluate_one_async(args, item, logger, dispatcher, sample_index=i)) for i in range(num_votes)]
+    votes = []
+    failed = 0
+    outcome = {}
+    try:
+        for i, future in enumerate(asyncio.as_completed(tasks)):
+            vote = await future
+            if vote is not None:
+                votes.append(vote)
+            else:
+                failed += 1
+            outcome = settle_votes(gt_ids, votes, num_votes - i - 1, min(quorum, num_votes - failed))
+            if votes and all(hit is not None for hit in outcome.values()):
+                break
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    if not votes:
+        logger.error(f"All {num_votes} votes failed for instance {instance_id}")
+        return None
+    if failed:
+        logger.warning(f"{failed}/{num_votes} votes failed for instance {instance_id}, settled on the {len(votes)} others")
+    logger.debug(f"Instance {instance_id} settled after {len(votes)}/{num_votes} votes")
+
+    # the details of each GT defect come from the first vote that agrees with the outcome
+    gt_issues = {}
+    for gt_id in gt_ids:
+        hit = outcome.get(gt_id) or 'NO'
+        agreeing = [vote for vote in votes if vote['gt_issues'].get(gt_id, {}).get('hit', '').upper() == hit]
+        gt_issues[gt_id] = dict(agreeing[0]['gt_issues'][gt_id]) if agreeing else {}
+        gt_issues[gt_id]['hit'] = hit
+        if hit == 'NO':
+            gt_issues[gt_id]['hit_by'] = 'N/A'
+
+    # the stance of most votes, the first one on a tie
+    stance = Counter(vote['incorrectly_identified_as_good'] for vote in votes).most_common(1)[0][0]
     result = {
-        "instance_id": item['instance']['instance_id'],
-        "hit": hit_count,
-        "total": e1['total'],
-        "gt_defects": gt_defects,
-        "pred_defects": e1['pred_defects'],
-        "raw_results": [e1, e2, e3]
+        "instance_id": instance_id,
+        "defect_introduced": True,
+        "hit": sum(1 for gt_info in gt_issues.values() if gt_info['hit'] == 'YES'),
+        "total": len(gt_ids),
+        "gt_issues": gt_issues,
+        "pred_issues": votes[0]['pred_issues'],
+        "incorrectly_identified_as_good": stance,
+        "review": item['pred']['review'],
+        "votes": len(votes),
+        "failed_votes": failed,
+        "raw_results": votes
     }
-    return result
\ No newline at end of file
+    return result
+
+
+def evaluate_multi(args, item, logger, num_votes=3, quorum=None):
+    """ Blocking evaluate_multi_async on the shared dispatcher """
+    dispatcher = get_dispatcher()
+    return dispatcher.run(evaluate_multi_async(args, item, logger, dispatcher, num_votes=num_votes, quorum=quorum))
@@ -1,14 +1,19 @@
 import argparse
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
 import json
 import os
 import re
-import threading
 import numpy as np
 import logging
 import random
 from tqdm import tqdm
-from utils import run_chat
+from utils import run_chat, llm_usage, set_llm_cache, set_llm_metrics, configure_llm_calls, OPENAI_API_BASE, OPENAI_API_KEY
+from llm_batch import BatchRunner, batch_request
+from llm_metrics import llm_context
+from llm_dispatcher import configure_dispatcher, parse_model_limits, DEFAULT_MAX_CONCURRENCY
+from eval_checkpoint import EvalCheckpoint, load_checkpoint, prediction_ids
+from judge_cascade import looks_approved, evaluate_cascade, evaluate_cascade_async, calibration_report
 from loguru import logger
 
 CHANGE_TYPE_TEXT_MAP = {
@@ -29,7 +34,7 @@ CHANGE_TYPE_TEXT_MAP = {
     'E.': 'Evolvability'
 }
 
-EVAL_CLEAN_PROMPT = """<Role>
+EVAL_CLEAN_HEAD = """<Role>
 You are an objective Evaluation Assistant specialized in analyzing code review predictions.
 </Role>
 
@@ -40,7 +45,9 @@ Your primary goals are:
 2.  If the predicted review raises any issues (potential false positives), identify, categorize, and assess the **inherent severity** of each potential false positive using the provided definitions.
 </OverallTask>
 
-<InputContext>
+"""
+
+EVAL_CLEAN_CONTEXT = """<InputContext>
     <PullRequestDetails>
         <Title>{pr_title}</Title>
         <Description>{pr_statement}</Description>
@@ -55,7 +62,9 @@ Your primary goals are:
     </PredictedReview>
 </InputContext>
 
-<ReferenceData>
+"""
+
+EVAL_CLEAN_TAIL = """<ReferenceData>
     <ChangeCategoryDefinitions>
         <Description>Use these categories to classify any issues identified in the <PredictedReview>.</Description>
         <Categories>
@@ -136,8 +145,10 @@ Provide your evaluation **strictly** in the following JSON format. Do not includ
 }}
 """
 
+EVAL_CLEAN_PROMPT = EVAL_CLEAN_HEAD + EVAL_CLEAN_CONTEXT + EVAL_CLEAN_TAIL
 
-EVAL_CHANGE_PROMPT = """<Role>
+
+EVAL_CHANGE_HEAD = """<Role>
 You are an objective Evaluation Assistant specialized in analyzing code review predictions against ground truth information.
 </Role>
 
@@ -145,7 +156,9 @@ You are an objective Evaluation Assistant specialized in analyzing code review p
 Your task is to evaluate a predicted code review based on how accurately it identifies the actual **changes or issues** present in a pull request (PR). You will compare the points raised in the predicted review against a ground truth list of confirmed changes/issues introduced by the PR.
 </OverallTask>
 
-<InputContext>
+"""
+
+EVAL_CHANGE_CONTEXT = """<InputContext>
     <PullRequestDetails>
         <Note>This PR is known to contain the changes/issues listed in GroundTruthChanges.</Note>
         <Title>{pr_title}</Title>
@@ -170,7 +183,9 @@ Your task is to evaluate a predicted code review based on how accurately it iden
     </PredictedReview>
 </InputContext>
 
-<ReferenceData>
+"""
+
+EVAL_CHANGE_TAIL = """<ReferenceData>
     <ChangeCategoryDefinitions>
         <Description>Use these categories to classify any points identified in the <PredictedReview> and to understand the categories provided in <GroundTruthChanges>.</Description>
         <Categories>
@@ -279,6 +294,16 @@ Provide your evaluation **strictly** in the following JSON format. Do not includ
 }}
 """
 
+EVAL_CHANGE_PROMPT = EVAL_CHANGE_HEAD + EVAL_CHANGE_CONTEXT + EVAL_CHANGE_TAIL
+
+# --prompt-layout prefix: the instructions, reference data and output format are the same for every instance, they
+# are sent first as the system message so that the provider prompt cache serves them after the first request; the
+# instance fields follow in the user message. inline is the original single message, with the fields in the middle.
+PROMPT_LAYOUTS = ("prefix", "inline")
+EVAL_CLEAN_PREFIX = (EVAL_CLEAN_HEAD + EVAL_CLEAN_TAIL).format()
+EVAL_CHANGE_PREFIX = (EVAL_CHANGE_HEAD + EVAL_CHANGE_TAIL).format()
+EVAL_INSTANCE_SUFFIX = "Evaluate the <PredictedReview> of the <InputContext> above following the <EvaluationInstructions>, and answer in the <OutputFormat>."
+
 def load_jsonl(path):
     with open(path, "r") as f:
         data = [json.loads(line) for line in f.readlines()]
@@ -300,7 +325,7 @@ def load_json(path):
         data = json.load(f)
     return data
 
-def create_clean_pr_prompt(item):
+def create_clean_pr_prompt(item, template=EVAL_CLEAN_PROMPT):
     instance = item['instance']
     pred = item['pred']
     pr_title = instance["pr_title"]
@@ -310,7 +335,7 @@ def create_clean_pr_prompt(item):
     # pr_timeline = instance["pr_timeline"] 
     pred_review = pred["review"]
     
-    prompt = EVAL_CLEAN_PROMPT.format(
+    prompt = template.format(
         pr_title=pr_title,
         pr_statement=pr_statement,
         pred_review=pred_review,
@@ -408,7 +433,7 @@ def verify_clean_pr_answer(result, logger):
         return None
 
 
-def create_change_pr_prompt(item):
+def create_change_pr_prompt(item, template=EVAL_CHANGE_PROMPT):
     instance = item['instance']
     pred = item['pred']
     pr_title = instance["pr_title"]
@@ -448,7 +473,7 @@ def create_change_pr_prompt(item):
     ground_truth_reviews = "\n".join(ground_truth_reviews)
     changes_description = "\n".join(changes_description)
 
-    prompt = EVAL_CHANGE_PROMPT.format(
+    prompt = template.format(
         pr_title=pr_title,
         pr_statement=pr_statement,
         changes_description=changes_description,
@@ -614,22 +639,42 @@ def fix_change_type(instance):
         change['change_type'] = change['change_type'].split(" ")[0]
     return instance
 
-def evaluate_one(args, item, logger):
+def create_eval_messages(item, layout="prefix"):
+    """ :returns (messages, response_format) of the judge request, normalizing the item in place """
     # system_message = "You are a helpful assistant."
     item['pred']['review'] = item['pred']['review'].replace("’", "'")
     item['instance'] = fix_change_type(item['instance'])
-    system_message = None
-    # import pdb; pdb.set_trace()
-    change_introduced = item['instance']['change_introduced']
-    if change_introduced:
-        prompt, output_structure = create_change_pr_prompt(item)
+    if layout == "inline":
+        if item['instance']['change_introduced']:
+            prompt, output_structure = create_change_pr_prompt(item)
+        else:
+            prompt, output_structure = create_clean_pr_prompt(item)
+        return create_messages(message=prompt, system_message=None), output_structure
+
+    if item['instance']['change_introduced']:
+        context, output_structure = create_change_pr_prompt(item, template=EVAL_CHANGE_CONTEXT)
+        system_message = EVAL_CHANGE_PREFIX
     else:
-        prompt, output_structure = create_clean_pr_prompt(item)
-    instance_id = item['instance']['instance_id']
+        context, output_structure = create_clean_pr_prompt(item, template=EVAL_CLEAN_CONTEXT)
+        system_message = EVAL_CLEAN_PREFIX
     messages = create_messages(
-        message=prompt,
+        message=context + EVAL_INSTANCE_SUFFIX,
         system_message=system_message
     )
+    return messages, output_structure
+
+
+def verify_eval_answer(item, response, logger):
+    # Determine which parser to use based on whether changes were introduced
+    if item['instance']['change_introduced']:
+        return verify_change_pr_answer(response, item['instance'], logger)
+    return verify_clean_pr_answer(response, logger)
+
+
+def evaluate_one(args, item, logger):
+    # import pdb; pdb.set_trace()
+    messages, output_structure = create_eval_messages(item, args.prompt_layout)
+    instance_id = item['instance']['instance_id']
     # logger.debug(f"Sending request for instance {instance_id} ...")
     # logger.debug(f"Prompt: \n{prompt}")
     result = None # Initialize result
@@ -649,12 +694,7 @@ def evaluate_one(args, item, logger):
             continue # Try again
         # logger.debug(f"Received response for instance {instance_id}: {response}")
 
-        # Determine which parser to use based on whether changes were introduced
-        if change_introduced:
-            result = verify_change_pr_answer(response, item['instance'], logger)
-        else:
-            result = verify_clean_pr_answer(response, logger)
-
+        result = verify_eval_answer(item, response, logger)
         if result is not None:
             # logger.debug(f"Successfully parsed answer for instance {instance_id} (Attempt {i+1})")
             break # Exit loop if parsing is successful
@@ -664,7 +704,92 @@ def evaluate_one(args, item, logger):
             # messages.append({"role": "assistant", "content": response})
             # messages.append({"role": "user", "content": "Parsing failed. Please provide the output strictly in the specified JSON format."})
 
+    return build_eval_result(item, messages, response, result, logger)
 
+
+async def evaluate_one_async(args, item, logger, dispatcher):
+    """ evaluate_one with the judge request awaited on the dispatcher loop """
+    messages, output_structure = create_eval_messages(item, args.prompt_layout)
+    instance_id = item['instance']['instance_id']
+    result = None
+    response = None
+    for i in range(3):
+        response = await dispatcher.achat(args.model, messages, temperature=args.temperature, max_tokens=args.max_tokens,
+                                          response_format=output_structure, max_retries=5)
+        if response is None:
+            logger.warning(f"Failed to get response for instance {instance_id} (Attempt {i+1})")
+            continue
+        result = verify_eval_answer(item, response, logger)
+        if result is not None:
+            break
+        logger.warning(f"Failed to parse answer for instance {instance_id} (Attempt {i+1}) and retrying...")
+
+    return build_eval_result(item, messages, response, result, logger)
+
+
+def cascade_check(item, result):
+    """ :returns why the verdict of the cheap judge needs the expensive one (--cascade-model), None when it holds up """
+    if (result['identified_as_good'] == 'YES') != looks_approved(item['pred']['review']):
+        return "stance disagrees with the review"
+    if item['instance']['change_introduced']:
+        if len(result['gt_points']) != len(item['instance']['changes']):
+            return "missing ground truth verdicts"
+        pred_ids = {point['id'] for point in result['pred_points']}
+        for gt_point in result['gt_points']:
+            if gt_point['hit'].upper() == 'YES' and gt_point['hit_by'] not in pred_ids:
+                return f"{gt_point['id']} hit by an unknown point"
+    elif result['identified_as_good'] == 'YES' and any(point['severity_score'] >= 7 for point in result['pred_points']):
+        return "approved with a severe point"
+    return None
+
+
+def verdict_summary(result):
+    """ What calibration_report compares between the tiers """
+    return {
+        "stance": result['identified_as_good'],
+        "hits": {gt_point['id']: gt_point['hit'].upper() for gt_point in result.get('gt_points', [])},
+        "pred_count": len(result['pred_points']),
+    }
+
+
+def evaluate_batch(args, tasks, logger):
+    """
+    --batch-mode: the judge requests of all the tasks go through the provider batch API, the tasks whose answer
+    doesn't verify are sent again in the next round, up to 3 rounds as in evaluate_one.
+    :returns the results in the order of the tasks, None for the failed ones
+    """
+    runner = BatchRunner(args.output_file + ".batch", args.batch_api_base or OPENAI_API_BASE[0], OPENAI_API_KEY[0],
+                         poll_interval=args.batch_poll_interval)
+    # resumed runs (the default without --overwrite) only pass the predictions not judged yet, see prediction_ids
+    items = dict(zip(prediction_ids(tasks), tasks))
+    requests = {}
+    for custom_id, item in items.items():
+        messages, output_structure = create_eval_messages(item, args.prompt_layout)
+        requests[custom_id] = (messages, output_structure)
+    results = {}
+    pending = list(items)
+    for i in range(3):
+        if not pending:
+            break
+        responses = runner.run(f"judge-{i}", [batch_request(custom_id, args.model, requests[custom_id][0], args.temperature,
+                                                            args.max_tokens, requests[custom_id][1])
+                                              for custom_id in pending])
+        for custom_id in pending:
+            if responses[custom_id] is None:
+                continue
+            result = verify_eval_answer(items[custom_id], responses[custom_id], logger)
+            if result is not None:
+                results[custom_id] = build_eval_result(items[custom_id], requests[custom_id][0], responses[custom_id], result, logger)
+        pending = [custom_id for custom_id in pending if custom_id not in results]
+        logger.info(f"Batch round {i+1}: {len(results)}/{len(items)} instances evaluated")
+    for custom_id in pending:
+        logger.error(f"Failed to get and parse answer for instance {items[custom_id]['instance']['instance_id']} after 3 batch rounds.")
+    return [results.get(custom_id) for custom_id in items]
+
+
+def build_eval_result(item, messages, response, result, logger):
+    change_introduced = item['instance']['change_introduced']
+    instance_id = item['instance']['instance_id']
     if result is None:
         logger.error(f"Failed to get and parse answer for instance {instance_id} after 3 attempts.")
         # Store the last failed response if needed for debugging
@@ -989,37 +1114,67 @@ def evaluate(args):
     
     tasks = [{'pred': pred, 'instance': dataset_dict[pred['instance_id']]} for pred in predictions]
     
+    # each result is appended to the checkpoint as soon as it is judged, a rerun resumes from it unless --overwrite
     cache_file = args.output_file + ".tmp.jsonl"
-    if os.path.exists(cache_file) and not args.overwrite:
-        results = load_jsonl(cache_file)
-        logger.info(f"Loaded {len(results)} results from cache file")
-        finished_instance_ids = [result['instance_id'] for result in results]
-        tasks = [task for task in tasks if task['pred']['instance_id'] not in finished_instance_ids]
-    else:
-        with open(cache_file, "w") as f:
-            f.write("")
-        results = []
+    checkpoint = EvalCheckpoint(cache_file, resume=not args.overwrite)
+    if checkpoint.resumed:
+        logger.info(f"Loaded {checkpoint.resumed} results from cache file")
+        tasks = checkpoint.pending(tasks)
     
-    file_lock = threading.Lock()
+    judge_one, judge_one_async = evaluate_one, evaluate_one_async
+    if getattr(args, "cascade_model", None) is not None:
+        judge_one = partial(evaluate_cascade, evaluate_one=evaluate_one, check=cascade_check, summarize=verdict_summary)
+        judge_one_async = partial(evaluate_cascade_async, evaluate_one_async=evaluate_one_async, check=cascade_check,
+                                  summarize=verdict_summary)
+
     def process_item(item):
-        result = evaluate_one(args, item, logger)
+        with llm_context(stage="evaluation", instance_id=item['instance']['instance_id']):
+            result = judge_one(args, item, logger)
         if result is not None:
-            with file_lock:
-                with open(cache_file, "a") as f:
-                    f.write(json.dumps(result) + "\n")
-
-    with ThreadPoolExecutor(max_workers=args.num_threads) as executor:
-        futures = [executor.submit(process_item, item) for item in tasks]
-        for future in tqdm(as_completed(futures), total=len(tasks), desc="Processing"):
-            future.result()
+            checkpoint.append(result)
+
+    if getattr(args, "batch_mode", False):
+        for result in evaluate_batch(args, tasks, logger):
+            if result is not None:
+                checkpoint.append(result)
+    elif getattr(args, "async_dispatch", False):
+        # all the items in flight on the dispatcher loop, bounded by its concurrency limits instead of num_threads
+        dispatcher = configure_dispatcher(args.max_concurrency, parse_model_limits(args.model_concurrency))
+        async def process_item_async(item):
+            with llm_context(stage="evaluation", instance_id=item['instance']['instance_id']):
+                result = await judge_one_async(args, item, logger, dispatcher)
+            if result is not None:
+                checkpoint.append(result)
+        for _ in tqdm(dispatcher.map(process_item_async, tasks), total=len(tasks), desc="Processing"):
+            pass
+        logger.info(f"Max LLM requests in flight: {dispatcher.max_in_flight}")
+    else:
+        with ThreadPoolExecutor(max_workers=args.num_threads) as executor:
+            futures = [executor.submit(process_item, item) for item in tasks]
+            for future in tqdm(as_completed(futures), total=len(tasks), desc="Processing"):
+                future.result()
     
     # for item in tqdm(tasks, total=len(tasks), desc="Processing"):
     #     process_item(item)
     
-    results = load_jsonl(cache_file)
-    
+    usage = llm_usage.get(args.model)
+    if usage['calls']:
+        logger.info(f"Prompt tokens cached by the provider: {usage['cached_tokens']}/{usage['prompt_tokens']}"
+                    f" ({usage['cached_ratio']:.1%}) over {usage['calls']} requests")
+
+    save_analysis(args, checkpoint.load())
+    logger.info(f"Finished processing {len(dataset)} instances")
+
+
+def save_analysis(args, results):
+    """ analyze_result over the judged results, written to the output file """
     analysis_results = analyze_result(results)
     logger.info(f"Analysis Results: \n{json.dumps(analysis_results, indent=4)}")
+
+    if any('judge_tier' in result for result in results):
+        report = calibration_report(results)
+        logger.info(f"Cascade Calibration: \n{json.dumps(report, indent=4)}")
+        save_json(report, args.output_file + ".calibration.json")
     
     save_result = {
         "analysis_results": analysis_results,
@@ -1027,7 +1182,6 @@ def evaluate(args):
     }
     
     save_json(save_result, args.output_file)
-    logger.info(f"Finished processing {len(dataset)} instances")
     logger.info(f"Output File: {args.output_file}")
 
 
@@ -1043,10 +1197,38 @@ if __name__ == "__main__":
     parser.add_argument("--num-threads", default=1, type=int, help="Number of threads")
     parser.add_argument("--temperature", default=0.0, type=float, help="Temperature")
     parser.add_argument("--max-tokens", default=8192, type=int, help="Max tokens")
+    parser.add_argument("--llm-cache", type=str, help="SQLite cache of the LLM answers, reused by the next runs")
+    parser.add_argument("--llm-cache-replay", action="store_true", help="Only replay the answers in --llm-cache, never call the API")
+    parser.add_argument("--batch-mode", action="store_true", help="Send the requests through the provider batch API, resumable from <output-file>.batch")
+    parser.add_argument("--batch-api-base", type=str, help="Base URL of the batch API (default: the first OPENAI_API_BASE)")
+    parser.add_argument("--batch-poll-interval", default=60, type=float, help="Seconds between two batch status checks")
+    parser.add_argument("--llm-metrics", type=str, help="Metrics JSONL of the LLM calls, see llm_metrics.py summarize")
+    parser.add_argument("--llm-timeout", type=float, help="Timeout in seconds of each LLM request attempt (default SWRBENCH_LLM_TIMEOUT or 600)")
+    parser.add_argument("--hedge-budget", type=float, help="Max ratio of LLM requests duplicated on another endpoint when slower than the p95 latency (0 disables)")
+    parser.add_argument("--async-dispatch", action="store_true", help="Send the requests with async_run_chat on a single event loop instead of --num-threads threads")
+    parser.add_argument("--max-concurrency", default=DEFAULT_MAX_CONCURRENCY, type=int, help="Max LLM requests in flight with --async-dispatch")
+    parser.add_argument("--model-concurrency", nargs="+", help="Max LLM requests in flight per model with --async-dispatch, as <model>=<limit>")
+    parser.add_argument("--cascade-model", type=str, help="Cheap judge model tried first, --model only judges the instances it is unsure about")
+    parser.add_argument("--calibration-rate", default=0.05, type=float, help="Share of the cheap verdicts also judged by --model for the calibration report")
+    parser.add_argument("--prompt-layout", default="prefix", choices=PROMPT_LAYOUTS, help="prefix: static judge instructions first, cacheable by the provider; inline: original single prompt")
     parser.add_argument("--overwrite", action="store_true", help="Overwrite cache file")
+    parser.add_argument("--analyze-only", action="store_true", help="Only analyze the results in the cache file of --output-file, without judging")
     args = parser.parse_args()
+    if args.cascade_model and args.batch_mode:
+        parser.error("--cascade-model can't be combined with --batch-mode")
+
+    if args.llm_cache:
+        set_llm_cache(args.llm_cache, replay=args.llm_cache_replay)
+    if args.llm_metrics:
+        set_llm_metrics(args.llm_metrics, stage="evaluation")
+    configure_llm_calls(timeout=args.llm_timeout, hedge_budget=args.hedge_budget)
 
     # evaluate
-    evaluate(args)
+    if args.analyze_only:
+        if not os.path.exists(args.output_file + ".tmp.jsonl"):
+            parser.error(f"No cache file {args.output_file}.tmp.jsonl to analyze")
+        save_analysis(args, load_checkpoint(args.output_file + ".tmp.jsonl"))
+    else:
+        evaluate(args)
     
 # TODO: Add actual modified location and code snippet
\ No newline at end of file
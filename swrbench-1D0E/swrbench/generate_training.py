@@ -6,6 +6,7 @@ import json
 import logging
 
 from utils import run_chat, safe_parse_time, retry_function, save_jsonl, load_jsonl, save_json, load_json
+from llm_metrics import llm_context
 import pr_agent
 
 
@@ -228,13 +229,14 @@ def process_item(item_details_tuple):
             }
         }
         
-        json_str = run_chat(
-            chat_model_to_use, 
-            [{"role": "user", "content": current_prompt_str}], 
-            temperature=chat_temp, 
-            response_format=response_format,
-            max_retries=3
-        )
+        with llm_context(stage="training", instance_id=item_id):
+            json_str = run_chat(
+                chat_model_to_use, 
+                [{"role": "user", "content": current_prompt_str}], 
+                temperature=chat_temp, 
+                response_format=response_format,
+                max_retries=3
+            )
         result = json.loads(json_str)
             
         assert result['yaml_code_review_report'] is not None
@@ -11,6 +11,7 @@ import threading
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from utils import run_chat
+from llm_metrics import llm_context
 
 def load_jsonl(file_path: str) -> List[Dict]:
     with open(file_path, "r") as f:
@@ -241,10 +242,11 @@ def generate(args):
     
     def process_item(item):
         # import pdb; pdb.set_trace()
-        if args.refine:
-            generate_task_refine(args, item, logger, file_lock)
-        else:
-            generate_task_base(args, item, logger, file_lock)
+        with llm_context(stage="generation", instance_id=item["instance_id"]):
+            if args.refine:
+                generate_task_refine(args, item, logger, file_lock)
+            else:
+                generate_task_base(args, item, logger, file_lock)
         return True
 
     with ThreadPoolExecutor(max_workers=args.num_threads) as executor:
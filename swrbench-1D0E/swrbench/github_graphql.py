@@ -0,0 +1,345 @@
+import re
+import logging
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+import requests
+
+from utils import build_pr_timeline
+
+
+GITHUB_GRAPHQL_URL = 'https://api.github.com/graphql'
+GITHUB_REST_URL = 'https://api.github.com'
+
+# number of PRs fetched by a single GraphQL query
+GRAPHQL_BATCH_SIZE = 10
+PAGE_SIZE = 100
+
+# timeline item types returned by the REST issue events endpoint
+ISSUE_EVENT_TYPES = [
+    'ADDED_TO_PROJECT_EVENT', 'ASSIGNED_EVENT', 'BASE_REF_CHANGED_EVENT', 'BASE_REF_FORCE_PUSHED_EVENT',
+    'CLOSED_EVENT', 'COMMENT_DELETED_EVENT', 'CONNECTED_EVENT', 'CONVERT_TO_DRAFT_EVENT',
+    'CONVERTED_NOTE_TO_ISSUE_EVENT', 'DEMILESTONED_EVENT', 'DISCONNECTED_EVENT', 'HEAD_REF_DELETED_EVENT',
+    'HEAD_REF_FORCE_PUSHED_EVENT', 'HEAD_REF_RESTORED_EVENT', 'LABELED_EVENT', 'LOCKED_EVENT',
+    'MARKED_AS_DUPLICATE_EVENT', 'MENTIONED_EVENT', 'MERGED_EVENT', 'MILESTONED_EVENT',
+    'MOVED_COLUMNS_IN_PROJECT_EVENT', 'READY_FOR_REVIEW_EVENT', 'REFERENCED_EVENT', 'REMOVED_FROM_PROJECT_EVENT',
+    'RENAMED_TITLE_EVENT', 'REOPENED_EVENT', 'REVIEW_DISMISSED_EVENT', 'REVIEW_REQUEST_REMOVED_EVENT',
+    'REVIEW_REQUESTED_EVENT', 'SUBSCRIBED_EVENT', 'UNASSIGNED_EVENT', 'UNLABELED_EVENT', 'UNLOCKED_EVENT',
+    'UNMARKED_AS_DUPLICATE_EVENT', 'UNSUBSCRIBED_EVENT',
+]
+
+# GraphQL typename -> REST event name, when it is not the snake_case typename without "Event"
+ISSUE_EVENT_NAMES = {
+    'RenamedTitleEvent': 'renamed',
+}
+
+COMMIT_AUTHOR_FIELDS = 'name email date'
+
+REVIEW_COMMENT_FIELDS = ('databaseId replyTo { databaseId } author { login } body createdAt path diffHunk '
+                         'startLine originalStartLine line originalLine position originalPosition')
+
+# paginated connections of a pull request: name -> (arguments, node fields)
+PR_CONNECTIONS = OrderedDict([
+    ('timelineItems', (f'itemTypes: [{", ".join(ISSUE_EVENT_TYPES)}]', '__typename')),
+    ('commits', ('', f'commit {{ oid message author {{ {COMMIT_AUTHOR_FIELDS} }} committer {{ {COMMIT_AUTHOR_FIELDS} }} }}')),
+    ('comments', ('', 'databaseId author { login } body createdAt')),
+    ('reviewThreads', ('', 'id diffSide startDiffSide subjectType '
+                           f'comments(first: {PAGE_SIZE}) {{ pageInfo {{ hasNextPage endCursor }} nodes {{ {REVIEW_COMMENT_FIELDS} }} }}')),
+    ('reviews', ('', 'databaseId author { login } body state submittedAt')),
+])
+
+PR_FIELDS = ('number title url body createdAt mergedAt merged state baseRefOid '
+             'author { login } headRepository { nameWithOwner } mergeCommit { oid } potentialMergeCommit { oid } '
+             f'labels(first: {PAGE_SIZE}) {{ nodes {{ name }} }}')
+
+
+class GraphQLError(Exception):
+    pass
+
+
+class UnknownObjectException(GraphQLError):
+    """ The PR does not exist, same name as the PyGithub exception so that the ERROR rows are the same """
+    pass
+
+
+def _connection_query(name, after=None):
+    arguments, fields = PR_CONNECTIONS[name]
+    arguments = ', '.join(a for a in [f'first: {PAGE_SIZE}', f'after: "{after}"' if after else '', arguments] if a)
+    total_count = 'totalCount ' if name == 'commits' else ''
+    return f'{name}({arguments}) {{ {total_count}pageInfo {{ hasNextPage endCursor }} nodes {{ {fields} }} }}'
+
+
+def _pr_query_fields():
+    return PR_FIELDS + ' ' + ' '.join(_connection_query(name) for name in PR_CONNECTIONS)
+
+
+def actor_login(actor):
+    # deleted accounts are returned as null, the REST API reports them as "ghost"
+    return actor['login'] if actor else 'ghost'
+
+
+def utc_isoformat(date):
+    if not date:
+        return None
+    return datetime.fromisoformat(date.replace('Z', '+00:00')).astimezone(timezone.utc).isoformat()
+
+
+def _event_name(typename):
+    if typename in ISSUE_EVENT_NAMES:
+        return ISSUE_EVENT_NAMES[typename]
+    return re.sub(r'(?<!^)(?=[A-Z])', '_', re.sub(r'Event$', '', typename)).lower()
+
+
+class RestDiffFetcher:
+    """
+    Fetch the file patches of a commit from the REST API. GraphQL does not expose the commit diffs, so this is
+    the only per-commit request left when collecting a PR.
+    """
+
+    def __init__(self, session, token, repo_name, rest_url=GITHUB_REST_URL, token_pool=None, http_cache=None, timeout=300):
+        self.session = session
+        self.http_cache = http_cache
+        self.token = token
+        self.token_pool = token_pool
+        self.repo_name = repo_name
+        self.rest_url = rest_url.rstrip('/')
+        self.timeout = timeout
+
+    def __call__(self, sha):
+        url = f'{self.rest_url}/repos/{self.repo_name}/commits/{sha}'
+        headers = {'Authorization': f'Bearer {self.token}'}
+        if self.http_cache:
+            response = self.http_cache.get(self.session, url, headers=headers, timeout=self.timeout)
+        else:
+            response = self.session.get(url, headers=headers, timeout=self.timeout)
+        if self.token_pool:
+            self.token_pool.update_from_headers(self.token, response.headers)
+        response.raise_for_status()
+        return [{'file': f['filename'], 'patch': f['patch']} for f in response.json().get('files', []) if f.get('patch')]
+
+
+class GraphQLPRFetcher:
+    """
+    Collect the PRs of a repository with the GitHub GraphQL API. The metadata, issue events, commits, comments,
+    review threads and reviews of a batch of PRs are fetched with a single query (one alias per PR), and the
+    connections with more than PAGE_SIZE items are completed with follow-up queries. The result of each PR is the
+    same pr_info dict built by collect_repo_pr.get_pr_info() with PyGithub.
+    """
+
+    def __init__(self, token, repo_name, graphql_url=GITHUB_GRAPHQL_URL, rest_url=GITHUB_REST_URL,
+                 diff_fetcher=None, local_diffs=None, session=None, token_pool=None, http_cache=None, timeout=300):
+        """
+        :param token: GitHub token
+        :param repo_name: full name of the repository (owner/name)
+        :param diff_fetcher: callable sha -> [{'file', 'patch'}], defaults to RestDiffFetcher
+        :param local_diffs: LocalDiffFetcher computing the diffs of all the commits of a PR at once, diff_fetcher
+            is used only when they are not available locally
+        :param session: requests.Session used for all the calls
+        :param token_pool: TokenPool updated with the rate limit headers of each response
+        :param http_cache: HTTPCache of the REST commit diffs (GraphQL queries are POSTs and are never cached)
+        """
+        self.token = token
+        self.repo_name = repo_name
+        self.owner, self.name = repo_name.split('/')
+        self.graphql_url = graphql_url
+        self.timeout = timeout
+        self.session = session or requests.Session()
+        self.token_pool = token_pool
+        self.local_diffs = local_diffs
+        self.diff_fetcher = diff_fetcher or RestDiffFetcher(self.session, token, repo_name, rest_url, token_pool, http_cache, timeout)
+
+    def query(self, query, variables=None):
+        response = self.session.post(self.graphql_url,
+                                     json={'query': query, 'variables': variables or {}},
+                                     headers={'Authorization': f'Bearer {self.token}'},
+                                     timeout=self.timeout)
+        if self.token_pool:
+            self.token_pool.update_from_headers(self.token, response.headers)
+        response.raise_for_status()
+        return response.json()
+
+    def _repository(self, fields):
+        result = self.query(
+            f'query($owner: String!, $name: String!) {{ repository(owner: $owner, name: $name) {{ {fields} }} }}',
+            {'owner': self.owner, 'name': self.name})
+        return result.get('data') or {}, result.get('errors') or []
+
+    def _fetch_remaining(self, number, name, connection):
+        """ Follow the cursor of a connection until its last page """
+        nodes = list(connection['nodes'])
+        page_info = connection['pageInfo']
+        while page_info['hasNextPage']:
+            data, errors = self._repository(
+                f'pullRequest(number: {number}) {{ {_connection_query(name, page_info["endCursor"])} }}')
+            if errors:
+                raise GraphQLError('; '.join(e.get('message', str(e)) for e in errors))
+            connection = data['repository']['pullRequest'][name]
+            nodes.extend(connection['nodes'])
+            page_info = connection['pageInfo']
+        return nodes
+
+    def _fetch_thread_comments(self, thread):
+        """ All the comments of a review thread, following the cursor of its comments connection """
+        connection = thread['comments']
+        nodes = list(connection['nodes'])
+        while connection['pageInfo']['hasNextPage']:
+            result = self.query(
+                'query($id: ID!) { node(id: $id) { ... on PullRequestReviewThread { '
+                f'comments(first: {PAGE_SIZE}, after: "{connection["pageInfo"]["endCursor"]}") '
+                f'{{ pageInfo {{ hasNextPage endCursor }} nodes {{ {REVIEW_COMMENT_FIELDS} }} }} }} }} }}',
+                {'id': thread['id']})
+            if result.get('errors'):
+                raise GraphQLError('; '.join(e.get('message', str(e)) for e in result['errors']))
+            connection = result['data']['node']['comments']
+            nodes.extend(connection['nodes'])
+        return nodes
+
+    def fetch_prs(self, pr_ids):
+        """
+        Fetch a batch of PRs with a single query.
+
+        :param pr_ids: list of PR numbers, at most GRAPHQL_BATCH_SIZE
+        :returns dict PR number -> pr_info, or the exception raised for that PR
+        """
+        fields = _pr_query_fields()
+        data, errors = self._repository(' '.join(f'pr_{pr_id}: pullRequest(number: {pr_id}) {{ {fields} }}' for pr_id in pr_ids))
+
+        errors_by_alias = {}
+        for error in errors:
+            path = error.get('path') or []
+            if len(path) >= 2:
+                errors_by_alias[path[1]] = error
+            else:
+                raise GraphQLError(error.get('message', str(error)))
+
+        repository = data.get('repository') or {}
+        results = {}
+        for pr_id in pr_ids:
+            alias = f'pr_{pr_id}'
+            node = repository.get(alias)
+            try:
+                if node is None:
+                    error = errors_by_alias.get(alias, {})
+                    if error.get('type') == 'NOT_FOUND' or not error:
+                        raise UnknownObjectException(error.get('message', 'Not Found'))
+                    raise GraphQLError(error.get('message', str(error)))
+                results[pr_id] = self.build_pr_info(node)
+            except Exception as e:
+                logging.warning(f"Failed to fetch PR {self.repo_name}#{pr_id}: {e}")
+                results[pr_id] = e
+        return results
+
+    def build_pr_info(self, node):
+        number = node['number']
+        connections = {name: self._fetch_remaining(number, name, node[name]) for name in PR_CONNECTIONS}
+        created_at = utc_isoformat(node['createdAt'])
+        merge_commit = node['mergeCommit'] or node['potentialMergeCommit']
+
+        pr_info = {
+            'repo': node['headRepository']['nameWithOwner'] if node['headRepository'] else None,
+            'number': number,
+            'title': node['title'],
+            'user': actor_login(node['author']),
+            'url': node['url'],
+            'commits': node['commits']['totalCount'],
+            'merge_commit_sha': merge_commit['oid'] if merge_commit else None,
+            'merged': node['merged'],
+            'created_at': created_at,
+            'merged_at': utc_isoformat(node['mergedAt']),
+            'state': 'open' if node['state'] == 'OPEN' else 'closed',
+            'labels': [label['name'] for label in node['labels']['nodes']],
+            'issue_events': [_event_name(event['__typename']) for event in connections['timelineItems']],
+            'base_commit': node['baseRefOid'],
+            'timeline': []
+        }
+
+        timeline_dict = OrderedDict()
+
+        if node['body']:
+            key = f"description_{created_at}"
+            timeline_dict[key] = {
+                'type': 'description',
+                'user': pr_info['user'],
+                'body': node['body'],
+                'created_at': created_at
+            }
+
+        shas = [item['commit']['oid'] for item in connections['commits']]
+        commit_diffs = self.local_diffs.pr_diffs(number, shas) if self.local_diffs else None
+        if commit_diffs is None:
+            commit_diffs = {sha: self.diff_fetcher(sha) for sha in shas}
+
+        for item in connections['commits']:
+            commit = item['commit']
+            key = f"commit_{commit['oid']}"
+            diff = commit_diffs[commit['oid']]
+            timeline_dict[key] = {
+                'type': 'commit',
+                'sha': commit['oid'],
+                'message': commit['message'],
+                'author': commit['author']['name'],
+                'author_email': commit['author']['email'],
+                'author_raw_date': utc_isoformat(commit['author']['date']),
+                'author_date': utc_isoformat(commit['author']['date']),
+                'committer': commit['committer']['name'],
+                'committer_email': commit['committer']['email'],
+                'raw_date': utc_isoformat(commit['committer']['date']),
+                'date': utc_isoformat(commit['committer']['date']),
+                'diff_text': "\n".join([f"{d['file']}\n{d['patch']}" for d in diff]),
+                'diff': diff
+            }
+
+        for comment in connections['comments']:
+            key = f"comment_{comment['databaseId']}"
+            timeline_dict[key] = {
+                'type': 'comment',
+                'id': comment['databaseId'],
+                'user': actor_login(comment['author']),
+                'body': comment['body'],
+                'created_at': utc_isoformat(comment['createdAt'])
+            }
+
+        review_comments_dict = {}
+        for thread in connections['reviewThreads']:
+            for comment in self._fetch_thread_comments(thread):
+                comment_dict = {
+                    'type': 'review_comment',
+                    'id': comment['databaseId'],
+                    'in_reply_to_id': comment['replyTo']['databaseId'] if comment['replyTo'] else None,
+                    'user': actor_login(comment['author']),
+                    'body': comment['body'],
+                    'created_at': utc_isoformat(comment['createdAt']),
+                    'path': comment['path'],
+                    'diff_hunk': comment['diffHunk'],
+                    'start_line': comment['startLine'],
+                    'original_start_line': comment['originalStartLine'],
+                    'start_side': thread['startDiffSide'],
+                    'line': comment['line'],
+                    'original_line': comment['originalLine'],
+                    'side': thread['diffSide'],
+                    'original_position': comment['originalPosition'],
+                    'position': comment['position'],
+                    'subject_type': thread['subjectType'].lower() if thread['subjectType'] else None,
+                    'reply': []
+                }
+                comment_dict['reply'].append({
+                    'id': comment_dict['id'],
+                    'user': comment_dict['user'],
+                    'body': comment_dict['body'],
+                    'created_at': comment_dict['created_at']
+                })
+                review_comments_dict[comment_dict['id']] = comment_dict
+
+        for review in connections['reviews']:
+            key = f"review_{review['databaseId']}"
+            timeline_dict[key] = {
+                'type': 'review',
+                'id': review['databaseId'],
+                'user': actor_login(review['author']),
+                'body': review['body'],
+                'state': review['state'],
+                'created_at': utc_isoformat(review['submittedAt'])
+            }
+
+        pr_info['timeline'] = build_pr_timeline(timeline_dict, review_comments_dict)
+        return pr_info
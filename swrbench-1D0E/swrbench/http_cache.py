@@ -0,0 +1,171 @@
+import os
+import re
+import json
+import time
+import asyncio
+import hashlib
+import threading
+
+
+DEFAULT_CACHE_DIR = 'data/.http_cache'
+# responses younger than this are served without any request, older ones are revalidated with If-None-Match
+DEFAULT_TTL = 24 * 3600
+
+# headers kept with the cached body, the rate limit ones are never replayed
+STORED_HEADERS = ('content-type', 'link', 'etag', 'last-modified')
+
+
+def parse_link_header(value):
+    """ Same {rel: {'url', 'rel'}} dict returned by the .links of requests and httpx responses """
+    links = {}
+    for part in (value or '').split(','):
+        match = re.match(r'\s*<([^>]*)>\s*;\s*rel="?([^";]+)"?', part)
+        if match:
+            links[match.group(2)] = {'url': match.group(1), 'rel': match.group(2)}
+    return links
+
+
+class CachedResponse:
+    """ Response replayed from the cache, with the attributes used by the collectors """
+
+    status_code = 200
+
+    def __init__(self, content, headers):
+        self.content = content
+        self.headers = headers
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8')
+
+    @property
+    def links(self):
+        return parse_link_header(self.headers.get('link'))
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        pass
+
+
+class HTTPCache:
+    """
+    On-disk cache of GitHub GET responses, shared by every collection run using the same cache_dir.
+
+    Bodies are content-addressed (objects/<sha256>), so identical pages are stored once; each request (url + params,
+    not the token) points to its body with an entry holding the ETag/Last-Modified of the response. Entries younger
+    than ttl are replayed without any request, older ones are revalidated with If-None-Match/If-Modified-Since:
+    GitHub answers 304 without counting it against the rate limit, and the cached body is replayed.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, ttl=DEFAULT_TTL):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        # aget updates the counters from the worker threads doing its disk I/O
+        self.lock = threading.Lock()
+        os.makedirs(os.path.join(cache_dir, 'entries'), exist_ok=True)
+        os.makedirs(os.path.join(cache_dir, 'objects'), exist_ok=True)
+
+    def _entry_path(self, url, params=None):
+        key = url if not params else url + '?' + '&'.join(f'{k}={v}' for k, v in sorted(params.items()))
+        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, 'entries', digest[:2], digest + '.json')
+
+    def _object_path(self, digest):
+        return os.path.join(self.cache_dir, 'objects', digest[:2], digest)
+
+    @staticmethod
+    def _write_atomic(path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.{id(data)}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def lookup(self, url, params=None):
+        """ :returns the cache entry of the request, or None """
+        try:
+            with open(self._entry_path(url, params), 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not os.path.exists(self._object_path(entry['body'])):
+            return None
+        return entry
+
+    def is_fresh(self, entry):
+        return time.time() - entry['stored_at'] < self.ttl
+
+    @staticmethod
+    def conditional_headers(entry):
+        headers = {}
+        if entry['headers'].get('etag'):
+            headers['If-None-Match'] = entry['headers']['etag']
+        if entry['headers'].get('last-modified'):
+            headers['If-Modified-Since'] = entry['headers']['last-modified']
+        return headers
+
+    def replay(self, entry):
+        with open(self._object_path(entry['body']), 'rb') as f:
+            return CachedResponse(f.read(), entry['headers'])
+
+    def store(self, url, params, response):
+        """ Store a 200 response, returns it unchanged """
+        if response.status_code != 200:
+            return response
+        content = response.content
+        digest = hashlib.sha256(content).hexdigest()
+        if not os.path.exists(self._object_path(digest)):
+            self._write_atomic(self._object_path(digest), content)
+        headers = {k.lower(): v for k, v in response.headers.items() if k.lower() in STORED_HEADERS}
+        entry = {'url': url, 'params': params, 'headers': headers, 'body': digest, 'stored_at': time.time()}
+        self._write_atomic(self._entry_path(url, params), json.dumps(entry).encode('utf-8'))
+        return response
+
+    def refresh(self, url, params, entry):
+        """ The entry was revalidated by a 304, restart its ttl and replay it """
+        entry['stored_at'] = time.time()
+        self._write_atomic(self._entry_path(url, params), json.dumps(entry).encode('utf-8'))
+        return self.replay(entry)
+
+    def _count(self, name):
+        with self.lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _prepare(self, url, params, headers):
+        entry = self.lookup(url, params)
+        if entry is not None and self.is_fresh(entry):
+            self._count('hits')
+            return entry, self.replay(entry), headers
+        if entry is not None:
+            headers = {**(headers or {}), **self.conditional_headers(entry)}
+        return entry, None, headers
+
+    def _complete(self, url, params, entry, response):
+        if response.status_code == 304 and entry is not None:
+            self._count('revalidated')
+            return self.refresh(url, params, entry)
+        self._count('misses')
+        return self.store(url, params, response)
+
+    def get(self, session, url, params=None, headers=None, **kwargs):
+        """ session.get() through the cache, for requests sessions """
+        entry, cached, headers = self._prepare(url, params, headers)
+        if cached is not None:
+            return cached
+        return self._complete(url, params, entry, session.get(url, params=params, headers=headers, **kwargs))
+
+    async def aget(self, client, url, params=None, headers=None, **kwargs):
+        """ client.get() through the cache, for httpx async clients; the cache files are read and written in a thread """
+        entry, cached, headers = await asyncio.to_thread(self._prepare, url, params, headers)
+        if cached is not None:
+            return cached
+        response = await client.get(url, params=params, headers=headers, **kwargs)
+        return await asyncio.to_thread(self._complete, url, params, entry, response)
+
+    def stats(self):
+        return {'hits': self.hits, 'revalidated': self.revalidated, 'misses': self.misses}
@@ -0,0 +1,116 @@
+import copy
+import re
+import zlib
+from collections import Counter, defaultdict
+
+# explicit approvals in a predicted review, checked against the stance of the cheap judge
+APPROVAL_PATTERN = re.compile(
+    r"\b(lgtm|looks good( to me)?|approved?|ready to (be )?merged?|no (major |significant |obvious )?(issues|problems|defects) (were )?found)\b",
+    re.IGNORECASE,
+)
+
+
+def looks_approved(review):
+    return APPROVAL_PATTERN.search(review or "") is not None
+
+
+def in_calibration_sample(instance_id, rate):
+    """ Stable sample of about rate of the instances, the same one in every run """
+    return rate > 0 and zlib.crc32(instance_id.encode("utf-8")) % 10000 < rate * 10000
+
+
+def tag_verdict(result, tier, model, reason=None):
+    """ Record the tier that produced the verdict, and why the cheap one was not kept """
+    result["judge_tier"] = tier
+    result["judge_model"] = model
+    result["escalation_reason"] = reason
+    return result
+
+
+def _decide(item, cheap, check, calibration_rate):
+    if cheap is None:
+        return "cheap judge failed"
+    reason = check(item, cheap)
+    if reason is None and in_calibration_sample(item['instance']['instance_id'], calibration_rate):
+        return "calibration"
+    return reason
+
+
+def _finish(cheap, expensive, reason, summarize, cheap_model, model):
+    if expensive is None:
+        # keep the cheap verdict when it exists rather than losing the instance
+        return tag_verdict(cheap, "cheap", cheap_model, reason) if cheap is not None else None
+    expensive = tag_verdict(expensive, "expensive", model, reason)
+    if cheap is not None:
+        expensive["cascade"] = {"cheap": summarize(cheap), "expensive": summarize(expensive)}
+    return expensive
+
+
+def run_cascade(item, judge_cheap, judge, check, summarize, calibration_rate, cheap_model, model):
+    """
+    Judge the item with judge_cheap first; the verdict is kept unless check(item, verdict) returns a reason to
+    escalate, in which case the item is judged again with judge. A stable calibration_rate sample of the accepted
+    cheap verdicts is escalated too, so that calibration_report can compare the tiers.
+    """
+    cheap = judge_cheap(item)
+    reason = _decide(item, cheap, check, calibration_rate)
+    if reason is None:
+        return tag_verdict(cheap, "cheap", cheap_model)
+    return _finish(cheap, judge(item), reason, summarize, cheap_model, model)
+
+
+async def arun_cascade(item, judge_cheap, judge, check, summarize, calibration_rate, cheap_model, model):
+    """ run_cascade with coroutine judges """
+    cheap = await judge_cheap(item)
+    reason = _decide(item, cheap, check, calibration_rate)
+    if reason is None:
+        return tag_verdict(cheap, "cheap", cheap_model)
+    return _finish(cheap, await judge(item), reason, summarize, cheap_model, model)
+
+
+def _cheap_args(args):
+    cheap_args = copy.copy(args)
+    cheap_args.model = args.cascade_model
+    return cheap_args
+
+
+def evaluate_cascade(args, item, logger, evaluate_one, check, summarize):
+    """ evaluate_one(args, item, logger) of an evaluation module with --cascade-model first, escalated to --model by check """
+    cheap_args = _cheap_args(args)
+    return run_cascade(item, lambda item: evaluate_one(cheap_args, item, logger), lambda item: evaluate_one(args, item, logger),
+                       check, summarize, args.calibration_rate, cheap_args.model, args.model)
+
+
+async def evaluate_cascade_async(args, item, logger, dispatcher, evaluate_one_async, check, summarize):
+    """ evaluate_cascade with the evaluate_one_async(args, item, logger, dispatcher) of the module """
+    cheap_args = _cheap_args(args)
+    return await arun_cascade(item, lambda item: evaluate_one_async(cheap_args, item, logger, dispatcher),
+                              lambda item: evaluate_one_async(args, item, logger, dispatcher),
+                              check, summarize, args.calibration_rate, cheap_args.model, args.model)
+
+
+def calibration_report(results):
+    """
+    Compare the cheap and expensive verdicts of the instances judged by both tiers: on the calibration sample (an
+    unbiased estimate of the cheap tier) and on the escalated instances.
+    :returns dict with the verdicts per tier and the agreement per group
+    """
+    report = {"verdicts_by_tier": dict(Counter(result.get("judge_tier") for result in results if result))}
+    groups = defaultdict(list)
+    for result in results:
+        if result and "cascade" in result:
+            kind = "calibration" if result["escalation_reason"] == "calibration" else "escalated"
+            groups[kind].append(result["cascade"])
+    for kind, pairs in sorted(groups.items()):
+        stance = sum(pair["cheap"]["stance"] == pair["expensive"]["stance"] for pair in pairs)
+        gt_pairs = [(pair["cheap"]["hits"].get(gt_id), hit) for pair in pairs for gt_id, hit in pair["expensive"]["hits"].items()]
+        report[kind] = {
+            "instances": len(pairs),
+            "stance_agreement": round(stance / len(pairs), 4),
+            "gt_hit_agreement": round(sum(cheap == hit for cheap, hit in gt_pairs) / len(gt_pairs), 4) if gt_pairs else None,
+            "cheap_hits": sum(cheap == "YES" for cheap, _ in gt_pairs),
+            "expensive_hits": sum(hit == "YES" for _, hit in gt_pairs),
+            "cheap_pred_points": sum(pair["cheap"]["pred_count"] for pair in pairs),
+            "expensive_pred_points": sum(pair["expensive"]["pred_count"] for pair in pairs),
+        }
+    return report
@@ -0,0 +1,284 @@
+import os
+import json
+import time
+import uuid
+import hashlib
+import argparse
+import threading
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from loguru import logger
+
+from llm_clients import get_openai_client
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+COMPLETION_WINDOW = "24h"
+POLL_INTERVAL = 30
+FINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+
+def batch_request(custom_id, model, messages, temperature=None, max_tokens=None, response_format=None):
+    """ One line of a batch input file, with the chat completion body sent by run_chat """
+    body = {"model": model, "messages": messages}
+    for key, value in (("temperature", temperature), ("max_tokens", max_tokens), ("response_format", response_format)):
+        if value is not None:
+            body[key] = value
+    return {"custom_id": custom_id, "method": "POST", "url": BATCH_ENDPOINT, "body": body}
+
+
+def read_batch_output(path):
+    """ :returns dict custom_id -> answer, None for the requests that failed """
+    answers = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            response = row.get("response") or {}
+            answer = None
+            if not row.get("error") and response.get("status_code") == 200:
+                try:
+                    answer = response["body"]["choices"][0]["message"]["content"]
+                except (KeyError, IndexError, TypeError):
+                    answer = None
+            if answer is None:
+                logger.warning(f"Batch request {row.get('custom_id')} failed: {row.get('error') or response}")
+            answers[row["custom_id"]] = answer
+    return answers
+
+
+class BatchRunner:
+    """
+    Sends chat requests through the provider batch API (OpenAI compatible /v1/files and /v1/batches): writes the
+    input JSONL, uploads it, creates the batch, polls it and downloads the output into work_dir.
+
+    Every batch is named; the id of a submitted batch is saved in <name>.batch.json with a hash of its requests, so
+    running the same command again resumes polling instead of submitting (and paying for) the requests twice. A batch
+    saved for other requests (e.g. after a resume skipped some of them) is submitted again instead of being reused.
+    """
+
+    def __init__(self, work_dir, base_url, api_key, poll_interval=POLL_INTERVAL, completion_window=COMPLETION_WINDOW):
+        os.makedirs(work_dir, exist_ok=True)
+        self.work_dir = work_dir
+        self.client = get_openai_client(base_url, api_key)
+        self.poll_interval = poll_interval
+        self.completion_window = completion_window
+
+    def _path(self, name, suffix):
+        return os.path.join(self.work_dir, f"{name}.{suffix}")
+
+    @staticmethod
+    def fingerprint(requests):
+        """ sha256 of the requests, independent of their order """
+        lines = sorted(json.dumps(request, sort_keys=True, ensure_ascii=False) for request in requests)
+        return hashlib.sha256("\n".join(lines).encode("utf-8")).hexdigest()
+
+    def submit(self, name, requests):
+        input_path = self._path(name, "input.jsonl")
+        with open(input_path, "w", encoding="utf-8") as f:
+            for request in requests:
+                f.write(json.dumps(request, ensure_ascii=False) + "\n")
+        with open(input_path, "rb") as f:
+            input_file = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(input_file_id=input_file.id, endpoint=BATCH_ENDPOINT,
+                                           completion_window=self.completion_window)
+        with open(self._path(name, "batch.json"), "w", encoding="utf-8") as f:
+            json.dump({"batch_id": batch.id, "input_file_id": input_file.id, "requests": len(requests),
+                       "requests_sha256": self.fingerprint(requests)}, f)
+        logger.info(f"Submitted batch {name} ({batch.id}) with {len(requests)} requests")
+        return batch.id
+
+    def wait(self, batch_id):
+        while True:
+            batch = self.client.batches.retrieve(batch_id)
+            if batch.status in FINAL_STATUSES:
+                return batch
+            counts = batch.request_counts
+            progress = f" {counts.completed + counts.failed}/{counts.total}" if counts else ""
+            logger.info(f"Batch {batch_id} {batch.status}{progress}, polling again in {self.poll_interval}s")
+            time.sleep(self.poll_interval)
+
+    def run(self, name, requests):
+        """ :returns dict custom_id -> answer (None if the request failed) for all the requests """
+        output_path = self._path(name, "output.jsonl")
+        state_path = self._path(name, "batch.json")
+        state = None
+        if os.path.exists(state_path):
+            with open(state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            if state.get("requests_sha256") != self.fingerprint(requests):
+                logger.warning(f"Batch {name} ({state['batch_id']}) was submitted for other requests, submitting them again")
+                state = None
+        if state is None and os.path.exists(output_path):
+            # the output of another batch, its custom ids don't match these requests
+            os.remove(output_path)
+        if not os.path.exists(output_path):
+            if state is not None:
+                batch_id = state["batch_id"]
+                logger.info(f"Resuming batch {name} ({batch_id})")
+            else:
+                batch_id = self.submit(name, requests)
+            batch = self.wait(batch_id)
+            if batch.status != "completed":
+                logger.error(f"Batch {name} ({batch_id}) ended with status {batch.status}: {batch.errors}")
+            # the failed requests are in the error file, in the same layout as the output file
+            with open(output_path + ".tmp", "w", encoding="utf-8") as f:
+                for file_id in (batch.output_file_id, batch.error_file_id):
+                    if file_id:
+                        f.write(self.client.files.content(file_id).text.rstrip("\n") + "\n")
+            os.replace(output_path + ".tmp", output_path)
+        answers = read_batch_output(output_path)
+        return {request["custom_id"]: answers.get(request["custom_id"]) for request in requests}
+
+
+class BatchStandInServer:
+    """
+    Local stand-in for an OpenAI compatible provider, to run the batch mode (and run_chat) offline: implements
+    /v1/chat/completions, /v1/files, /v1/files/<id>/content and /v1/batches, answering every chat request with
+    respond(body) -> str (echo of the last message by default). A batch is processed in the background and reports
+    in_progress until it is done. The leading messages already seen in a previous request are reported as
+    cached_tokens, like a provider prompt cache.
+    """
+
+    def __init__(self, respond=None, host="127.0.0.1", port=0, batch_delay=0.0):
+        self.respond = respond or (lambda body: body["messages"][-1]["content"])
+        self.batch_delay = batch_delay
+        self.files = {}
+        self.batches = {}
+        self.requests = []
+        self.prefixes = set()
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler())
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def completion(self, body):
+        content = self.respond(body)
+        words = [len(str(message.get("content", "")).split()) for message in body["messages"]]
+        prompt_tokens = sum(words)
+        cached_tokens = 0
+        with self.lock:
+            for n in range(1, len(body["messages"]) + 1):
+                prefix = json.dumps(body["messages"][:n], sort_keys=True)
+                if prefix in self.prefixes:
+                    cached_tokens = sum(words[:n])
+                self.prefixes.add(prefix)
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model"),
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+            # word counts stand for the token counts
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(content.split()),
+                      "total_tokens": prompt_tokens + len(content.split()), "prompt_tokens_details": {"cached_tokens": cached_tokens}},
+        }
+
+    def _add_file(self, data, purpose, filename="batch.jsonl"):
+        file = {"id": f"file-{uuid.uuid4().hex}", "object": "file", "bytes": len(data), "created_at": int(time.time()),
+                "filename": filename, "purpose": purpose, "status": "processed"}
+        with self.lock:
+            self.files[file["id"]] = (file, data)
+        return file
+
+    def _process_batch(self, batch):
+        time.sleep(self.batch_delay)
+        _, data = self.files[batch["input_file_id"]]
+        lines = []
+        for line in data.decode("utf-8").splitlines():
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            response = {"status_code": 200, "request_id": uuid.uuid4().hex, "body": self.completion(request["body"])}
+            lines.append(json.dumps({"id": f"batch_req_{uuid.uuid4().hex}", "custom_id": request["custom_id"],
+                                     "response": response, "error": None}))
+        output = self._add_file(("\n".join(lines) + "\n").encode("utf-8"), "batch_output")
+        with self.lock:
+            batch.update(status="completed", output_file_id=output["id"], completed_at=int(time.time()),
+                         request_counts={"total": len(lines), "completed": len(lines), "failed": 0})
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status, payload, raw=False):
+                data = payload if raw else json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/octet-stream" if raw else "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _body(self):
+                return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+            def do_POST(self):
+                body = self._body()
+                if self.path.endswith("/chat/completions"):
+                    request = json.loads(body)
+                    with server.lock:
+                        server.requests.append(request)
+                    return self._send(200, server.completion(request))
+                if self.path.endswith("/files"):
+                    message = BytesParser(policy=HTTP).parsebytes(
+                        f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode("utf-8") + body)
+                    fields = {part.get_param("name", header="content-disposition"): part for part in message.iter_parts()}
+                    purpose = fields["purpose"].get_payload(decode=True).decode("utf-8")
+                    return self._send(200, server._add_file(fields["file"].get_payload(decode=True), purpose,
+                                                            fields["file"].get_filename() or "batch.jsonl"))
+                if self.path.endswith("/batches"):
+                    request = json.loads(body)
+                    if request.get("input_file_id") not in server.files:
+                        return self._send(404, {"error": {"message": "input file not found"}})
+                    batch = {"id": f"batch_{uuid.uuid4().hex}", "object": "batch", "endpoint": request["endpoint"],
+                             "input_file_id": request["input_file_id"], "completion_window": request["completion_window"],
+                             "status": "in_progress", "created_at": int(time.time()),
+                             "request_counts": {"total": 0, "completed": 0, "failed": 0}}
+                    with server.lock:
+                        server.batches[batch["id"]] = batch
+                    threading.Thread(target=server._process_batch, args=(batch,), daemon=True).start()
+                    return self._send(200, batch)
+                self._send(404, {"error": {"message": f"unknown path {self.path}"}})
+
+            def do_GET(self):
+                parts = self.path.rstrip("/").split("/")
+                with server.lock:
+                    if len(parts) >= 2 and parts[-2] == "batches" and parts[-1] in server.batches:
+                        return self._send(200, dict(server.batches[parts[-1]]))
+                    if parts[-1] == "content" and parts[-2] in server.files:
+                        return self._send(200, server.files[parts[-2]][1], raw=True)
+                    if len(parts) >= 2 and parts[-2] == "files" and parts[-1] in server.files:
+                        return self._send(200, server.files[parts[-1]][0])
+                self._send(404, {"error": {"message": f"unknown path {self.path}"}})
+
+        return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in of the provider batch API, echoing the last message")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", default=8765, type=int)
+    parser.add_argument("--batch-delay", default=1.0, type=float, help="seconds before a batch completes")
+    args = parser.parse_args()
+
+    server = BatchStandInServer(host=args.host, port=args.port, batch_delay=args.batch_delay)
+    print(f"Serving on {server.base_url} (OPENAI_API_BASE={server.base_url})")
+    server.httpd.serve_forever()
@@ -0,0 +1,108 @@
+import os
+import json
+import zlib
+import time
+import sqlite3
+import hashlib
+import argparse
+import threading
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    value BLOB NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+
+class LLMCache:
+    """
+    SQLite cache of the LLM answers returned by utils.run_chat, keyed by the sha256 of the request
+    (model, messages, temperature, max_tokens, response_format) and stored compressed.
+
+    Greedy requests (temperature 0/None) are always cached. Requests with a non-zero temperature are cached only when
+    the caller passes a sample_index, which is part of the key: the same index replays the same sample, a new index
+    draws a new one. In replay mode the cache is read-only and a miss never reaches the API.
+    """
+
+    def __init__(self, path, replay=False):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.replay = replay
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript(SCHEMA)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
+
+    @staticmethod
+    def cacheable(temperature, sample_index=None):
+        return not temperature or sample_index is not None
+
+    @staticmethod
+    def key(model, messages, temperature, max_tokens, response_format, sample_index=None):
+        request = {
+            'model': model,
+            'messages': messages,
+            'temperature': temperature or 0,
+            'max_tokens': max_tokens,
+            'response_format': response_format,
+            'sample_index': sample_index,
+        }
+        return hashlib.sha256(json.dumps(request, sort_keys=True, ensure_ascii=False, default=str).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        with self.lock:
+            row = self.conn.execute('SELECT value FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return zlib.decompress(row[0]).decode('utf-8')
+
+    def skip(self):
+        """ Count a request not cacheable (non-zero temperature without sample_index) """
+        with self.lock:
+            self.skipped += 1
+
+    def put(self, key, model, answer):
+        if self.replay or answer is None:
+            return
+        value = zlib.compress(answer.encode('utf-8'))
+        with self.lock, self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)', (key, model, value, time.time()))
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'uncacheable': self.skipped,
+        }
+
+    def summary(self):
+        """ Number of cached answers and compressed size for each model """
+        with self.lock:
+            rows = self.conn.execute('SELECT model, COUNT(*), SUM(LENGTH(value)) FROM responses GROUP BY model ORDER BY model').fetchall()
+        return {model: {'answers': count, 'bytes': size} for model, count, size in rows}
+
+    def close(self):
+        self.conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Show the content of an LLM cache')
+    parser.add_argument('path', help='path of the SQLite cache')
+    args = parser.parse_args()
+
+    cache = LLMCache(args.path, replay=True)
+    for model, summary in cache.summary().items():
+        print(f"{model}: {summary['answers']} answers, {summary['bytes'] / 1024 / 1024:.1f} MB")
+    cache.close()
@@ -0,0 +1,120 @@
+import os
+import atexit
+import asyncio
+import weakref
+import threading
+
+import httpx
+from openai import OpenAI, AsyncOpenAI
+
+# connection pool of each (base_url, api_key) client, shared by all the threads using it
+MAX_CONNECTIONS = int(os.getenv("SWRBENCH_OPENAI_MAX_CONNECTIONS", "100"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("SWRBENCH_OPENAI_MAX_KEEPALIVE", "32"))
+KEEPALIVE_EXPIRY = float(os.getenv("SWRBENCH_OPENAI_KEEPALIVE_EXPIRY", "60"))
+
+
+def _http_limits(max_connections=None, max_keepalive_connections=None):
+    return httpx.Limits(
+        max_connections=max_connections or MAX_CONNECTIONS,
+        max_keepalive_connections=max_keepalive_connections or MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=KEEPALIVE_EXPIRY,
+    )
+
+
+class OpenAIClientRegistry:
+    """
+    Thread-safe registry of OpenAI clients, one per (base_url, api_key). The clients (and their keep-alive
+    connections) are reused by every call instead of being created and closed for each request, and they are
+    closed at process exit.
+    """
+
+    def __init__(self, max_connections=None, max_keepalive_connections=None):
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def get(self, base_url, api_key):
+        key = (base_url, api_key)
+        client = self._clients.get(key)
+        if client is not None:
+            return client
+        with self._lock:
+            if key not in self._clients:
+                http_client = httpx.Client(limits=_http_limits(self.max_connections, self.max_keepalive_connections),
+                                           timeout=httpx.Timeout(600.0, connect=10.0), follow_redirects=True)
+                # no retries in the SDK: run_chat retries on another endpoint and feeds its AIMD window
+                self._clients[key] = OpenAI(base_url=base_url, api_key=api_key, http_client=http_client, max_retries=0)
+            return self._clients[key]
+
+    def close(self):
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+        for client in clients:
+            try:
+                client.close()
+            except Exception:
+                pass
+
+
+class AsyncOpenAIClientRegistry:
+    """
+    AsyncOpenAI clients, one per (event loop, base_url, api_key): an httpx.AsyncClient can only be used by the loop
+    it was created on. The clients of a loop are dropped with it, aclose() closes them before the loop stops.
+    """
+
+    def __init__(self, max_connections=None, max_keepalive_connections=None):
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self._clients = weakref.WeakKeyDictionary()
+
+    def get(self, base_url, api_key):
+        # only called from the running loop, so there is no race between two creations of the same client
+        clients = self._clients.setdefault(asyncio.get_running_loop(), {})
+        key = (base_url, api_key)
+        if key not in clients:
+            http_client = httpx.AsyncClient(limits=_http_limits(self.max_connections, self.max_keepalive_connections),
+                                            timeout=httpx.Timeout(600.0, connect=10.0), follow_redirects=True)
+            clients[key] = AsyncOpenAI(base_url=base_url, api_key=api_key, http_client=http_client, max_retries=0)
+        return clients[key]
+
+    async def aclose(self):
+        """ Close the clients of the running loop """
+        clients = self._clients.pop(asyncio.get_running_loop(), {})
+        for client in clients.values():
+            try:
+                await client.close()
+            except Exception:
+                pass
+
+
+_registry = OpenAIClientRegistry()
+_async_registry = AsyncOpenAIClientRegistry()
+
+
+@atexit.register
+def _close_clients():
+    # the registry current at exit, configure_client_pool() closes the ones it replaces
+    _registry.close()
+
+
+def configure_client_pool(max_connections=None, max_keepalive_connections=None):
+    """ Set the pool sizes of the clients created from now on (the existing ones are closed) """
+    global _registry, _async_registry
+    _registry.close()
+    _registry = OpenAIClientRegistry(max_connections, max_keepalive_connections)
+    _async_registry = AsyncOpenAIClientRegistry(max_connections, max_keepalive_connections)
+
+
+def get_openai_client(base_url, api_key):
+    return _registry.get(base_url, api_key)
+
+
+def get_async_openai_client(base_url, api_key):
+    """ Pooled AsyncOpenAI client of the running event loop """
+    return _async_registry.get(base_url, api_key)
+
+
+async def close_async_clients():
+    await _async_registry.aclose()
@@ -0,0 +1,113 @@
+import os
+import asyncio
+import threading
+from concurrent.futures import as_completed
+
+from utils import async_run_chat
+from llm_clients import close_async_clients
+from llm_metrics import llm_context, current_tags
+
+# requests in flight over all the models, and per model when not set by --model-concurrency
+DEFAULT_MAX_CONCURRENCY = int(os.getenv("SWRBENCH_LLM_MAX_CONCURRENCY", "256"))
+
+
+def parse_model_limits(values):
+    """ ["gpt-4o=64", "deepseek-r1=16"] -> {"gpt-4o": 64, "deepseek-r1": 16} """
+    limits = {}
+    for value in values or []:
+        model, sep, limit = value.rpartition("=")
+        if not sep or not model:
+            raise ValueError(f"Invalid model concurrency {value!r}, expected <model>=<limit>")
+        limits[model] = int(limit)
+    return limits
+
+
+class LLMDispatcher:
+    """
+    Runs the async_run_chat calls of a stage on a single event loop in a background thread, with a global limit of
+    requests in flight and a limit per model. A waiting request is a suspended coroutine, not a blocked thread.
+
+    From synchronous code (e.g. the process_item of a ThreadPoolExecutor), submit() returns a
+    concurrent.futures.Future and chat() blocks until the answer. Stages with an async process_item run all their
+    items on the dispatcher loop with map() and await achat() inside it.
+    """
+
+    def __init__(self, max_concurrency=DEFAULT_MAX_CONCURRENCY, model_limits=None):
+        self.max_concurrency = max_concurrency
+        self.model_limits = dict(model_limits or {})
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._model_semaphores = {}
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="llm-dispatcher", daemon=True)
+        self._thread.start()
+
+    def _model_semaphore(self, model):
+        # only used from the dispatcher loop, no lock needed
+        if model not in self._model_semaphores:
+            self._model_semaphores[model] = asyncio.Semaphore(self.model_limits.get(model, self.max_concurrency))
+        return self._model_semaphores[model]
+
+    async def achat(self, model, messages, **kwargs):
+        """ async_run_chat within the concurrency limits, to be awaited on the dispatcher loop """
+        async with self._model_semaphore(model), self._semaphore:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            try:
+                return await async_run_chat(model, messages, **kwargs)
+            finally:
+                self.in_flight -= 1
+
+    async def _achat_tagged(self, tags, model, messages, **kwargs):
+        with llm_context(**tags):
+            return await self.achat(model, messages, **kwargs)
+
+    def submit(self, model, messages, **kwargs):
+        """ Thread-safe, :returns concurrent.futures.Future of the answer """
+        # the request runs in a task of the dispatcher loop, it keeps the llm_context tags of the caller
+        return asyncio.run_coroutine_threadsafe(self._achat_tagged(current_tags(), model, messages, **kwargs), self._loop)
+
+    def chat(self, model, messages, **kwargs):
+        """ Blocking drop-in for run_chat """
+        return self.submit(model, messages, **kwargs).result()
+
+    def run(self, coro):
+        """ Run a coroutine on the dispatcher loop and wait for its result """
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def map(self, process_item, items):
+        """ Run the coroutine function process_item on every item, yielding the results as they complete """
+        futures = [asyncio.run_coroutine_threadsafe(process_item(item), self._loop) for item in items]
+        for future in as_completed(futures):
+            yield future.result()
+
+    def close(self):
+        if not self._loop.is_running():
+            return
+        self.run(close_async_clients())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def configure_dispatcher(max_concurrency=DEFAULT_MAX_CONCURRENCY, model_limits=None):
+    """ Replace the process-wide dispatcher shared by the stages """
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is not None:
+            _dispatcher.close()
+        _dispatcher = LLMDispatcher(max_concurrency, model_limits)
+        return _dispatcher
+
+
+def get_dispatcher():
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = LLMDispatcher()
+        return _dispatcher
@@ -0,0 +1,184 @@
+import os
+import time
+import random
+import asyncio
+import itertools
+import threading
+from email.utils import parsedate_to_datetime
+
+# AIMD concurrency window of each (endpoint, key)
+INITIAL_LIMIT = float(os.getenv("SWRBENCH_LLM_ENDPOINT_INITIAL_LIMIT", "8"))
+MIN_LIMIT = float(os.getenv("SWRBENCH_LLM_ENDPOINT_MIN_LIMIT", "1"))
+MAX_LIMIT = float(os.getenv("SWRBENCH_LLM_ENDPOINT_MAX_LIMIT", "128"))
+DECREASE_FACTOR = 0.5
+# consecutive errors (5xx, connection, auth) before an endpoint is taken out of the rotation
+MAX_FAILURES = 3
+UNHEALTHY_COOLDOWN = 30
+MAX_UNHEALTHY_COOLDOWN = 600
+# retry delays: full jitter, capped, a Retry-After header is honoured up to MAX_RETRY_AFTER
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = float(os.getenv("SWRBENCH_LLM_BACKOFF_CAP", "60"))
+MAX_RETRY_AFTER = 600
+
+SUCCESS = 'success'
+THROTTLED = 'throttled'
+ERROR = 'error'
+REJECTED = 'rejected'
+# the request was abandoned (e.g. the other request of a hedged pair answered first)
+CANCELLED = 'cancelled'
+
+
+def backoff_delay(attempt, base=BACKOFF_BASE, cap=BACKOFF_CAP):
+    """ Full jitter exponential backoff: uniform in [0, min(cap, base * 2**attempt)] """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def retry_after_seconds(e):
+    """ Seconds requested by the Retry-After (or retry-after-ms) header of an API error, None if not set """
+    response = getattr(e, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+    value = headers.get('retry-after-ms')
+    if value is not None:
+        try:
+            return min(float(value) / 1000, MAX_RETRY_AFTER)
+        except ValueError:
+            pass
+    value = headers.get('retry-after')
+    if value is None:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return min(max(seconds, 0.0), MAX_RETRY_AFTER)
+
+
+def classify_error(e):
+    """ THROTTLED for 429s, REJECTED for the requests the endpoint refused (4xx), ERROR otherwise (5xx, network) """
+    status = getattr(e, 'status_code', None)
+    if status == 429 or 'rate limit' in str(e).lower():
+        return THROTTLED
+    if status in (401, 403):
+        # bad or revoked key: the endpoint is unusable, not the request
+        return ERROR
+    if status is not None and 400 <= status < 500:
+        return REJECTED
+    return ERROR
+
+
+class Endpoint:
+    def __init__(self, base_url, api_key, limit=INITIAL_LIMIT):
+        self.base_url = base_url
+        self.api_key = api_key
+        self.limit = limit
+        self.in_flight = 0
+        self.failures = 0
+        self.paused_until = 0.0
+        self.last_decrease = 0.0
+        self.successes = 0
+        self.throttled = 0
+        self.errors = 0
+
+    @property
+    def name(self):
+        # never log the key itself
+        return f"{self.base_url} (key ...{self.api_key[-4:]})"
+
+    def available(self, now):
+        return now >= self.paused_until and self.in_flight < int(self.limit)
+
+
+class EndpointPool:
+    """
+    Routes the LLM requests over the (base_url, api_key) pairs, each with an AIMD concurrency limit: every success
+    grows it by 1/limit (about +1 per window of requests), a 429 halves it (at most once per Retry-After/cooldown
+    period, so a burst of 429s counts once) and pauses the endpoint until the Retry-After delay has passed.
+    Consecutive errors take an endpoint out of the rotation for an exponentially growing cooldown.
+
+    acquire() returns the healthy endpoint with the lowest load (in_flight / limit), waiting while all of them are
+    paused or full, and release() reports the outcome of the request.
+    """
+
+    def __init__(self, base_urls, api_keys, initial_limit=INITIAL_LIMIT, min_limit=MIN_LIMIT, max_limit=MAX_LIMIT):
+        if not base_urls:
+            raise ValueError("Missing OPENAI_API_BASE/OPENROUTER_BASE_URL")
+        if not api_keys:
+            raise ValueError("Missing OPENAI_API_KEY/OPENROUTER_API_KEY")
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.endpoints = [Endpoint(base_url, api_key, initial_limit)
+                          for base_url, api_key in itertools.product(base_urls, api_keys)]
+        self._condition = threading.Condition()
+
+    def _pick(self, now, exclude=None):
+        """ :returns (endpoint or None, seconds until one may become available) """
+        candidates = [endpoint for endpoint in self.endpoints if endpoint.available(now) and endpoint is not exclude]
+        if candidates:
+            # a hedge goes to another base URL when one is available
+            endpoint = min(candidates, key=lambda e: (exclude is not None and e.base_url == exclude.base_url,
+                                                      e.in_flight / e.limit, random.random()))
+            endpoint.in_flight += 1
+            return endpoint, 0.0
+        paused = [endpoint.paused_until - now for endpoint in self.endpoints if endpoint.paused_until > now]
+        return None, min(paused) if len(paused) == len(self.endpoints) else 1.0
+
+    def acquire(self):
+        with self._condition:
+            while True:
+                endpoint, wait = self._pick(time.time())
+                if endpoint is not None:
+                    return endpoint
+                # woken up earlier by release()
+                self._condition.wait(wait)
+
+    async def aacquire(self):
+        while True:
+            with self._condition:
+                endpoint, wait = self._pick(time.time())
+            if endpoint is not None:
+                return endpoint
+            await asyncio.sleep(min(wait, 0.05))
+
+    def try_acquire(self, exclude=None):
+        """ Non-blocking acquire of an endpoint other than `exclude`, None if none is available right now """
+        with self._condition:
+            return self._pick(time.time(), exclude)[0]
+
+    def release(self, endpoint, outcome, retry_after=None):
+        now = time.time()
+        with self._condition:
+            endpoint.in_flight -= 1
+            if outcome == SUCCESS:
+                endpoint.successes += 1
+                endpoint.failures = 0
+                endpoint.limit = min(self.max_limit, endpoint.limit + 1 / endpoint.limit)
+            elif outcome == THROTTLED:
+                endpoint.throttled += 1
+                pause = retry_after if retry_after is not None else backoff_delay(1)
+                if now - endpoint.last_decrease >= max(pause, 1.0):
+                    endpoint.limit = max(self.min_limit, endpoint.limit * DECREASE_FACTOR)
+                    endpoint.last_decrease = now
+                endpoint.paused_until = max(endpoint.paused_until, now + pause)
+            elif outcome == ERROR:
+                endpoint.errors += 1
+                endpoint.failures += 1
+                if endpoint.failures >= MAX_FAILURES:
+                    cooldown = min(MAX_UNHEALTHY_COOLDOWN, UNHEALTHY_COOLDOWN * 2 ** (endpoint.failures - MAX_FAILURES))
+                    endpoint.paused_until = max(endpoint.paused_until, now + cooldown)
+            self._condition.notify_all()
+
+    def stats(self):
+        with self._condition:
+            return {endpoint.name: {
+                'limit': round(endpoint.limit, 2),
+                'in_flight': endpoint.in_flight,
+                'successes': endpoint.successes,
+                'throttled': endpoint.throttled,
+                'errors': endpoint.errors,
+                'healthy': endpoint.paused_until <= time.time(),
+            } for endpoint in self.endpoints}
@@ -0,0 +1,72 @@
+import os
+import math
+import threading
+from collections import defaultdict, deque
+
+# a request still running after this latency quantile of its model gets a duplicate on another endpoint
+HEDGE_QUANTILE = float(os.getenv("SWRBENCH_LLM_HEDGE_QUANTILE", "0.95"))
+# successful latencies kept per model, and needed before hedging it
+LATENCY_WINDOW = 500
+MIN_SAMPLES = 20
+
+
+class LatencyTracker:
+    """ Latencies of the last LATENCY_WINDOW successful requests of each model """
+
+    def __init__(self, window=LATENCY_WINDOW, min_samples=MIN_SAMPLES):
+        self.min_samples = min_samples
+        self._latencies = defaultdict(lambda: deque(maxlen=window))
+        self._lock = threading.Lock()
+
+    def record(self, model, seconds):
+        with self._lock:
+            self._latencies[model].append(seconds)
+
+    def quantile(self, model, q):
+        """ :returns the q-quantile (nearest rank) of the recent latencies, None until min_samples are recorded """
+        with self._lock:
+            latencies = sorted(self._latencies[model])
+        if len(latencies) < self.min_samples:
+            return None
+        return latencies[min(len(latencies) - 1, math.ceil(q * len(latencies)) - 1)]
+
+
+class HedgeBudget:
+    """
+    Caps the duplicated requests to a ratio of the primary ones: each request earns `ratio` token (up to `burst`),
+    a hedge spends one. A ratio of 0 disables hedging.
+    """
+
+    def __init__(self, ratio=0.0, burst=10):
+        self.ratio = ratio
+        self.burst = burst
+        self.tokens = 0.0
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.ratio > 0
+
+    def record_request(self):
+        with self._lock:
+            self.requests += 1
+            self.tokens = min(self.burst, self.tokens + self.ratio)
+
+    def try_spend(self):
+        with self._lock:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            self.hedges += 1
+            return True
+
+    def record_win(self):
+        """ The hedge answered before the primary request """
+        with self._lock:
+            self.hedge_wins += 1
+
+    def stats(self):
+        return {'requests': self.requests, 'hedges': self.hedges, 'hedge_wins': self.hedge_wins}
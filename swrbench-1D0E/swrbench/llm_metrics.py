@@ -0,0 +1,180 @@
+import os
+import json
+import math
+import time
+import argparse
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from collections import defaultdict
+
+# tags of the LLM calls made in the current thread / asyncio task
+_stage = ContextVar("llm_stage", default=None)
+_instance_id = ContextVar("llm_instance_id", default=None)
+
+
+@contextmanager
+def llm_context(stage=None, instance_id=None):
+    """ Tag the run_chat calls made inside the block (e.g. in a process_item) with a stage and an instance_id """
+    tokens = []
+    if stage is not None:
+        tokens.append((_stage, _stage.set(stage)))
+    if instance_id is not None:
+        tokens.append((_instance_id, _instance_id.set(instance_id)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+def current_tags():
+    return {"stage": _stage.get(), "instance_id": _instance_id.get()}
+
+
+def usage_tokens(usage):
+    """ (prompt, completion, cached) tokens of the usage of a chat completion, None when not reported """
+    if usage is None:
+        return None, None, None
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = getattr(details, "cached_tokens", None) if details is not None else None
+    return getattr(usage, "prompt_tokens", None), getattr(usage, "completion_tokens", None), cached
+
+
+class UsageTotals:
+    """ Prompt, completion and cached tokens of the answered calls per model, kept in memory for the run logs """
+
+    def __init__(self):
+        self._totals = defaultdict(lambda: {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0})
+        self._lock = threading.Lock()
+
+    def record(self, model, usage):
+        prompt_tokens, completion_tokens, cached_tokens = usage_tokens(usage)
+        with self._lock:
+            totals = self._totals[model]
+            totals["calls"] += 1
+            totals["prompt_tokens"] += prompt_tokens or 0
+            totals["completion_tokens"] += completion_tokens or 0
+            totals["cached_tokens"] += cached_tokens or 0
+
+    def get(self, model=None):
+        """ Totals of a model, or of all the models; cached_ratio is the share of the prompt tokens served from cache """
+        with self._lock:
+            rows = [dict(self._totals[model])] if model is not None else [dict(t) for t in self._totals.values()]
+        totals = {key: sum(row[key] for row in rows) for key in ("calls", "prompt_tokens", "completion_tokens", "cached_tokens")}
+        totals["cached_ratio"] = cached_ratio(totals["cached_tokens"], totals["prompt_tokens"])
+        return totals
+
+
+def cached_ratio(cached_tokens, prompt_tokens):
+    return round(cached_tokens / prompt_tokens, 4) if prompt_tokens else None
+
+
+class MetricsLog:
+    """
+    Appends one JSON line per run_chat call: model, stage, instance_id, status (ok, failed, cache_hit), latency
+    over all the attempts, retries, endpoint and hedging of the answer, prompt/completion/cached tokens.
+    stage is the default of the calls not tagged with llm_context().
+    """
+
+    def __init__(self, path, stage=None):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.stage = stage
+        self.file = open(path, "a", encoding="utf-8")
+        self.lock = threading.Lock()
+
+    def record(self, model, status, start, attempts=0, endpoint=None, hedged=False, usage=None):
+        prompt_tokens, completion_tokens, cached_tokens = usage_tokens(usage)
+        tags = current_tags()
+        row = {
+            "time": round(start, 3),
+            "stage": tags["stage"] or self.stage,
+            "instance_id": tags["instance_id"],
+            "model": model,
+            "status": status,
+            "latency": round(time.time() - start, 3),
+            "retries": max(attempts - 1, 0),
+            "endpoint": endpoint,
+            "hedged": hedged,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "cached_tokens": cached_tokens,
+        }
+        line = json.dumps(row, ensure_ascii=False, default=str) + "\n"
+        with self.lock:
+            self.file.write(line)
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+def percentile(values, q):
+    """ Nearest-rank percentile of a sorted list """
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(math.ceil(q / 100 * len(values)) - 1, 0))]
+
+
+def summarize(path, by=("stage", "model")):
+    """ :returns {(stage, model): summary} of a metrics JSONL, latencies in seconds and throughput in tokens/s """
+    groups = defaultdict(list)
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                row = json.loads(line)
+                groups[tuple(row.get(key) for key in by)].append(row)
+
+    summaries = {}
+    for key, rows in sorted(groups.items(), key=lambda item: tuple(str(k) for k in item[0])):
+        answered = [row for row in rows if row["status"] == "ok"]
+        latencies = sorted(row["latency"] for row in answered)
+        prompt_tokens = sum(row["prompt_tokens"] or 0 for row in answered)
+        completion_tokens = sum(row["completion_tokens"] or 0 for row in answered)
+        cached_tokens = sum(row["cached_tokens"] or 0 for row in answered)
+        # wall-clock span of the calls, they overlap when run concurrently
+        span = max(row["time"] + row["latency"] for row in rows) - min(row["time"] for row in rows)
+        summaries[key] = {
+            "calls": len(rows),
+            "failed": sum(row["status"] == "failed" for row in rows),
+            "cache_hits": sum(row["status"] == "cache_hit" for row in rows),
+            "retries": sum(row["retries"] for row in rows),
+            "hedged": sum(bool(row.get("hedged")) for row in rows),
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "cached_tokens": cached_tokens,
+            "cached_ratio": cached_ratio(cached_tokens, prompt_tokens),
+            "span": round(span, 3),
+            "completion_tokens_per_s": round(completion_tokens / span, 2) if span > 0 else None,
+            "total_tokens_per_s": round((prompt_tokens + completion_tokens) / span, 2) if span > 0 else None,
+        }
+    return summaries
+
+
+def _fmt(value, digits=2):
+    return "-" if value is None else f"{value:.{digits}f}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="LLM call metrics written by run_chat")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    summarize_parser = subparsers.add_parser("summarize", help="latency percentiles and token throughput per stage and model")
+    summarize_parser.add_argument("files", nargs="+", help="metrics JSONL files")
+    summarize_parser.add_argument("--by", nargs="+", default=["stage", "model"], help="fields to group the calls by")
+    args = parser.parse_args()
+
+    for file in args.files:
+        print(f"== {file}")
+        header = " | ".join(args.by) + " | calls | failed | cached | retries | p50 s | p95 s | p99 s | prompt tok | completion tok | cached tok | cached % | span s | compl tok/s | total tok/s"
+        print(header)
+        for key, summary in summarize(file, args.by).items():
+            print(" | ".join(str(k) for k in key) + f" | {summary['calls']} | {summary['failed']} | {summary['cache_hits']}"
+                  f" | {summary['retries']} | {_fmt(summary['p50'])} | {_fmt(summary['p95'])} | {_fmt(summary['p99'])}"
+                  f" | {summary['prompt_tokens']} | {summary['completion_tokens']} | {summary['cached_tokens']}"
+                  f" | {_fmt(summary['cached_ratio'] and summary['cached_ratio'] * 100, 1)} | {_fmt(summary['span'], 1)} | {_fmt(summary['completion_tokens_per_s'])} | {_fmt(summary['total_tokens_per_s'])}")
@@ -0,0 +1,101 @@
+import os
+import logging
+import threading
+import subprocess
+
+
+# same layout as build_dataset.git_clone(), so the clones and the fetched pr_<N> branches are shared
+CACHE_PATH = "data_train/.cache"
+COMMIT_MARKER = "\x00COMMIT "
+COMMIT_FORMAT = "format:%x00COMMIT %H"
+
+
+def parse_show_output(output):
+    """
+    Split the output of `git show --format=<COMMIT_FORMAT> --patch <shas>` into the per-file patches of each
+    commit, in the format of the GitHub API: the hunks of the file without the diff header, files without hunks
+    (binary, pure renames, mode changes) are skipped.
+
+    :returns dict sha -> [{'file', 'patch'}]
+    """
+    diffs = {}
+    for chunk in output.split(COMMIT_MARKER)[1:]:
+        sha, _, body = chunk.partition("\n")
+        files = []
+        for section in ("\n" + body).split("\ndiff --git ")[1:]:
+            lines = section.split("\n")
+            old_path = new_path = None
+            hunk_start = None
+            for i, line in enumerate(lines):
+                if line.startswith("--- "):
+                    old_path = line[4:]
+                elif line.startswith("+++ "):
+                    new_path = line[4:]
+                elif line.startswith("@@"):
+                    hunk_start = i
+                    break
+            if hunk_start is None:
+                continue
+            path = new_path if new_path and new_path != "/dev/null" else old_path
+            path = path.rstrip('\t').strip('"')
+            if path.startswith(("a/", "b/")):
+                path = path[2:]
+            patch = "\n".join(lines[hunk_start:]).rstrip("\n")
+            files.append({'file': path, 'patch': patch})
+        diffs[sha.strip()] = files
+    return diffs
+
+
+class LocalDiffFetcher:
+    """
+    Compute the commit diffs of the PRs of a repository from the local clone in CACHE_PATH instead of the
+    GitHub API: refs/pull/<N>/head is fetched into the pr_<N> branch and all the commits of the PR are
+    diffed by a single `git show`. Unlike the API, large files are never truncated.
+    """
+
+    def __init__(self, repo_name, cache_path=CACHE_PATH):
+        self.repo_name = repo_name
+        self.repo_path = os.path.join(cache_path, repo_name.replace('/', '__'))
+        self.cache_path = cache_path
+        # fetches update the refs and packs of the clone, they are serialized; `git show` runs concurrently
+        self.lock = threading.Lock()
+
+    def _git(self, *args, input=None):
+        return subprocess.run(["git", *args], cwd=self.repo_path, input=input, check=True, capture_output=True).stdout
+
+    def _missing_commits(self, shas):
+        output = self._git("cat-file", "--batch-check", input="".join(f"{sha}^{{commit}}\n" for sha in shas).encode())
+        return [line for line in output.decode().splitlines() if line.endswith(" missing")]
+
+    def ensure_pr_commits(self, pr_number, shas):
+        """ Clone the repository and fetch the PR head when some of its commits are not in the clone yet """
+        with self.lock:
+            if not os.path.exists(self.repo_path):
+                os.makedirs(self.cache_path, exist_ok=True)
+                subprocess.run(["git", "clone", f"https://github.com/{self.repo_name}.git", self.repo_path],
+                               check=True, capture_output=True)
+            if self._missing_commits(shas):
+                # overwrite the branch if the PR was force-pushed after the previous fetch
+                self._git("fetch", "origin", f"+refs/pull/{pr_number}/head:refs/heads/pr_{pr_number}")
+
+    def pr_diffs(self, pr_number, shas):
+        """
+        :param pr_number: number of the PR
+        :param shas: commits of the PR
+        :returns dict sha -> [{'file', 'patch'}], or None when the diffs can't be computed locally
+        """
+        if not shas:
+            return {}
+        try:
+            self.ensure_pr_commits(pr_number, shas)
+            output = self._git("-c", "core.quotePath=false", "show", "--no-color", "--no-ext-diff", "-m", "--first-parent",
+                               "--patch", f"--format={COMMIT_FORMAT}", *shas)
+        except (subprocess.CalledProcessError, OSError) as e:
+            stderr = getattr(e, 'stderr', None)
+            logging.warning(f"Local diffs unavailable for {self.repo_name}#{pr_number}: {stderr.decode(errors='replace') if stderr else e}")
+            return None
+
+        diffs = parse_show_output(output.decode('utf-8', errors='replace'))
+        if any(sha not in diffs for sha in shas):
+            return None
+        return diffs
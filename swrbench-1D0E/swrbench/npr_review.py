@@ -24,7 +24,8 @@ from enum import Enum
 from tiktoken import encoding_for_model, get_encoding
 from threading import Lock
 
-from utils import run_chat
+from utils import run_chat, set_llm_metrics, configure_llm_calls
+from llm_metrics import llm_context
 
 # --- Configuration ---
 OUTPUT_BUFFER_TOKENS_SOFT_THRESHOLD = 1500
@@ -2004,10 +2005,11 @@ def generate(args):
     
     def process_item(item):
         # import pdb; pdb.set_trace()
-        if args.refine:
-            generate_task_refine(args, item, file_lock)
-        else:
-            generate_task_base(args, item, file_lock)
+        with llm_context(stage="generation", instance_id=item["instance_id"]):
+            if args.refine:
+                generate_task_refine(args, item, file_lock)
+            else:
+                generate_task_base(args, item, file_lock)
         return True
 
     with ThreadPoolExecutor(max_workers=args.num_threads) as executor:
@@ -2037,6 +2039,12 @@ if __name__ == "__main__":
     parser.add_argument("--max-prompt-length", default=20000, type=int, help="Max prompt length")
     parser.add_argument("--clean", action="store_true", help="Clean output file")
     parser.add_argument("--refine", action="store_true", help="Refine review")
+    parser.add_argument("--llm-metrics", type=str, help="Metrics JSONL of the LLM calls, see llm_metrics.py summarize")
+    parser.add_argument("--llm-timeout", type=float, help="Timeout in seconds of each LLM request attempt (default SWRBENCH_LLM_TIMEOUT or 600)")
+    parser.add_argument("--hedge-budget", type=float, help="Max ratio of LLM requests duplicated on another endpoint when slower than the p95 latency (0 disables)")
     args = parser.parse_args()
     
+    if args.llm_metrics:
+        set_llm_metrics(args.llm_metrics, stage="generation")
+    configure_llm_calls(timeout=args.llm_timeout, hedge_budget=args.hedge_budget)
     generate(args)
\ No newline at end of file
@@ -25,6 +25,7 @@ from tiktoken import encoding_for_model, get_encoding
 from threading import Lock
 
 from utils import run_chat
+from llm_metrics import llm_context
 
 # --- Configuration ---
 OUTPUT_BUFFER_TOKENS_SOFT_THRESHOLD = 1500
@@ -1594,7 +1595,8 @@ def generate(args):
     
     def process_item(item):
         # import pdb; pdb.set_trace()
-        generate_task(args, item, file_lock)
+        with llm_context(stage="generation", instance_id=item["instance_id"]):
+            generate_task(args, item, file_lock)
         return True
 
     with ThreadPoolExecutor(max_workers=args.num_threads) as executor:
@@ -0,0 +1,203 @@
+import os
+import re
+import json
+import zlib
+import sqlite3
+import argparse
+import threading
+
+
+DEFAULT_DB_PATH = 'data/prs.sqlite'
+BATCH_SIZE = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS prs (
+    repo TEXT NOT NULL,
+    number INTEGER NOT NULL,
+    error INTEGER NOT NULL,
+    error_info TEXT,
+    created_at TEXT,
+    data BLOB NOT NULL,
+    PRIMARY KEY (repo, number)
+);
+CREATE INDEX IF NOT EXISTS idx_prs_error ON prs (repo, error);
+CREATE INDEX IF NOT EXISTS idx_prs_created_at ON prs (repo, created_at);
+"""
+
+
+def repo_from_jsonl_path(path):
+    """ owner__name__prs.jsonl -> owner/name """
+    match = re.match(r'(.+?)__(.+)__prs\.jsonl$', os.path.basename(path))
+    if not match:
+        raise ValueError(f"Can't infer the repo name from {path}, expected <owner>__<name>__prs.jsonl")
+    return f"{match.group(1)}/{match.group(2)}"
+
+
+class PRStore:
+    """
+    SQLite store of the collected PRs, one row per (repo, number) with the pr_info dict (or the ERROR row written
+    by get_all_prs) as compressed JSON. Error status and created_at are indexed, so resuming a crawl and selecting
+    the PRs to analyse don't need to load the whole repository, and iter_prs() streams the rows.
+    """
+
+    def __init__(self, path=DEFAULT_DB_PATH):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+        self.lock = threading.Lock()
+
+    def close(self):
+        self.conn.close()
+
+    @staticmethod
+    def _row(repo, pr):
+        error = bool(pr.get('ERROR', False))
+        data = zlib.compress(json.dumps(pr, ensure_ascii=False, default=str).encode('utf-8'))
+        return repo, pr['number'], int(error), pr.get('ERROR_INFO') if error else None, pr.get('created_at'), data
+
+    def put_many(self, repo, prs):
+        """ Insert or replace PRs (e.g., an ERROR row by the PR fetched on a later run) """
+        rows = [self._row(repo, pr) for pr in prs]
+        with self.lock, self.conn:
+            self.conn.executemany('INSERT OR REPLACE INTO prs VALUES (?, ?, ?, ?, ?, ?)', rows)
+
+    def put(self, repo, pr):
+        self.put_many(repo, [pr])
+
+    def get(self, repo, number):
+        with self.lock:
+            row = self.conn.execute('SELECT data FROM prs WHERE repo = ? AND number = ?', (repo, number)).fetchone()
+        return json.loads(zlib.decompress(row[0])) if row else None
+
+    def _where(self, repo=None, errors=None, created_after=None, created_before=None):
+        clauses, params = [], []
+        if repo is not None:
+            clauses.append('repo = ?')
+            params.append(repo)
+        if errors is not None:
+            clauses.append('error = ?')
+            params.append(int(errors))
+        if created_after is not None:
+            clauses.append('created_at >= ?')
+            params.append(created_after)
+        if created_before is not None:
+            clauses.append('created_at < ?')
+            params.append(created_before)
+        return (' WHERE ' + ' AND '.join(clauses)) if clauses else '', params
+
+    def numbers(self, repo, errors=None):
+        """ :returns set of the PR numbers stored for the repo """
+        where, params = self._where(repo, errors)
+        with self.lock:
+            return {row[0] for row in self.conn.execute(f'SELECT number FROM prs{where}', params)}
+
+    def count(self, repo=None, errors=None):
+        where, params = self._where(repo, errors)
+        with self.lock:
+            return self.conn.execute(f'SELECT COUNT(*) FROM prs{where}', params).fetchone()[0]
+
+    def repos(self):
+        with self.lock:
+            return [row[0] for row in self.conn.execute('SELECT DISTINCT repo FROM prs ORDER BY repo')]
+
+    def error_counts(self, repo):
+        """ :returns dict first 32 chars of ERROR_INFO -> count, as printed by show_error_prs """
+        with self.lock:
+            rows = self.conn.execute('SELECT substr(error_info, 1, 32), COUNT(*) FROM prs WHERE repo = ? AND error = 1 '
+                                     'GROUP BY 1', (repo,)).fetchall()
+        return dict(rows)
+
+    def delete_errors(self, repo, error_prefixes):
+        """ Drop the ERROR rows whose ERROR_INFO starts with one of the prefixes, so they are fetched again """
+        with self.lock, self.conn:
+            for prefix in error_prefixes:
+                self.conn.execute("DELETE FROM prs WHERE repo = ? AND error = 1 AND substr(error_info, 1, ?) = ?",
+                                  (repo, len(prefix), prefix))
+
+    def iter_prs(self, repo=None, errors=None, created_after=None, created_before=None, batch_size=BATCH_SIZE):
+        """
+        Stream the PRs ordered by (repo, number), batch_size rows at a time.
+
+        :param errors: None for all the rows, False for the fetched PRs only, True for the ERROR rows only
+        :param created_after: ISO date, inclusive
+        :param created_before: ISO date, exclusive
+        """
+        where, params = self._where(repo, errors, created_after, created_before)
+        last = ('', -1)
+        while True:
+            # keyset pagination, so the lock is never held while the caller processes the rows
+            page_where = where + (' AND ' if where else ' WHERE ') + '(repo, number) > (?, ?)'
+            with self.lock:
+                rows = self.conn.execute(f'SELECT repo, number, data FROM prs{page_where} ORDER BY repo, number LIMIT ?',
+                                         params + list(last) + [batch_size]).fetchall()
+            if not rows:
+                return
+            for _, _, data in rows:
+                yield json.loads(zlib.decompress(data))
+            last = rows[-1][:2]
+
+    def import_jsonl(self, path, repo=None):
+        """
+        Import a <owner>__<name>__prs.jsonl file written by get_all_prs, streaming it. Duplicated numbers keep
+        the last row of the file, except that an ERROR row never replaces a fetched PR.
+
+        :returns number of imported rows
+        """
+        repo = repo or repo_from_jsonl_path(path)
+        fetched = self.numbers(repo, errors=False)
+        count = 0
+        batch = []
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                pr = json.loads(line)
+                if pr.get('ERROR', False) and pr['number'] in fetched:
+                    continue
+                if not pr.get('ERROR', False):
+                    fetched.add(pr['number'])
+                batch.append(pr)
+                if len(batch) >= BATCH_SIZE:
+                    self.put_many(repo, batch)
+                    count += len(batch)
+                    batch = []
+        if batch:
+            self.put_many(repo, batch)
+            count += len(batch)
+        return count
+
+    def export_jsonl(self, repo, path):
+        """ Write the PRs of the repo in the JSONL layout of get_all_prs, :returns number of rows """
+        count = 0
+        with open(path, 'w', encoding='utf-8') as f:
+            for pr in self.iter_prs(repo):
+                f.write(json.dumps(pr, ensure_ascii=False, default=str) + '\n')
+                count += 1
+        return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Import/export the per-repo PR JSONL files to/from the PR store')
+    parser.add_argument('--db', default=DEFAULT_DB_PATH, help='path of the SQLite database')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    import_parser = subparsers.add_parser('import', help='import <owner>__<name>__prs.jsonl files')
+    import_parser.add_argument('files', nargs='+')
+    export_parser = subparsers.add_parser('export', help='export the PRs of a repo as <owner>__<name>__prs.jsonl')
+    export_parser.add_argument('--repo', nargs='*', help='repos to export, all if not set')
+    export_parser.add_argument('--out-dir', default='.')
+    args = parser.parse_args()
+
+    store = PRStore(args.db)
+    if args.command == 'import':
+        for file in args.files:
+            print(f"{file}: imported {store.import_jsonl(file)} rows")
+    else:
+        os.makedirs(args.out_dir, exist_ok=True)
+        for repo in args.repo or store.repos():
+            path = os.path.join(args.out_dir, f'{repo.replace("/", "__")}__prs.jsonl')
+            print(f"{repo}: exported {store.export_jsonl(repo, path)} rows to {path}")
+    store.close()
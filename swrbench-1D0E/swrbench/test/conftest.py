@@ -0,0 +1,46 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(1, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import utils
+from llm_batch import BatchStandInServer
+from llm_endpoints import EndpointPool
+
+API_KEY = "sk-test"
+
+
+@pytest.fixture
+def make_item():
+    """
+    Factory of the evaluation items ({'instance', 'pred'}): a clean PR for both evaluation (defect_introduced) and
+    evaluation_struct (change_introduced) by default, the keyword arguments override the instance fields.
+    """
+    def make(instance_id, review=None, **instance):
+        instance = {"instance_id": instance_id, "defect_introduced": False, "change_introduced": False, "changes": [],
+                    "pr_title": f"PR {instance_id}", "pr_statement": "Fix the parser", **instance}
+        review = f"LGTM {instance_id}" if review is None else review
+        return {"instance": instance, "pred": {"instance_id": instance_id, "review": review}}
+
+    return make
+
+
+@pytest.fixture
+def stand_in_server(monkeypatch):
+    """
+    Start a BatchStandInServer(respond, **kwargs) and send the run_chat requests to it; the servers started by the
+    test are stopped after it.
+    """
+    servers = []
+
+    def start(respond=None, **kwargs):
+        server = BatchStandInServer(respond, **kwargs).start()
+        servers.append(server)
+        monkeypatch.setattr(utils, "_endpoint_pool", EndpointPool([server.base_url], [API_KEY]))
+        return server
+
+    yield start
+    for server in servers:
+        server.stop()
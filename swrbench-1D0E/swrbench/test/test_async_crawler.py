@@ -0,0 +1,172 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(1, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import async_crawler
+import collect_repo_pr
+from async_crawler import crawl_prs
+from http_cache import HTTPCache
+
+REPO = "octo/widgets"
+MISSING_PR = 2
+
+
+def _sha(number):
+    return f"{number:040x}"
+
+
+def _pr(number):
+    return {
+        "number": number, "title": f"Fix widget {number}", "html_url": f"https://github.com/{REPO}/pull/{number}",
+        "body": "Fixes the size", "user": {"login": "alice"}, "head": {"repo": {"full_name": "alice/widgets"}},
+        "commits": 1, "merge_commit_sha": "m" * 40, "merged": True, "state": "closed", "labels": [{"name": "bug"}],
+        "created_at": "2024-01-01T10:00:00Z", "merged_at": "2024-01-03T10:00:00Z", "base": {"sha": "b" * 40},
+    }
+
+
+def _commit(number):
+    author = {"name": "Alice", "email": "alice@example.com", "date": "2024-01-01T12:00:00Z"}
+    return {"sha": _sha(number), "commit": {"message": "fix size", "author": author, "committer": author}}
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    lock = threading.Lock()
+    # PR requests in flight per token, and the most seen at once
+    in_flight = Counter()
+    max_in_flight = Counter()
+    requested_prs = []
+    revalidated = []
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        etag = f'"{hashlib.sha1(body).hexdigest()}"'
+        if status == 200 and self.headers.get("If-None-Match") == etag:
+            with self.lock:
+                self.revalidated.append(self.path)
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        if status == 200:
+            self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = self.path.split("?")[0][len(f"/repos/{REPO}/"):]
+        match = re.fullmatch(r"pulls/(\d+)", path)
+        if match:
+            self._get_pr(int(match.group(1)))
+        elif path.startswith("commits/"):
+            self._send(200, {"files": [{"filename": "widgets/core.py", "patch": "@@ -1 +1 @@\n-a\n+b"}]})
+        elif re.fullmatch(r"pulls/\d+/commits", path):
+            self._send(200, [_commit(int(path.split("/")[1]))])
+        else:
+            # events, comments, review comments and reviews
+            self._send(200, [])
+
+    def _get_pr(self, number):
+        token = self.headers["Authorization"]
+        with self.lock:
+            self.requested_prs.append(number)
+            self.in_flight[token] += 1
+            self.max_in_flight[token] = max(self.max_in_flight[token], self.in_flight[token])
+        # keep the request open long enough for the other PRs of the token to pile up
+        time.sleep(0.2)
+        with self.lock:
+            self.in_flight[token] -= 1
+        if number == MISSING_PR:
+            self._send(404, {"message": "Not Found"})
+        else:
+            self._send(200, _pr(number))
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server(monkeypatch):
+    FixtureHandler.in_flight.clear()
+    FixtureHandler.max_in_flight.clear()
+    FixtureHandler.requested_prs.clear()
+    FixtureHandler.revalidated.clear()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FixtureHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(async_crawler, "GITHUB_REST_URL", f"http://127.0.0.1:{server.server_address[1]}")
+    yield server
+    server.shutdown()
+
+
+def test_crawl_prs(server, tmp_path):
+    jsonl_file = tmp_path / "prs.jsonl"
+    asyncio.run(crawl_prs(REPO, list(range(1, 11)), str(jsonl_file), ["token-a", "token-b"], per_token_concurrency=2))
+
+    rows = {row["number"]: row for row in map(json.loads, jsonl_file.read_text().splitlines())}
+    assert sorted(rows) == list(range(1, 11))
+
+    # each token runs at most per_token_concurrency PRs at a time, and both tokens are used
+    assert set(FixtureHandler.max_in_flight) == {"Bearer token-a", "Bearer token-b"}
+    assert max(FixtureHandler.max_in_flight.values()) == 2
+
+    error = rows[MISSING_PR]
+    assert error["ERROR"] is True
+    assert error["ERROR_INFO"].startswith("UnknownObjectException: 404")
+
+    pr = rows[1]
+    assert pr["repo"] == "alice/widgets" and pr["user"] == "alice" and pr["labels"] == ["bug"]
+    assert [item["type"] for item in pr["timeline"]] == ["description", "commit"]
+    assert pr["timeline"][1]["diff"] == [{"file": "widgets/core.py", "patch": "@@ -1 +1 @@\n-a\n+b"}]
+
+
+def test_get_all_prs_skips_collected(server, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(collect_repo_pr, "GH_TOKENS", ["token-a", "token-b"])
+    os.makedirs("data/train_prs_raw")
+    collected = [{"number": 1, "title": "collected"}, {"number": 2, "ERROR": True, "ERROR_INFO": "UnknownObjectException: 404"}]
+    with open("data/train_prs_raw/octo__widgets__prs.jsonl", "w", encoding="utf-8") as f:
+        for row in collected:
+            f.write(json.dumps(row) + "\n")
+
+    prs = collect_repo_pr.get_all_prs(REPO, (1, 4), use_async=True)
+
+    assert sorted(FixtureHandler.requested_prs) == [3, 4]
+    assert sorted(pr["number"] for pr in prs) == [1, 2, 3, 4]
+    assert prs[:2] == collected
+
+
+def test_get_all_prs_recrawl_revalidates(server, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(collect_repo_pr, "GH_TOKENS", ["token-a", "token-b"])
+    jsonl_file = tmp_path / "data/train_prs_raw/octo__widgets__prs.jsonl"
+    # ttl 0: the second run revalidates every cached response instead of replaying it without a request
+    http_cache = HTTPCache(str(tmp_path / "cache"), ttl=0)
+
+    first = collect_repo_pr.get_all_prs(REPO, (1, 3), use_async=True, http_cache=http_cache)
+    misses = http_cache.misses
+    assert FixtureHandler.revalidated == [] and misses > 0
+
+    jsonl_file.unlink()
+    second = collect_repo_pr.get_all_prs(REPO, (1, 3), use_async=True, http_cache=http_cache)
+
+    # every response of the PRs found is answered with a 304, only the 404 is downloaded again
+    assert http_cache.misses == misses + 1
+    assert http_cache.revalidated == len(FixtureHandler.revalidated) == misses - 1
+    key = lambda pr: pr["number"]
+    assert sorted(second, key=key) == sorted(first, key=key)
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,107 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(1, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import evaluation
+from eval_checkpoint import EvalCheckpoint, has_results, load_checkpoint, prediction_ids
+
+PARSED = '```json\n{"correctly_identified_as_good": "YES", "pred_issues": {}}\n```'
+
+
+def test_checkpoint(make_item):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "eval.checkpoint.jsonl")
+        checkpoint = EvalCheckpoint(path)
+        checkpoint.append({"instance_id": "a", "review": "It’s fine"})
+        checkpoint.append({"instance_id": "a", "review": "LGTM"})
+        # a crash in the middle of a line
+        with open(path, "a") as f:
+            f.write('{"instance_id": "b", "rev')
+        with open(path, "rb") as f:
+            content = f.read()
+
+        # reading it for an analysis leaves the file as it is
+        assert [row["instance_id"] for row in load_checkpoint(path)] == ["a", "a"]
+        with open(path, "rb") as f:
+            assert f.read() == content
+
+        # resuming only cuts the torn line, the judged rows are kept byte for byte
+        checkpoint = EvalCheckpoint(path, resume=True)
+        with open(path, "rb") as f:
+            assert content.startswith(f.read()) and content.endswith(b'"rev')
+        assert checkpoint.resumed == 2
+        tasks = [make_item("a", "It’s fine"), make_item("a", "LGTM"), make_item("a", "LGTM"), make_item("b", "LGTM")]
+        assert checkpoint.pending(tasks) == tasks[2:]
+        checkpoint.append({"instance_id": "b", "review": "LGTM"})
+        assert [row["instance_id"] for row in checkpoint.load()] == ["a", "a", "b"]
+
+        assert has_results(path)
+        assert EvalCheckpoint(path, resume=False).load() == []
+        assert not has_results(path)
+
+
+def test_prediction_ids(make_item):
+    tasks = [make_item("a", "It’s fine"), make_item("a", "LGTM"), make_item("a", "LGTM"), make_item("b", "LGTM")]
+    ids = prediction_ids(tasks)
+    assert len(set(ids)) == 4
+    assert ids[0].startswith("a-") and ids[3].startswith("b-")
+    # the copies of a prediction get a suffix, the quotes are normalized like in the checkpoint
+    assert ids[2] == ids[1] + "-1"
+    assert prediction_ids([make_item("a", "It's fine")]) == ids[:1]
+    # the same id whatever the position of the task
+    assert prediction_ids(tasks[3:]) == ids[3:]
+
+
+def test_resume(make_item, stand_in_server):
+    judged = []
+    failing = {"b"}
+
+    def respond(body):
+        content = body["messages"][-1]["content"]
+        review = content.split("LGTM ")[1].split()[0]
+        if content.startswith("You are a data extraction assistant"):
+            return "no json here" if review in failing else PARSED
+        judged.append(review)
+        return f"Correctly Identified as Good: YES\nLGTM {review}"
+
+    stand_in_server(respond)
+    with tempfile.TemporaryDirectory() as tmp:
+        dataset, preds = os.path.join(tmp, "dataset.jsonl"), os.path.join(tmp, "preds.jsonl")
+        with open(dataset, "w") as f, open(preds, "w") as g:
+            for item in map(make_item, "abc"):
+                f.write(json.dumps(item["instance"]) + "\n")
+                g.write(json.dumps(item["pred"]) + "\n")
+        args = argparse.Namespace(dataset_file=dataset, pred_file=preds, output_file=os.path.join(tmp, "out", "eval.json"),
+                                  model="judge", num_threads=2, temperature=0.0, max_tokens=512, resume=False)
+        evaluation.evaluate(args)
+        checkpoint = os.path.join(tmp, "out", "eval.json.checkpoint.jsonl")
+        assert sorted(json.loads(line)["instance_id"] for line in open(checkpoint)) == ["a", "c"]
+        with open(args.output_file) as f:
+            assert json.load(f)["analysis_results"]["error"] == 1
+
+        # only b is judged again
+        judged.clear()
+        failing.clear()
+        args.resume = True
+        evaluation.evaluate(args)
+        assert judged == ["b"]
+        with open(args.output_file) as f:
+            output = json.load(f)
+        assert output["analysis_results"]["error"] == 0
+        assert sorted(result["instance_id"] for result in output["details"]) == ["a", "b", "c"]
+
+        # a rerun that forgets --resume doesn't drop the judged results
+        args.resume = False
+        with pytest.raises(FileExistsError):
+            evaluation.evaluate(args)
+        assert len(load_checkpoint(checkpoint)) == 3
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,139 @@
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(1, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from github_graphql import GraphQLPRFetcher, UnknownObjectException
+
+REPO = "octo/widgets"
+
+
+def _author(login):
+    return {"login": login} if login else None
+
+
+def _page(nodes, has_next=False, cursor=None):
+    return {"pageInfo": {"hasNextPage": has_next, "endCursor": cursor}, "nodes": nodes}
+
+
+def _comment(id, login, body, created_at):
+    return {"databaseId": id, "author": _author(login), "body": body, "createdAt": created_at}
+
+
+def _review_comment(id, reply_to, login, body, created_at):
+    return {
+        "databaseId": id, "replyTo": {"databaseId": reply_to} if reply_to else None, "author": _author(login),
+        "body": body, "createdAt": created_at, "path": "widgets/core.py", "diffHunk": "@@ -1,2 +1,2 @@",
+        "startLine": None, "originalStartLine": None, "line": 2, "originalLine": 2, "position": 2, "originalPosition": 2,
+    }
+
+
+PR_1 = {
+    "number": 1, "title": "Fix widget size", "url": f"https://github.com/{REPO}/pull/1", "body": "Fixes #3",
+    "createdAt": "2024-01-01T10:00:00Z", "mergedAt": "2024-01-03T10:00:00Z", "merged": True, "state": "MERGED",
+    "baseRefOid": "b" * 40, "author": _author("alice"), "headRepository": {"nameWithOwner": "alice/widgets"},
+    "mergeCommit": {"oid": "m" * 40}, "potentialMergeCommit": None, "labels": {"nodes": [{"name": "bug"}]},
+    "timelineItems": _page([{"__typename": "HeadRefForcePushedEvent"}, {"__typename": "RenamedTitleEvent"},
+                            {"__typename": "MergedEvent"}]),
+    "commits": dict(totalCount=1, **_page([{"commit": {
+        "oid": "c" * 40, "message": "fix size",
+        "author": {"name": "Alice", "email": "alice@example.com", "date": "2024-01-01T12:00:00+02:00"},
+        "committer": {"name": "Alice", "email": "alice@example.com", "date": "2024-01-01T12:00:00+02:00"},
+    }}])),
+    "comments": _page([_comment(11, "bob", "first", "2024-01-02T09:00:00Z")], has_next=True, cursor="comments-1"),
+    "reviewThreads": _page([{
+        "id": "thread-1", "diffSide": "RIGHT", "startDiffSide": None, "subjectType": "LINE",
+        "comments": _page([_review_comment(21, None, "bob", "rename this", "2024-01-02T08:00:00Z")],
+                          has_next=True, cursor="thread-1-comments-1"),
+    }]),
+    "reviews": _page([{"databaseId": 31, "author": _author("bob"), "body": "", "state": "APPROVED",
+                       "submittedAt": "2024-01-02T11:00:00Z"}]),
+}
+
+COMMENTS_PAGE_2 = _page([_comment(12, "carol", "second", "2024-01-02T10:00:00Z")])
+# a review thread with more than PAGE_SIZE comments
+THREAD_COMMENTS_PAGE_2 = _page([_review_comment(22, 21, None, "done", "2024-01-02T08:30:00Z")])
+
+COMMIT_FILES = {"files": [{"filename": "widgets/core.py", "patch": "@@ -1 +1 @@\n-a\n+b"},
+                          {"filename": "widgets/logo.png"}]}
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    queries = []
+
+    def _send(self, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        query = request["query"]
+        self.queries.append(query)
+        if 'after: "thread-1-comments-1"' in query:
+            assert request["variables"] == {"id": "thread-1"}
+            self._send({"data": {"node": {"comments": THREAD_COMMENTS_PAGE_2}}})
+        elif 'after: "comments-1"' in query:
+            self._send({"data": {"repository": {"pullRequest": {"comments": COMMENTS_PAGE_2}}}})
+        else:
+            self._send({
+                "data": {"repository": {"pr_1": PR_1, "pr_2": None}},
+                "errors": [{"type": "NOT_FOUND", "path": ["repository", "pr_2"],
+                            "message": "Could not resolve to a PullRequest with the number of 2."}],
+            })
+
+    def do_GET(self):
+        assert self.path == f"/repos/{REPO}/commits/{'c' * 40}", self.path
+        self._send(COMMIT_FILES)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_fetch_prs():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FixtureHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        fetcher = GraphQLPRFetcher("token", REPO, graphql_url=f"{url}/graphql", rest_url=url)
+        results = fetcher.fetch_prs([1, 2])
+    finally:
+        server.shutdown()
+
+    # one query for the batch, one for the second page of comments, one for the second page of the review thread
+    assert len(FixtureHandler.queries) == 3
+    assert isinstance(results[2], UnknownObjectException)
+
+    pr = results[1]
+    assert pr["repo"] == "alice/widgets"
+    assert pr["user"] == "alice"
+    assert pr["commits"] == 1
+    assert pr["merge_commit_sha"] == "m" * 40
+    assert pr["state"] == "closed"
+    assert pr["created_at"] == "2024-01-01T10:00:00+00:00"
+    assert pr["labels"] == ["bug"]
+    assert pr["issue_events"] == ["head_ref_force_pushed", "renamed", "merged"]
+    assert pr["base_commit"] == "b" * 40
+
+    timeline = pr["timeline"]
+    assert [item["type"] for item in timeline] == ["description", "commit", "review_comment", "comment", "comment", "review"]
+    commit = timeline[1]
+    assert commit["date"] == "2024-01-01T10:00:00+00:00"
+    assert commit["diff"] == [{"file": "widgets/core.py", "patch": "@@ -1 +1 @@\n-a\n+b"}]
+    assert commit["diff_text"] == "widgets/core.py\n@@ -1 +1 @@\n-a\n+b"
+    review_comment = timeline[2]
+    assert review_comment["side"] == "RIGHT" and review_comment["subject_type"] == "line"
+    assert [(r["id"], r["user"]) for r in review_comment["reply"]] == [(21, "bob"), (22, "ghost")]
+    assert [item["id"] for item in timeline[3:5]] == [11, 12]
+    assert timeline[5]["state"] == "APPROVED"
+
+
+if __name__ == "__main__":
+    test_fetch_prs()
+    print("+++ Test passed +++")
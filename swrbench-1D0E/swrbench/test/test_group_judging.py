@@ -0,0 +1,74 @@
+import argparse
+import logging
+import os
+import re
+import sys
+
+sys.path.insert(1, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import evaluation
+import utils
+from llm_dispatcher import LLMDispatcher
+from llm_metrics import UsageTotals
+
+PARSED = '```json\n{{"correctly_identified_as_good": "{}", "pred_issues": {{}}}}\n```'
+
+
+# long enough for the grouped prompt to save tokens
+PR_STATEMENT = "Fix the parser " * 50
+
+
+def respond(body):
+    content = body["messages"][-1]["content"]
+    if content.startswith("You are a data extraction assistant"):
+        return PARSED.format("YES" if "LGTM" in content else "NO")
+    reviews = re.findall(r"<Review REVIEW-(\d+)>\n(.*?)\n</Review", content, re.S)
+    if not reviews:
+        return f"Correctly Identified as Good: {content.split('<Predicted Review>')[1]}"
+    # the judge forgets the last review, it is sent again alone
+    return "\n".join(f"**EVALUATION RESULT FOR REVIEW-{n}:**\nCorrectly Identified as Good: {review}\n**END OF EVALUATION RESULT**"
+                     for n, review in reviews[:-1])
+
+
+def test_split_group_answer():
+    response = ("**EVALUATION RESULT FOR REVIEW-2:**\nsecond\n**END OF EVALUATION RESULT**\n"
+                "EVALUATION RESULT FOR REVIEW-1 (Clean PR):\nfirst\n")
+    assert evaluation.split_group_answer(response, 3) == ["first", "second\n**END OF EVALUATION RESULT**", None]
+
+
+def test_group_tasks(make_item):
+    tasks = [make_item("a", "1"), make_item("b", "1"), make_item("a", "2"), make_item("a", "3")]
+    groups = evaluation.group_tasks(tasks, 2)
+    assert [[item["pred"]["review"] for item in group] for group in groups] == [["1", "2"], ["3"], ["1"]]
+    assert [group[0]["instance"]["instance_id"] for group in groups] == ["a", "a", "b"]
+
+
+def test_group_judging(make_item, stand_in_server, monkeypatch):
+    stand_in_server(respond)
+    logger = logging.getLogger(__name__)
+    args = argparse.Namespace(model="judge", temperature=0.0, max_tokens=512)
+    items = [make_item("a", review, pr_statement=PR_STATEMENT) for review in ("LGTM", "Bug in the loop", "LGTM again")]
+    usage = UsageTotals()
+    monkeypatch.setattr(utils, "llm_usage", usage)
+    results = evaluation.evaluate_group(args, items, logger)
+    assert [result["correctly_identified_as_good"] for result in results] == ["YES", "NO", "YES"]
+    assert [result["review"] for result in results] == [item["pred"]["review"] for item in items]
+    assert results[0]["response"].startswith("Correctly Identified as Good: LGTM")
+    # one group request, then the forgotten review alone, and three parsing requests
+    assert usage.get("judge")["calls"] == 5
+    grouped_tokens = usage.get("judge")["prompt_tokens"]
+
+    usage = UsageTotals()
+    monkeypatch.setattr(utils, "llm_usage", usage)
+    for item in items:
+        assert evaluation.evaluate_one(args, item, logger) is not None
+    assert usage.get("judge")["prompt_tokens"] > grouped_tokens
+
+    dispatcher = LLMDispatcher(max_concurrency=4)
+    results = dispatcher.run(evaluation.evaluate_group_async(args, items, logger, dispatcher))
+    dispatcher.close()
+    assert [result["correctly_identified_as_good"] for result in results] == ["YES", "NO", "YES"]
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,94 @@
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import requests
+
+sys.path.insert(1, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from http_cache import HTTPCache
+
+BODY = json.dumps([{"id": 1, "body": "looks good"}]).encode("utf-8")
+ETAG = 'W/"abc"'
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    requests = []
+
+    def do_GET(self):
+        self.requests.append(self.headers.get("If-None-Match"))
+        if self.headers.get("If-None-Match") == ETAG:
+            self.send_response(304)
+            self.send_header("X-RateLimit-Remaining", "4999")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("ETag", ETAG)
+        self.send_header("X-RateLimit-Remaining", "4998")
+        self.send_header("Link", '<http://localhost/next?page=2>; rel="next"')
+        self.send_header("Content-Length", str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_conditional_requests():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FixtureHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/repos/octo/widgets/issues/1/comments"
+    session = requests.Session()
+    try:
+        with tempfile.TemporaryDirectory() as cache_dir:
+            # ttl 0: every call is revalidated
+            cache = HTTPCache(cache_dir, ttl=0)
+            first = cache.get(session, url, params={"per_page": 100})
+            second = cache.get(session, url, params={"per_page": 100})
+            assert FixtureHandler.requests == [None, ETAG]
+            assert first.json() == second.json() == [{"id": 1, "body": "looks good"}]
+            assert second.links["next"]["url"] == "http://localhost/next?page=2"
+            # rate limit headers are never replayed
+            assert "x-ratelimit-remaining" not in second.headers
+            assert cache.stats() == {"hits": 0, "revalidated": 1, "misses": 1}
+
+            # fresh entries are replayed without any request, also by another run on the same cache_dir
+            cache = HTTPCache(cache_dir, ttl=3600)
+            assert cache.get(session, url, params={"per_page": 100}).json() == first.json()
+            assert len(FixtureHandler.requests) == 2
+            assert cache.stats() == {"hits": 1, "revalidated": 0, "misses": 0}
+
+            # different params are a different entry, with the same content-addressed body
+            cache.get(session, url, params={"per_page": 50})
+            assert len(FixtureHandler.requests) == 3
+            assert sum(len(files) for _, _, files in os.walk(os.path.join(cache_dir, "objects"))) == 1
+
+            # aget revalidates the same way, without touching the cache files on the event loop thread
+            cache = HTTPCache(cache_dir, ttl=0)
+            threads = []
+            lookup, store = cache.lookup, cache.store
+            cache.lookup = lambda *args: threads.append(threading.current_thread()) or lookup(*args)
+            cache.store = lambda *args: threads.append(threading.current_thread()) or store(*args)
+
+            async def aget(params):
+                async with httpx.AsyncClient() as client:
+                    return await cache.aget(client, url, params=params)
+
+            assert asyncio.run(aget({"per_page": 100})).json() == first.json()
+            assert asyncio.run(aget({"per_page": 10})).json() == first.json()
+            assert FixtureHandler.requests[-2:] == [ETAG, None]
+            assert cache.stats() == {"hits": 0, "revalidated": 1, "misses": 1}
+            assert len(threads) == 3 and threading.main_thread() not in threads
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    test_conditional_requests()
+    print("+++ Test passed +++")
@@ -0,0 +1,66 @@
+import argparse
+import json
+import logging
+import os
+import sys
+
+sys.path.insert(1, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import evaluation_struct
+from judge_cascade import calibration_report, evaluate_cascade, in_calibration_sample, looks_approved
+
+
+def respond(body):
+    review = body["messages"][-1]["content"].split("<PredictedReview>")[1]
+    # the cheap judge approves everything, the expensive one only the explicit approvals
+    good = body["model"] == "cheap" or "LGTM" in review
+    return json.dumps({"identified_as_good": "YES" if good else "NO", "pred_points": []})
+
+
+def test_looks_approved():
+    assert looks_approved("LGTM, thanks!")
+    assert looks_approved("No major issues found.")
+    assert not looks_approved("The loop bound is off by one.")
+    assert not looks_approved(None)
+
+
+def test_calibration_sample():
+    ids = [f"repo__{i}" for i in range(2000)]
+    sampled = [i for i in ids if in_calibration_sample(i, 0.1)]
+    assert 100 < len(sampled) < 300
+    assert sampled == [i for i in ids if in_calibration_sample(i, 0.1)]
+    assert not any(in_calibration_sample(i, 0) for i in ids)
+
+
+def test_cascade(make_item, stand_in_server):
+    stand_in_server(respond)
+    logger = logging.getLogger(__name__)
+    args = argparse.Namespace(model="judge", cascade_model="cheap", calibration_rate=0.0, temperature=0.0,
+                              max_tokens=512, prompt_layout="prefix")
+
+    def judge(args, item, logger):
+        return evaluate_cascade(args, item, logger, evaluation_struct.evaluate_one, evaluation_struct.cascade_check,
+                                evaluation_struct.verdict_summary)
+
+    approved = judge(args, make_item("a", "LGTM"), logger)
+    assert (approved["judge_tier"], approved["judge_model"], approved["escalation_reason"]) == ("cheap", "cheap", None)
+    assert approved["identified_as_good"] == "YES"
+
+    escalated = judge(args, make_item("b", "The loop bound is off by one"), logger)
+    assert (escalated["judge_tier"], escalated["judge_model"]) == ("expensive", "judge")
+    assert escalated["escalation_reason"] == "stance disagrees with the review"
+    assert escalated["identified_as_good"] == "NO"
+
+    args.calibration_rate = 1.0
+    sampled = judge(args, make_item("c", "LGTM"), logger)
+    assert (sampled["judge_tier"], sampled["escalation_reason"]) == ("expensive", "calibration")
+
+    report = calibration_report([approved, escalated, sampled, None])
+    assert report["verdicts_by_tier"] == {"cheap": 1, "expensive": 2}
+    assert report["calibration"]["instances"] == 1 and report["calibration"]["stance_agreement"] == 1.0
+    assert report["escalated"]["stance_agreement"] == 0.0
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,98 @@
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+
+sys.path.insert(1, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import evaluation
+from eval_checkpoint import prediction_ids
+from llm_batch import BatchRunner, batch_request
+
+PARSED = '```json\n{"correctly_identified_as_good": "YES", "pred_issues": {}}\n```'
+
+
+def test_batch_mode(make_item, stand_in_server, monkeypatch):
+    failed_once = set()
+
+    def respond(body):
+        content = body["messages"][-1]["content"]
+        if content.startswith("You are a data extraction assistant"):
+            # the first answer of b can't be parsed, b is judged again in the second round
+            if "LGTM b" in content and "b" not in failed_once:
+                failed_once.add("b")
+                return "no json here"
+            return PARSED
+        review = content.split("LGTM ")[1].split()[0]
+        return f"**1. Clean PR Identification:**\nCorrectly Identified as Good: YES\nLGTM {review}"
+
+    server = stand_in_server(respond, batch_delay=0.05)
+    monkeypatch.setattr(evaluation, "OPENAI_API_KEY", ["sk-test"])
+    with tempfile.TemporaryDirectory() as tmp:
+        args = argparse.Namespace(output_file=os.path.join(tmp, "eval.json"), batch_api_base=server.base_url,
+                                  batch_poll_interval=0.02, model="judge", temperature=0.0, max_tokens=512)
+        logger = logging.getLogger("test_llm_batch")
+        tasks = [make_item("a"), make_item("b")]
+        results = evaluation.evaluate_batch(args, tasks, logger)
+        assert [result["instance_id"] for result in results] == ["a", "b"]
+        assert all(result["correctly_identified_as_good"] == "YES" for result in results)
+        assert results[1]["messages"][-1]["content"].endswith("LGTM b")
+        # judge + parse for each round, the second round only has b
+        assert len(server.batches) == 4
+        assert sorted(os.listdir(args.output_file + ".batch"))[:2] == ["judge-0.batch.json", "judge-0.input.jsonl"]
+        assert evaluation.analyze_result(results) is not None
+
+        # a second run replays the downloaded outputs without submitting anything
+        assert evaluation.evaluate_batch(args, [make_item("a"), make_item("b")], logger) == results
+        assert len(server.batches) == 4
+
+
+def test_saved_batch_of_other_requests(stand_in_server, tmp_path):
+    server = stand_in_server(batch_delay=0.01)
+    runner = BatchRunner(str(tmp_path), server.base_url, "sk-test", poll_interval=0.01)
+    requests = [batch_request(f"id-{i}", "judge", [{"role": "user", "content": f"question {i}"}]) for i in range(2)]
+    assert runner.run("judge-0", requests) == {"id-0": "question 0", "id-1": "question 1"}
+    # the same requests in another order replay the output
+    assert runner.run("judge-0", requests[::-1]) == {"id-1": "question 1", "id-0": "question 0"}
+    assert len(server.batches) == 1
+
+    # other requests under the same name are submitted again instead of reading the saved output
+    other = [batch_request("id-0", "judge", [{"role": "user", "content": "question 1"}])]
+    assert runner.run("judge-0", other) == {"id-0": "question 1"}
+    assert len(server.batches) == 2
+
+
+def test_batch_mode_resume(make_item, stand_in_server, monkeypatch):
+    # a YES for a, a NO for b: a verdict attached to the wrong prediction shows up
+    def respond(body):
+        content = body["messages"][-1]["content"]
+        if content.startswith("You are a data extraction assistant"):
+            verdict = "YES" if "LGTM a" in content else "NO"
+            return '```json\n{"correctly_identified_as_good": "%s", "pred_issues": {}}\n```' % verdict
+        review = content.split("LGTM ")[1].split()[0]
+        return f"LGTM {review}"
+
+    server = stand_in_server(respond, batch_delay=0.01)
+    monkeypatch.setattr(evaluation, "OPENAI_API_KEY", ["sk-test"])
+    with tempfile.TemporaryDirectory() as tmp:
+        args = argparse.Namespace(output_file=os.path.join(tmp, "eval.json"), batch_api_base=server.base_url,
+                                  batch_poll_interval=0.02, model="judge", temperature=0.0, max_tokens=512)
+        logger = logging.getLogger("test_llm_batch")
+        results = evaluation.evaluate_batch(args, [make_item("a"), make_item("b")], logger)
+        assert [result["correctly_identified_as_good"] for result in results] == ["YES", "NO"]
+
+        # a resume left only b: the saved batches of [a, b] are not reused for it
+        results = evaluation.evaluate_batch(args, [make_item("b")], logger)
+        assert [(result["instance_id"], result["correctly_identified_as_good"]) for result in results] == [("b", "NO")]
+        assert len(server.batches) == 4
+        # the custom ids name the predictions, b keeps the same one
+        with open(os.path.join(args.output_file + ".batch", "judge-0.input.jsonl"), encoding="utf-8") as f:
+            assert [json.loads(line)["custom_id"] for line in f] == prediction_ids([make_item("b")])
+        assert prediction_ids([make_item("a"), make_item("b")])[1] == prediction_ids([make_item("b")])[0]
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,102 @@
+import os
+import sys
+import types
+
+import pytest
+
+sys.path.insert(1, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import utils
+from llm_cache import LLMCache
+
+MESSAGES = [{"role": "user", "content": "Review this diff"}]
+
+
+@pytest.fixture
+def api(monkeypatch):
+    """ Stand-in for the API behind run_chat: answers with the call number, or fails (None) when told to """
+    state = types.SimpleNamespace(calls=[], fail=False)
+
+    def chat_completion(model, messages, temperature, max_tokens, response_format, max_retries, timeout):
+        state.calls.append(temperature)
+        return None if state.fail else f"answer {len(state.calls)}"
+
+    monkeypatch.setattr(utils, "_chat_completion", chat_completion)
+    return state
+
+
+def _use_cache(monkeypatch, cache):
+    monkeypatch.setattr(utils, "_llm_cache", cache)
+    return cache
+
+
+def test_key():
+    key = LLMCache.key("m", MESSAGES, 0, 100, None)
+    # stable across calls and processes (no id() or dict order in it), None and 0 are the same greedy temperature
+    assert key == LLMCache.key("m", [dict(reversed(list(MESSAGES[0].items())))], None, 100, None)
+    assert len(key) == 64
+    assert key != LLMCache.key("m", MESSAGES, 0.7, 100, None)
+    assert key != LLMCache.key("m", MESSAGES, 0, 100, None, sample_index=0)
+    assert LLMCache.key("m", MESSAGES, 0.7, 100, None, sample_index=0) != LLMCache.key("m", MESSAGES, 0.7, 100, None, sample_index=1)
+    assert key != LLMCache.key("other", MESSAGES, 0, 100, None)
+    assert key != LLMCache.key("m", MESSAGES, 0, 200, None)
+    assert key != LLMCache.key("m", MESSAGES, 0, 100, {"type": "json_object"})
+
+
+def test_greedy_and_sampled_requests(api, tmp_path, monkeypatch):
+    cache = _use_cache(monkeypatch, LLMCache(str(tmp_path / "llm.sqlite")))
+
+    # greedy: the second call is replayed
+    assert utils.run_chat("m", MESSAGES, temperature=0) == "answer 1"
+    assert utils.run_chat("m", MESSAGES, temperature=0) == "answer 1"
+    assert len(api.calls) == 1
+
+    # non-zero temperature without sample_index: never cached
+    assert utils.run_chat("m", MESSAGES, temperature=0.7) == "answer 2"
+    assert utils.run_chat("m", MESSAGES, temperature=0.7) == "answer 3"
+
+    # with sample_index: the same index replays the same sample, a new index draws a new one
+    assert utils.run_chat("m", MESSAGES, temperature=0.7, sample_index=0) == "answer 4"
+    assert utils.run_chat("m", MESSAGES, temperature=0.7, sample_index=0) == "answer 4"
+    assert utils.run_chat("m", MESSAGES, temperature=0.7, sample_index=1) == "answer 5"
+    assert len(api.calls) == 5
+
+    assert cache.stats() == {"hits": 2, "misses": 3, "hit_rate": 0.4, "uncacheable": 2}
+    assert cache.summary()["m"]["answers"] == 3
+
+
+def test_failed_calls_not_stored(api, tmp_path, monkeypatch):
+    cache = _use_cache(monkeypatch, LLMCache(str(tmp_path / "llm.sqlite")))
+
+    api.fail = True
+    assert utils.run_chat("m", MESSAGES, temperature=0) is None
+    api.fail = False
+    # the failure is retried on the next call instead of being replayed
+    assert utils.run_chat("m", MESSAGES, temperature=0) == "answer 2"
+    assert utils.run_chat("m", MESSAGES, temperature=0) == "answer 2"
+    assert len(api.calls) == 2
+    assert cache.stats()["hits"] == 1
+
+
+def test_replay_mode(api, tmp_path, monkeypatch):
+    path = str(tmp_path / "llm.sqlite")
+    _use_cache(monkeypatch, LLMCache(path))
+    assert utils.run_chat("m", MESSAGES, temperature=0) == "answer 1"
+    utils._llm_cache.close()
+
+    cache = _use_cache(monkeypatch, LLMCache(path, replay=True))
+    # another run replays the stored answer, a miss returns None without calling the API
+    assert utils.run_chat("m", MESSAGES, temperature=0) == "answer 1"
+    assert utils.run_chat("m", [{"role": "user", "content": "another diff"}], temperature=0) is None
+    assert utils.run_chat("m", MESSAGES, temperature=0.7) is None
+    assert len(api.calls) == 1
+    assert cache.stats() == {"hits": 1, "misses": 1, "hit_rate": 0.5, "uncacheable": 1}
+
+    # put() is a no-op in replay mode
+    cache.put(LLMCache.key("m", MESSAGES, 0, None, None, sample_index=3), "m", "stored")
+    assert cache.summary()["m"]["answers"] == 1
+    cache.close()
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,91 @@
+import asyncio
+import os
+import subprocess
+import sys
+import textwrap
+
+sys.path.insert(1, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import llm_clients
+from llm_clients import AsyncOpenAIClientRegistry, OpenAIClientRegistry
+
+SWRBENCH_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def _pool(client):
+    pool = client._client._transport._pool
+    return pool._max_connections, pool._max_keepalive_connections
+
+
+def test_clients_reused_per_endpoint():
+    registry = OpenAIClientRegistry(max_connections=8, max_keepalive_connections=2)
+    client = registry.get("http://a/v1", "sk-1")
+    assert registry.get("http://a/v1", "sk-1") is client
+    assert registry.get("http://a/v1", "sk-2") is not client
+    assert registry.get("http://b/v1", "sk-1") is not client
+    assert _pool(client) == (8, 2)
+
+    registry.close()
+    assert client._client.is_closed
+    # a closed registry creates new clients
+    assert registry.get("http://a/v1", "sk-1") is not client
+    registry.close()
+
+
+def test_async_clients_per_loop():
+    registry = AsyncOpenAIClientRegistry(max_connections=8, max_keepalive_connections=2)
+
+    async def get_twice():
+        client = registry.get("http://a/v1", "sk-1")
+        assert registry.get("http://a/v1", "sk-1") is client
+        assert _pool(client) == (8, 2)
+        await registry.aclose()
+        assert client._client.is_closed
+        return client
+
+    # an httpx.AsyncClient is bound to its loop, each loop gets its own client
+    assert asyncio.run(get_twice()) is not asyncio.run(get_twice())
+
+
+def test_configure_client_pool(monkeypatch):
+    registered = []
+    monkeypatch.setattr(llm_clients.atexit, "register", registered.append)
+    monkeypatch.setattr(llm_clients, "_registry", OpenAIClientRegistry())
+    monkeypatch.setattr(llm_clients, "_async_registry", AsyncOpenAIClientRegistry())
+
+    old = llm_clients.get_openai_client("http://a/v1", "sk-1")
+    for size in (4, 6, 8):
+        llm_clients.configure_client_pool(max_connections=size, max_keepalive_connections=2)
+    # the replaced clients are closed, and no exit handler is added per call
+    assert old._client.is_closed
+    assert registered == []
+    client = llm_clients.get_openai_client("http://a/v1", "sk-1")
+    assert _pool(client) == (8, 2)
+    llm_clients._close_clients()
+    assert client._client.is_closed
+
+
+def test_env_pool_sizes_and_close_at_exit():
+    # the exit handlers run in reverse order, so the check registered before the import runs after the close
+    script = textwrap.dedent(f"""
+        import atexit, sys
+        sys.path.insert(1, {SWRBENCH_DIR!r})
+        clients = []
+        atexit.register(lambda: print("closed" if all(c._client.is_closed for c in clients) else "open"))
+        import llm_clients
+        client = llm_clients.get_openai_client("http://a/v1", "sk-1")
+        pool = client._client._transport._pool
+        print(pool._max_connections, pool._max_keepalive_connections, pool._keepalive_expiry)
+        llm_clients.configure_client_pool(max_keepalive_connections=3)
+        clients.append(client)
+        clients.append(llm_clients.get_openai_client("http://a/v1", "sk-1"))
+    """)
+    env = {**os.environ, "SWRBENCH_OPENAI_MAX_CONNECTIONS": "7", "SWRBENCH_OPENAI_MAX_KEEPALIVE": "5",
+           "SWRBENCH_OPENAI_KEEPALIVE_EXPIRY": "12"}
+    output = subprocess.run([sys.executable, "-c", script], env=env, capture_output=True, text=True, check=True).stdout
+    assert output.split("\n")[:2] == ["7 5 12.0", "closed"]
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, "-q"]))
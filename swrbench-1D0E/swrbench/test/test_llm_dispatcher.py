@@ -0,0 +1,63 @@
+import asyncio
+import os
+import sys
+
+sys.path.insert(1, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import llm_dispatcher
+from llm_dispatcher import LLMDispatcher, parse_model_limits
+
+
+def test_concurrency_limits():
+    in_flight = {"total": 0, "slow": 0, "max_total": 0, "max_slow": 0}
+
+    async def fake_chat(model, messages, **kwargs):
+        in_flight["total"] += 1
+        in_flight[model] += 1
+        in_flight["max_total"] = max(in_flight["max_total"], in_flight["total"])
+        in_flight[f"max_{model}"] = max(in_flight[f"max_{model}"], in_flight[model])
+        await asyncio.sleep(0.01)
+        in_flight["total"] -= 1
+        in_flight[model] -= 1
+        return f"{model}:{messages[0]['content']}"
+
+    original = llm_dispatcher.async_run_chat
+    llm_dispatcher.async_run_chat = fake_chat
+    try:
+        in_flight["fast"] = in_flight["max_fast"] = 0
+        dispatcher = LLMDispatcher(max_concurrency=8, model_limits=parse_model_limits(["slow=2"]))
+
+        async def process_item(i):
+            model = "slow" if i % 2 else "fast"
+            return await dispatcher.achat(model, [{"role": "user", "content": str(i)}])
+
+        results = list(dispatcher.map(process_item, range(40)))
+        assert sorted(results) == sorted(f"{'slow' if i % 2 else 'fast'}:{i}" for i in range(40))
+        assert in_flight["max_total"] == 8
+        assert in_flight["max_slow"] == 2
+        assert dispatcher.max_in_flight == 8
+
+        # from synchronous code
+        futures = [dispatcher.submit("fast", [{"role": "user", "content": "x"}]) for _ in range(3)]
+        assert [future.result() for future in futures] == ["fast:x"] * 3
+        assert dispatcher.chat("slow", [{"role": "user", "content": "y"}]) == "slow:y"
+        dispatcher.close()
+    finally:
+        llm_dispatcher.async_run_chat = original
+
+
+def test_parse_model_limits():
+    assert parse_model_limits(["openai/gpt-4o=64", "a=b=3"]) == {"openai/gpt-4o": 64, "a=b": 3}
+    assert parse_model_limits(None) == {}
+    try:
+        parse_model_limits(["gpt-4o"])
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("missing limit accepted")
+
+
+if __name__ == "__main__":
+    test_concurrency_limits()
+    test_parse_model_limits()
+    print("+++ Test passed +++")
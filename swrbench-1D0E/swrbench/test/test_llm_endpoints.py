@@ -0,0 +1,74 @@
+import os
+import sys
+import time
+import types
+
+sys.path.insert(1, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import llm_endpoints
+from llm_endpoints import EndpointPool, SUCCESS, THROTTLED, ERROR, REJECTED, backoff_delay, classify_error, retry_after_seconds
+
+
+class APIError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"Error code: {status_code}")
+        self.status_code = status_code
+        self.response = types.SimpleNamespace(headers=headers or {})
+
+
+def test_aimd():
+    pool = EndpointPool(["http://a", "http://b"], ["key-1"], initial_limit=2, max_limit=4)
+    a, b = pool.endpoints
+    # least loaded first, then full endpoints are skipped
+    first, second = pool.acquire(), pool.acquire()
+    assert {first, second} == {a, b}
+    third = pool.acquire()
+    pool.release(first, SUCCESS)
+    pool.release(second, SUCCESS)
+    pool.release(third, SUCCESS)
+    assert sorted([a.limit, b.limit]) == [2.5, 2.9]
+
+    # a 429 halves the window once per Retry-After period and pauses the endpoint
+    endpoint = pool.acquire()
+    other = pool.acquire()
+    assert endpoint is not other
+    limit = endpoint.limit
+    pool.release(endpoint, THROTTLED, retry_after=5)
+    assert endpoint.limit == limit / 2
+    assert pool.acquire() is other
+    other_limit = other.limit
+    pool.release(other, THROTTLED, retry_after=5)
+    pool.release(other, THROTTLED, retry_after=5)
+    assert other.limit == other_limit / 2
+    assert not any(state['healthy'] for state in pool.stats().values())
+
+
+def test_unhealthy_endpoint():
+    pool = EndpointPool(["http://a", "http://b"], ["key-1"])
+    a, b = pool.endpoints
+    for _ in range(llm_endpoints.MAX_FAILURES):
+        a.in_flight += 1
+        pool.release(a, ERROR)
+    assert a.paused_until > time.time()
+    assert all(pool.acquire() is b for _ in range(5))
+
+
+def test_errors():
+    assert classify_error(APIError(429)) == THROTTLED
+    assert classify_error(APIError(400)) == REJECTED
+    assert classify_error(APIError(401)) == ERROR
+    assert classify_error(APIError(503)) == ERROR
+    assert classify_error(ConnectionError("reset")) == ERROR
+    assert retry_after_seconds(APIError(429, {"retry-after": "7"})) == 7
+    assert retry_after_seconds(APIError(429, {"retry-after-ms": "1500"})) == 1.5
+    assert retry_after_seconds(APIError(429, {"retry-after": "86400"})) == llm_endpoints.MAX_RETRY_AFTER
+    assert retry_after_seconds(APIError(500)) is None
+    assert retry_after_seconds(ValueError()) is None
+    assert all(0 <= backoff_delay(attempt) <= llm_endpoints.BACKOFF_CAP for attempt in range(30))
+
+
+if __name__ == "__main__":
+    test_aimd()
+    test_unhealthy_endpoint()
+    test_errors()
+    print("+++ Test passed +++")
@@ -0,0 +1,131 @@
+import asyncio
+import os
+import sys
+import time
+import types
+
+import pytest
+
+sys.path.insert(1, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import utils
+from llm_endpoints import EndpointPool
+from llm_hedging import HedgeBudget, LatencyTracker
+
+
+def _response(content):
+    return types.SimpleNamespace(choices=[types.SimpleNamespace(message=types.SimpleNamespace(content=content))])
+
+
+class FakeClient:
+    """ The slow endpoint answers after 0.5s, the other one right away """
+
+    def __init__(self, base_url, calls):
+        self.base_url = base_url
+        self.calls = calls
+        self.chat = types.SimpleNamespace(completions=self)
+
+    def create(self, timeout=None, **kwargs):
+        self.calls.append((self.base_url, timeout))
+        time.sleep(0.5 if self.base_url == "http://slow" else 0.01)
+        return _response(self.base_url)
+
+
+class AsyncFakeClient(FakeClient):
+    async def create(self, timeout=None, **kwargs):
+        self.calls.append((self.base_url, timeout))
+        await asyncio.sleep(0.5 if self.base_url == "http://slow" else 0.01)
+        return _response(self.base_url)
+
+
+def test_latency_tracker_and_budget():
+    tracker = LatencyTracker(window=100, min_samples=10)
+    for i in range(9):
+        tracker.record("m", i)
+    assert tracker.quantile("m", 0.95) is None
+    for i in range(9, 100):
+        tracker.record("m", i)
+    assert tracker.quantile("m", 0.95) == 94
+    assert tracker.quantile("m", 0.5) == 49
+
+    budget = HedgeBudget(ratio=0.25, burst=2)
+    allowed = 0
+    for _ in range(20):
+        budget.record_request()
+        allowed += budget.try_spend()
+    assert allowed == 5
+    assert not HedgeBudget().enabled
+
+
+def test_hedged_request(monkeypatch):
+    calls = []
+    pool = EndpointPool(["http://slow", "http://fast"], ["key"])
+    monkeypatch.setattr(utils, "_endpoint_pool", pool)
+    monkeypatch.setattr(utils, "_hedge_budget", HedgeBudget(ratio=1.0))
+    monkeypatch.setattr(utils, "get_openai_client", lambda base_url, api_key: FakeClient(base_url, calls))
+    monkeypatch.setattr(utils, "get_async_openai_client", lambda base_url, api_key: AsyncFakeClient(base_url, calls))
+    slow, fast = pool.endpoints
+
+    def run(chat):
+        # the slow request of the previous hedged pair finishes in the background
+        while slow.in_flight:
+            time.sleep(0.05)
+        calls.clear()
+        # p95 of 0.05s, the latency of the previous slow request is not recorded
+        monkeypatch.setattr(utils, "_latencies", LatencyTracker(min_samples=1))
+        utils._latencies.record("m", 0.05)
+        # the primary request goes to the slow endpoint
+        fast.in_flight = 1
+        start = time.time()
+        answer = chat()
+        return answer, time.time() - start
+
+    answer, elapsed = run(lambda: utils.run_chat("m", [{"role": "user", "content": "x"}], timeout=30))
+    assert answer == "http://fast"
+    assert elapsed < 0.4
+    assert calls == [("http://slow", 30), ("http://fast", 30)]
+    assert utils._hedge_budget.stats() == {"requests": 1, "hedges": 1, "hedge_wins": 1}
+
+    answer, elapsed = run(lambda: asyncio.run(utils.async_run_chat("m", [{"role": "user", "content": "x"}])))
+    assert answer == "http://fast"
+    assert elapsed < 0.4
+    assert calls == [("http://slow", utils.LLM_TIMEOUT), ("http://fast", utils.LLM_TIMEOUT)]
+    # the slow request was cancelled and released
+    assert slow.in_flight == 0
+
+    # no hedge without budget
+    utils._hedge_budget.ratio = 0
+    answer, elapsed = run(lambda: utils.run_chat("m", [{"role": "user", "content": "x"}]))
+    assert answer == "http://slow"
+    assert len(calls) == 1
+
+
+class OldSDKClient(FakeClient):
+    """ No extra_headers/extra_body, and a TypeError of its own on the "broken" model """
+
+    def create(self, model, messages, timeout=None):
+        self.calls.append((self.base_url, timeout))
+        if model == "broken":
+            raise TypeError("'NoneType' object is not subscriptable")
+        return _response(self.base_url)
+
+
+def test_old_sdk_fallback(monkeypatch):
+    calls = []
+    pool = EndpointPool(["http://old"], ["key"])
+    monkeypatch.setattr(utils, "_endpoint_pool", pool)
+    monkeypatch.setattr(utils, "get_openai_client", lambda base_url, api_key: OldSDKClient(base_url, calls))
+    params = {"model": "m", "messages": [{"role": "user", "content": "x"}]}
+    assert utils._chat_attempt(pool.acquire(), params, 30)["answer"] == "http://old"
+    # the request is sent again without the extra arguments, with the same timeout
+    assert calls == [("http://old", 30)]
+
+    calls.clear()
+    with pytest.raises(TypeError):
+        utils._chat_attempt(pool.acquire(), {**params, "model": "broken"}, 30)
+    assert len(calls) == 1
+    assert pool.endpoints[0].in_flight == 0
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
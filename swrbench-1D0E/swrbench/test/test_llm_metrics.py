@@ -0,0 +1,67 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(1, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import utils
+from llm_dispatcher import LLMDispatcher
+from llm_metrics import llm_context, percentile, summarize
+
+
+def test_percentile():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 95) == 95
+    assert percentile(values, 99) == 99
+    assert percentile([3.0], 99) == 3.0
+    assert percentile([], 50) is None
+
+
+def test_metrics(stand_in_server):
+    server = stand_in_server(lambda body: "two words")
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "metrics.jsonl")
+            utils.set_llm_metrics(path, stage="evaluation")
+            messages = [{"role": "user", "content": "judge this review"}]
+            with llm_context(instance_id="repo__1"):
+                assert utils.run_chat("judge", messages) == "two words"
+            with llm_context(stage="generation", instance_id="repo__2"):
+                assert utils.run_chat("reviewer", messages) == "two words"
+                dispatcher = LLMDispatcher(max_concurrency=2)
+                assert dispatcher.chat("reviewer", messages) == "two words"
+                dispatcher.close()
+            utils.set_llm_metrics(None)
+
+            with open(path, encoding="utf-8") as f:
+                rows = [json.loads(line) for line in f]
+            assert [(row["stage"], row["instance_id"], row["model"]) for row in rows] == [
+                ("evaluation", "repo__1", "judge"),
+                ("generation", "repo__2", "reviewer"),
+                ("generation", "repo__2", "reviewer"),
+            ]
+            assert all(row["status"] == "ok" and row["retries"] == 0 for row in rows)
+            assert all(row["endpoint"] == server.base_url for row in rows)
+            assert rows[0]["prompt_tokens"] == 3
+            assert rows[0]["completion_tokens"] == 2
+            assert rows[0]["cached_tokens"] == 0
+
+            summaries = summarize(path)
+            assert set(summaries) == {("evaluation", "judge"), ("generation", "reviewer")}
+            assert summaries[("generation", "reviewer")]["calls"] == 2
+            assert summaries[("generation", "reviewer")]["completion_tokens"] == 4
+            assert summaries[("generation", "reviewer")]["p99"] is not None
+
+            output = subprocess.run([sys.executable, "llm_metrics.py", "summarize", path], capture_output=True, text=True,
+                                    cwd=os.path.join(os.path.dirname(__file__), ".."), check=True).stdout
+            assert "generation | reviewer | 2 | 0 |" in output
+    finally:
+        utils.set_llm_metrics(None)
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,65 @@
+import os
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(1, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from local_diffs import LocalDiffFetcher
+
+
+def _git(repo, *args):
+    return subprocess.run(["git", "-c", "user.name=test", "-c", "user.email=test@example.com", *args],
+                          cwd=repo, check=True, capture_output=True, text=True).stdout.strip()
+
+
+def _write(repo, path, content):
+    os.makedirs(os.path.dirname(os.path.join(repo, path)), exist_ok=True)
+    with open(os.path.join(repo, path), "wb") as f:
+        f.write(content)
+
+
+def test_pr_diffs():
+    with tempfile.TemporaryDirectory() as cache_path:
+        # the origin repository, with the PR head under refs/pull/1/head as on GitHub
+        origin = os.path.join(cache_path, "origin")
+        os.makedirs(origin)
+        _git(origin, "init", "-q")
+        _write(origin, "core.py", b"a\nb\nc\n")
+        _write(origin, "notes.txt", b"x\n")
+        _write(origin, "logo.png", b"\x00\x01")
+        _git(origin, "add", "-A")
+        _git(origin, "commit", "-qm", "base")
+
+        _write(origin, "core.py", b"a\nB\nc\n")
+        os.remove(os.path.join(origin, "notes.txt"))
+        _write(origin, "docs/notes.txt", b"x\ny\n")
+        _write(origin, "pkg/new file.py", b"new\n")
+        _write(origin, "logo.png", b"\x00\x02")
+        _git(origin, "add", "-A")
+        _git(origin, "commit", "-qm", "fix")
+        _write(origin, "core.py", b"a\nB\nc\nd\n")
+        _git(origin, "commit", "-qam", "more")
+        shas = _git(origin, "rev-list", "--reverse", "HEAD~2..HEAD").split()
+        _git(origin, "update-ref", "refs/pull/1/head", "HEAD")
+        _git(origin, "reset", "-q", "--hard", "HEAD~2")
+
+        fetcher = LocalDiffFetcher("octo/widgets", cache_path=cache_path)
+        _git(cache_path, "clone", "-q", "--no-local", origin, fetcher.repo_path)
+        diffs = fetcher.pr_diffs(1, shas)
+
+        assert _git(fetcher.repo_path, "rev-parse", "pr_1") == shas[-1]
+        assert diffs[shas[0]] == [
+            {"file": "core.py", "patch": "@@ -1,3 +1,3 @@\n a\n-b\n+B\n c"},
+            {"file": "docs/notes.txt", "patch": "@@ -1 +1,2 @@\n x\n+y"},
+            {"file": "pkg/new file.py", "patch": "@@ -0,0 +1 @@\n+new"},
+        ], diffs[shas[0]]
+        assert diffs[shas[1]] == [{"file": "core.py", "patch": "@@ -1,3 +1,4 @@\n a\n B\n c\n+d"}], diffs[shas[1]]
+
+        # unknown commits are reported as unavailable, the caller falls back to the API
+        assert fetcher.pr_diffs(1, shas + ["0" * 40]) is None
+
+
+if __name__ == "__main__":
+    test_pr_diffs()
+    print("+++ Test passed +++")
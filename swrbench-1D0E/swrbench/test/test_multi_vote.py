@@ -0,0 +1,128 @@
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(1, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import evaluation2
+from evaluation2 import evaluate_multi_async, settle_votes
+from llm_dispatcher import LLMDispatcher
+
+PARSED = ('```json\n{{"incorrectly_identified_as_good": "NO", "pred_issues": {{}}, "gt_issues": {{'
+          '"GT-ISSUE-1": {{"defect_type": "F.2", "description": "off by one", "hit": "{0}", "hit_by": "{1}"}}}}}}\n```')
+
+
+def _vote(*hits):
+    return {"gt_issues": {f"GT-ISSUE-{i+1}": {"hit": hit} for i, hit in enumerate(hits)}}
+
+
+def test_settle_votes():
+    gt_ids = ["GT-ISSUE-1", "GT-ISSUE-2"]
+    # unanimous: a single NO settles the defect, a YES waits for the other votes
+    assert settle_votes(gt_ids, [_vote("NO", "YES")], 2, 3) == {"GT-ISSUE-1": "NO", "GT-ISSUE-2": None}
+    assert settle_votes(gt_ids, [_vote("YES", "YES")] * 3, 0, 3) == {"GT-ISSUE-1": "YES", "GT-ISSUE-2": "YES"}
+    # majority of 3
+    assert settle_votes(gt_ids, [_vote("YES", "NO"), _vote("YES", "NO")], 1, 2) == {"GT-ISSUE-1": "YES", "GT-ISSUE-2": "NO"}
+    assert settle_votes(gt_ids, [_vote("YES", "NO")], 2, 2) == {"GT-ISSUE-1": None, "GT-ISSUE-2": None}
+
+
+@pytest.fixture
+def item(make_item):
+    return make_item(
+        "repo__1", "The loop goes one too far", defect_introduced=True, pr_title="Fix loop", pr_statement="Fix the loop",
+        pr_timeline=[{"type": "review", "created_at": "2024-01-01", "user": "bob", "body": "Loop is wrong"}],
+        defects=[{"defect_type": "F.2", "defect_discussion": {"description": "off by one"},
+                  "defect_introducing_commit": {"code": "for i in range(n + 1):"}}],
+    )
+
+
+def _run(stand_in_server, item, judge_answers, num_votes, quorum):
+    """ :returns (result, seconds, judge requests sent), the n-th judge request gets judge_answers[n] = (delay, hit) """
+    lock = threading.Lock()
+    calls = []
+
+    def respond(body):
+        content = body["messages"][-1]["content"]
+        if content.startswith("You are a data extraction assistant"):
+            return PARSED.format("YES", "PRED-ISSUE-1") if "Hit: YES" in content else PARSED.format("NO", "N/A")
+        with lock:
+            delay, hit = judge_answers[len(calls)]
+            calls.append(hit)
+        time.sleep(delay)
+        return f"Hit: {hit}"
+
+    stand_in_server(respond)
+    dispatcher = LLMDispatcher(max_concurrency=8)
+    args = argparse.Namespace(model="judge", temperature=0.0, max_tokens=512)
+    try:
+        start = time.time()
+        result = dispatcher.run(evaluate_multi_async(args, item, logging.getLogger(__name__), dispatcher,
+                                                     num_votes=num_votes, quorum=quorum))
+        return result, time.time() - start, len(calls)
+    finally:
+        dispatcher.close()
+
+
+def test_early_stop(stand_in_server, item):
+    # the fast NO settles the unanimous vote, the two slow votes are cancelled
+    result, seconds, calls = _run(stand_in_server, item, [(0.0, "NO"), (3.0, "YES"), (3.0, "YES")], num_votes=3, quorum=None)
+    assert calls == 3 and seconds < 2.0
+    assert result["hit"] == 0 and result["votes"] == 1
+    assert result["gt_issues"]["GT-ISSUE-1"]["hit_by"] == "N/A"
+
+    # majority: two fast YES settle it without the slow third vote
+    result, seconds, calls = _run(stand_in_server, item, [(0.0, "YES"), (0.1, "YES"), (3.0, "NO")], num_votes=3, quorum=2)
+    assert seconds < 2.0
+    assert result["hit"] == 1 and result["votes"] == 2 and result["total"] == 1
+    assert result["gt_issues"]["GT-ISSUE-1"]["hit_by"] == "PRED-ISSUE-1"
+
+
+def _fake_votes(monkeypatch, answers):
+    """ The vote of sample_index i is answers[i]: a hit ('YES'/'NO') or None for a vote that failed """
+    async def evaluate_one_async(args, item, logger, dispatcher, sample_index=None):
+        await asyncio.sleep(0.01 * sample_index)
+        hit = answers[sample_index]
+        if hit is None:
+            return None
+        return {"gt_issues": {"GT-ISSUE-1": {"hit": hit, "hit_by": "PRED-ISSUE-1" if hit == "YES" else "N/A"}},
+                "pred_issues": {}, "incorrectly_identified_as_good": "NO"}
+
+    monkeypatch.setattr(evaluation2, "evaluate_one_async", evaluate_one_async)
+
+
+def _run_fake(item, num_votes=3, quorum=None):
+    return asyncio.run(evaluate_multi_async(None, item, logging.getLogger(__name__), None, num_votes=num_votes, quorum=quorum))
+
+
+def test_failed_vote(monkeypatch, item):
+    # the failed vote is not a NO: the unanimous quorum is taken over the two votes that returned
+    _fake_votes(monkeypatch, [None, "YES", "YES"])
+    result = _run_fake(item)
+    assert result["hit"] == 1 and result["votes"] == 2 and result["failed_votes"] == 1
+    assert result["defect_introduced"] is True and result["incorrectly_identified_as_good"] == "NO"
+    assert result["review"] == "The loop goes one too far"
+
+    _fake_votes(monkeypatch, ["YES", None, "NO"])
+    assert _run_fake(item)["hit"] == 0
+
+    _fake_votes(monkeypatch, ["YES", None, "NO"])
+    assert _run_fake(item, quorum=1)["hit"] == 1
+
+    _fake_votes(monkeypatch, [None, None, None])
+    assert _run_fake(item) is None
+
+
+def test_clean_pr_rejected(monkeypatch, make_item):
+    _fake_votes(monkeypatch, ["YES", "YES", "YES"])
+    with pytest.raises(ValueError):
+        _run_fake(make_item("repo__2"))
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
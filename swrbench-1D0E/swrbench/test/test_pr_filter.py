@@ -0,0 +1,90 @@
+import os
+import sys
+
+sys.path.insert(1, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from collect_pr_review import filter_prs, iter_filtered_prs
+
+
+def multi_pass_filter(prs, max_commits=100, pr_ids_range=None):
+    """ The filter_prs before the single-pass iter_filtered_prs, one scan of the timeline per filter """
+    filtered_prs = []
+    filter_count = {}
+    for pr in prs:
+        if pr.get('ERROR', False):
+            filter_count['ERROR'] = filter_count.get('ERROR', 0) + 1
+            continue
+        if pr_ids_range is not None and (pr['number'] < pr_ids_range[0] or pr['number'] > pr_ids_range[1]):
+            filter_count['pr_ids_range'] = filter_count.get('pr_ids_range', 0) + 1
+            continue
+        comments = [c for c in pr['timeline'] if 'comment' in c['type']]
+        if len(comments) < 2:
+            filter_count['comments'] = filter_count.get('comments', 0) + 1
+            continue
+        if 'head_ref_force_pushed' in pr['issue_events']:
+            filter_count['head_ref_force_pushed'] = filter_count.get('head_ref_force_pushed', 0) + 1
+            continue
+        pr_description = [e for e in pr['timeline'] if e['type'] == 'description']
+        if len(pr_description) == 0:
+            filter_count['pr_description_filter'] = filter_count.get('pr_description_filter', 0) + 1
+            continue
+        empty_commits = [e for e in pr['timeline'] if e['type'] == 'commit' and len(e['diff']) == 0]
+        if len(empty_commits) > 0:
+            filter_count['empty_commit_filter'] = filter_count.get('empty_commit_filter', 0) + 1
+            continue
+        if pr['commits'] <= 1:
+            filter_count['commits_1'] = filter_count.get('commits_1', 0) + 1
+            continue
+        if pr['commits'] > max_commits:
+            filter_count['commits_gt_max'] = filter_count.get('commits_gt_max', 0) + 1
+            continue
+        filtered_prs.append(pr)
+    return filtered_prs, filter_count
+
+
+def _pr(number, comments=2, description=True, empty_commit=False, commits=2, events=()):
+    timeline = [{"type": "description", "body": "..."}] if description else []
+    timeline += [{"type": "commit", "diff": [] if empty_commit and i == 0 else [{"file": "a.py", "patch": "+a"}]}
+                 for i in range(commits)]
+    timeline += [{"type": "review_comment" if i % 2 else "comment", "body": "..."} for i in range(comments)]
+    return {"number": number, "timeline": timeline, "commits": commits, "issue_events": list(events)}
+
+
+PRS = [
+    _pr(1),
+    {"number": 2, "ERROR": True, "ERROR_INFO": "UnknownObjectException: 404"},
+    _pr(3, comments=1),
+    # fails several filters, counted under the first one only
+    _pr(4, comments=0, description=False, commits=1),
+    _pr(5, events=["head_ref_force_pushed"]),
+    _pr(6, description=False),
+    _pr(7, empty_commit=True),
+    _pr(8, commits=1),
+    _pr(9, commits=12),
+    _pr(10, comments=5, commits=10),
+    _pr(20),
+]
+
+
+def test_same_survivors_and_counts():
+    for kwargs in ({}, {"max_commits": 10}, {"max_commits": 10, "pr_ids_range": (3, 10)}):
+        expected, expected_count = multi_pass_filter(PRS, **kwargs)
+
+        filter_count = {}
+        # iter() checks that the filter works on a stream read once
+        survivors = list(iter_filtered_prs(iter(PRS), filter_count, **kwargs))
+        assert survivors == expected
+        assert filter_count == expected_count
+
+        filter_count = {}
+        assert filter_prs("octo/widgets", iter(PRS), filter_count=filter_count, **kwargs) == expected
+        assert filter_count == expected_count
+
+    _, filter_count = multi_pass_filter(PRS, max_commits=10)
+    assert filter_count == {"ERROR": 1, "comments": 2, "head_ref_force_pushed": 1, "pr_description_filter": 1,
+                            "empty_commit_filter": 1, "commits_1": 1, "commits_gt_max": 1}
+
+
+if __name__ == "__main__":
+    test_same_survivors_and_counts()
+    print("+++ Test passed +++")
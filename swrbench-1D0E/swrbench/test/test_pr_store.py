@@ -0,0 +1,60 @@
+import json
+import os
+import sys
+import tempfile
+
+sys.path.insert(1, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from pr_store import PRStore
+
+
+def _pr(number, created_at):
+    return {"number": number, "title": f"PR {number}", "created_at": created_at, "timeline": [{"type": "description", "body": "é"}]}
+
+
+def test_import_export():
+    with tempfile.TemporaryDirectory() as tmp:
+        jsonl_file = os.path.join(tmp, "octo__widgets__prs.jsonl")
+        rows = [
+            _pr(2, "2024-02-01T00:00:00+00:00"),
+            {"number": 1, "ERROR": True, "ERROR_INFO": "GithubException: 502"},
+            _pr(3, "2024-03-01T00:00:00+00:00"),
+            # the collector appends the PR fetched again after clean_error_prs, and never the other way around
+            _pr(1, "2024-01-01T00:00:00+00:00"),
+            {"number": 4, "ERROR": True, "ERROR_INFO": "UnknownObjectException: 404"},
+            {"number": 3, "ERROR": True, "ERROR_INFO": "GithubException: 502"},
+        ]
+        with open(jsonl_file, "w", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+        store = PRStore(os.path.join(tmp, "prs.sqlite"))
+        assert store.import_jsonl(jsonl_file) == 5
+        assert store.repos() == ["octo/widgets"]
+        assert store.numbers("octo/widgets") == {1, 2, 3, 4}
+        assert store.numbers("octo/widgets", errors=True) == {4}
+        assert store.count("octo/widgets", errors=False) == 3
+        assert store.get("octo/widgets", 2)["timeline"][0]["body"] == "é"
+        assert store.error_counts("octo/widgets") == {"UnknownObjectException: 404": 1}
+
+        # streaming, in number order, across pages
+        assert [pr["number"] for pr in store.iter_prs("octo/widgets", batch_size=2)] == [1, 2, 3, 4]
+        assert [pr["number"] for pr in store.iter_prs("octo/widgets", errors=False,
+                                                      created_after="2024-02-01", created_before="2024-03-01")] == [2]
+
+        store.put("octo/widgets", {"number": 5, "ERROR": True, "ERROR_INFO": "ConnectionError: reset"})
+        store.delete_errors("octo/widgets", ("ConnectionError", "GithubException"))
+        assert store.numbers("octo/widgets", errors=True) == {4}
+
+        out_file = os.path.join(tmp, "out.jsonl")
+        assert store.export_jsonl("octo/widgets", out_file) == 4
+        with open(out_file, encoding="utf-8") as f:
+            exported = [json.loads(line) for line in f]
+        assert [pr["number"] for pr in exported] == [1, 2, 3, 4]
+        assert exported[0] == _pr(1, "2024-01-01T00:00:00+00:00")
+        store.close()
+
+
+if __name__ == "__main__":
+    test_import_export()
+    print("+++ Test passed +++")
@@ -0,0 +1,67 @@
+import os
+import sys
+
+sys.path.insert(1, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import pytest
+
+import utils
+from evaluation_struct import create_eval_messages, EVAL_CLEAN_PROMPT, EVAL_CHANGE_PREFIX, EVAL_CLEAN_PREFIX
+from llm_metrics import UsageTotals
+
+
+@pytest.fixture
+def numbered_item(make_item):
+    """ The n-th PR, with a change discussed in a review when change_introduced """
+    def make(n, change_introduced):
+        instance = {"pr_title": f"Fix bug {n}", "pr_statement": f"Statement of PR {n}", "change_introduced": change_introduced,
+                    "pr_timeline": []}
+        if change_introduced:
+            instance["changes"] = [{
+                "change_type": "F.2 Logic",
+                "change_discussion": {"discussion_summary": f"Off by one in loop {n}"},
+                "change_introducing": {"code_snippet": f"for i in range({n} + 1):"},
+            }]
+            instance["pr_timeline"] = [{"type": "review", "created_at": "2024-01-01", "user": "bob", "body": f"Loop {n} is wrong"}]
+        return make_item(f"repo__{n}", f"Review {n} ’quoted’", **instance)
+
+    return make
+
+
+def test_prefix_layout(numbered_item):
+    for change_introduced, prefix in ((False, EVAL_CLEAN_PREFIX), (True, EVAL_CHANGE_PREFIX)):
+        first, schema = create_eval_messages(numbered_item(1, change_introduced))
+        second, _ = create_eval_messages(numbered_item(2, change_introduced))
+        assert first[0] == second[0] == {"role": "system", "content": prefix}
+        assert "{{" not in prefix and "Fix bug" not in prefix
+        assert first[1]["role"] == "user" and "Fix bug 1" in first[1]["content"] and "Review 1 'quoted'" in first[1]["content"]
+        assert first[1]["content"] != second[1]["content"]
+        assert schema["type"] == "json_schema"
+
+
+def test_inline_layout(numbered_item):
+    item = numbered_item(3, False)
+    messages, _ = create_eval_messages(item, layout="inline")
+    assert messages == [{"role": "user", "content": EVAL_CLEAN_PROMPT.format(
+        pr_title="Fix bug 3", pr_statement="Statement of PR 3", pred_review="Review 3 'quoted'")}]
+
+
+def test_cached_ratio(numbered_item, stand_in_server, monkeypatch):
+    stand_in_server(lambda body: "{}")
+    for layout in ("inline", "prefix"):
+        usage = UsageTotals()
+        monkeypatch.setattr(utils, "llm_usage", usage)
+        for n in range(4):
+            messages, _ = create_eval_messages(numbered_item(n, False), layout=layout)
+            assert utils.run_chat(f"judge-{layout}", messages, max_retries=1) == "{}"
+        totals = usage.get(f"judge-{layout}")
+        assert totals["calls"] == 4
+        if layout == "inline":
+            assert totals["cached_tokens"] == 0
+        else:
+            # every request but the first one reuses the system message
+            assert totals["cached_tokens"] == 3 * len(EVAL_CLEAN_PREFIX.split())
+            assert totals["cached_ratio"] > 0.5
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
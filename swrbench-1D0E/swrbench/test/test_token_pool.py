@@ -0,0 +1,76 @@
+import os
+import sys
+import time
+
+sys.path.insert(1, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from token_pool import TokenPool, DEFAULT_LIMIT, _mask
+
+
+def _stats(pool, token, resource="core"):
+    return pool.stats()[_mask(token)][resource]
+
+
+def test_most_quota_and_reserved():
+    pool = TokenPool(["token-a", "token-b"], stats_interval=None)
+    pool.update("token-a", 100, 5000, time.time() + 3600)
+    pool.update("token-b", 300, 5000, time.time() + 3600)
+    assert pool.acquire(cost=250) == "token-b"
+    # 50 left on token-b once the first request is reserved, 100 on token-a
+    assert pool.acquire(cost=10) == "token-a"
+    assert _stats(pool, "token-b")["in_flight"] == 250
+    assert _stats(pool, "token-a")["in_flight"] == 10
+    pool.release("token-b", cost=250)
+    assert _stats(pool, "token-b")["in_flight"] == 0
+    assert pool.acquire(cost=10) == "token-b"
+    pool.release("token-a", cost=100)
+    assert _stats(pool, "token-a")["in_flight"] == 0
+    # the resources are tracked separately
+    with pool.token(resource="graphql") as token:
+        assert _stats(pool, token, "graphql")["in_flight"] == 1
+    assert _stats(pool, token, "graphql")["in_flight"] == 0
+
+
+def test_pause_exhausted_and_retry_after():
+    pool = TokenPool(["token-a", "token-b"], stats_interval=None)
+    # token-a exhausted until its reset, only token-b is used
+    pool.update("token-a", 0, 5000, time.time() + 3600)
+    pool.update("token-b", 10, 5000, time.time() + 3600)
+    assert {pool.acquire() for _ in range(5)} == {"token-b"}
+
+    pool = TokenPool(["token-a", "token-b"], stats_interval=None)
+    pool.update("token-b", 10, 5000, time.time() + 3600)
+    # a secondary rate limit pauses token-a only, although it has more quota
+    pool.update_from_headers("token-a", {"Retry-After": "60"})
+    assert pool.acquire() == "token-b"
+    pool.update_from_headers("token-b", {"Retry-After": "60"})
+    assert _stats(pool, "token-a", "core")["remaining"] == DEFAULT_LIMIT
+
+
+def test_reset_restores_quota():
+    pool = TokenPool(["token-a"], stats_interval=None)
+    pool.update("token-a", 0, 5000, time.time() + 0.5)
+    start = time.time()
+    # blocks until the reset (at least 1s between two checks), then the quota is back to the limit
+    assert pool.acquire() == "token-a"
+    assert time.time() - start >= 0.5
+    assert _stats(pool, "token-a", "core")["remaining"] == 5000
+
+
+def test_update_from_headers():
+    pool = TokenPool(["token-a"], stats_interval=None)
+    reset = int(time.time()) + 1800
+    pool.update_from_headers("token-a", {"X-RateLimit-Remaining": "42", "X-RateLimit-Limit": "60",
+                                         "X-RateLimit-Reset": str(reset), "X-RateLimit-Resource": "search"})
+    stats = pool.stats()[_mask("token-a")]
+    assert stats["search"]["remaining"] == 42 and stats["search"]["limit"] == 60
+    assert 1790 <= stats["search"]["reset_in"] <= 1800
+    assert "core" not in stats
+    pool.update_from_headers("token-a", {"x-ratelimit-remaining": "7"})
+    assert _stats(pool, "token-a", "core")["remaining"] == 7
+    pool.update_from_headers("token-a", None)
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, "-q"]))
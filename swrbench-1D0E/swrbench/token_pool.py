@@ -0,0 +1,156 @@
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+
+# quota assumed for a token until the first response reports its real rate limit
+DEFAULT_LIMIT = 5000
+
+
+def _mask(token):
+    return f"{token[:4]}...{token[-4:]}" if len(token) > 8 else token
+
+
+class TokenQuota:
+    def __init__(self, limit=DEFAULT_LIMIT):
+        self.limit = limit
+        self.remaining = limit
+        self.reset = 0.0           # epoch seconds when the quota is restored
+        self.paused_until = 0.0    # secondary rate limits (Retry-After)
+        self.reserved = 0          # cost of the requests in flight not reported by the headers yet
+
+    def available(self, now):
+        if now < self.paused_until:
+            return 0
+        if now >= self.reset and self.remaining < self.limit:
+            # the window is over, the headers of the next response will report the real value
+            self.remaining = self.limit
+        return self.remaining - self.reserved
+
+    def ready_at(self, now):
+        return max(self.paused_until, self.reset if self.remaining - self.reserved <= 0 else now)
+
+
+class TokenPool:
+    """
+    Thread-safe pool of GitHub tokens that tracks the X-RateLimit-Remaining/Reset headers of each token and
+    resource ("core", "graphql", ...). acquire() returns the token with the most quota left and blocks only when
+    all the tokens are exhausted, until the earliest reset; exhausted tokens are skipped while the others keep
+    working.
+    """
+
+    def __init__(self, tokens, stats_interval=60):
+        """
+        :param tokens: list of GitHub tokens
+        :param stats_interval: seconds between the per-token usage log lines, None to disable them
+        """
+        assert tokens, "No GitHub tokens"
+        self.tokens = list(tokens)
+        self.stats_interval = stats_interval
+        self._quotas = {}  # (token, resource) -> TokenQuota
+        self._requests = {token: 0 for token in self.tokens}
+        self._waited = 0.0
+        self._last_stats = time.time()
+        self._cond = threading.Condition()
+
+    def _quota(self, token, resource):
+        key = (token, resource)
+        if key not in self._quotas:
+            self._quotas[key] = TokenQuota()
+        return self._quotas[key]
+
+    def acquire(self, resource='core', cost=1):
+        """
+        Reserve cost requests on the token with the most quota left for the given resource.
+
+        :returns the token, to be given back with release()
+        """
+        with self._cond:
+            while True:
+                now = time.time()
+                token = max(self.tokens, key=lambda t: self._quota(t, resource).available(now))
+                quota = self._quota(token, resource)
+                if quota.available(now) >= cost:
+                    quota.reserved += cost
+                    self._requests[token] += 1
+                    break
+
+                wait = max(min(self._quota(t, resource).ready_at(now) for t in self.tokens) - now, 1)
+                logging.warning(f"All GitHub tokens exhausted for {resource}, waiting {wait:.0f}s")
+                self._waited += wait
+                self._cond.wait(timeout=wait)
+
+        self._maybe_log_stats()
+        return token
+
+    def release(self, token, resource='core', cost=1):
+        with self._cond:
+            quota = self._quota(token, resource)
+            quota.reserved = max(quota.reserved - cost, 0)
+            self._cond.notify_all()
+
+    @contextmanager
+    def token(self, resource='core', cost=1):
+        token = self.acquire(resource, cost)
+        try:
+            yield token
+        finally:
+            self.release(token, resource, cost)
+
+    def update(self, token, remaining, limit=None, reset=None, resource='core'):
+        """ Record the rate limit reported by GitHub for the token """
+        with self._cond:
+            quota = self._quota(token, resource)
+            quota.remaining = int(remaining)
+            if limit is not None:
+                quota.limit = int(limit)
+            if reset is not None:
+                quota.reset = float(reset)
+            self._cond.notify_all()
+
+    def update_from_headers(self, token, headers):
+        """ Record the X-RateLimit-* (and Retry-After) headers of a GitHub response made with the token """
+        if not headers:
+            return
+        headers = {k.lower(): v for k, v in headers.items()}
+        resource = headers.get('x-ratelimit-resource', 'core')
+        if 'x-ratelimit-remaining' in headers:
+            self.update(token, headers['x-ratelimit-remaining'], headers.get('x-ratelimit-limit'),
+                        headers.get('x-ratelimit-reset'), resource)
+        if 'retry-after' in headers:
+            with self._cond:
+                self._quota(token, resource).paused_until = time.time() + float(headers['retry-after'])
+
+    def stats(self):
+        """ Per-token usage: requests served and quota left for each resource """
+        now = time.time()
+        with self._cond:
+            stats = {}
+            for token in self.tokens:
+                stats[_mask(token)] = {
+                    'requests': self._requests[token],
+                    **{resource: {'remaining': quota.remaining,
+                                  'limit': quota.limit,
+                                  'reset_in': max(int(quota.reset - now), 0),
+                                  'in_flight': quota.reserved}
+                       for (t, resource), quota in self._quotas.items() if t == token}
+                }
+            return stats
+
+    def log_stats(self):
+        stats = self.stats()
+        logging.info(f"GitHub tokens (waited {self._waited:.0f}s): " + ", ".join(
+            f"{token} requests={s['requests']} " + " ".join(
+                f"{resource}={q['remaining']}/{q['limit']} reset_in={q['reset_in']}s"
+                for resource, q in s.items() if resource != 'requests')
+            for token, s in stats.items()))
+
+    def _maybe_log_stats(self):
+        if self.stats_interval is None:
+            return
+        with self._cond:
+            if time.time() - self._last_stats < self.stats_interval:
+                return
+            self._last_stats = time.time()
+        self.log_stats()
@@ -1,13 +1,21 @@
 import json
 import os
-import random
-from openai import OpenAI
+import asyncio
 import requests
 from dateutil.parser import parse
-from datetime import timezone
+from datetime import datetime, timezone
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
 from loguru import logger
+import atexit
+
+from llm_cache import LLMCache
+from llm_clients import get_openai_client, get_async_openai_client
+from llm_endpoints import EndpointPool, SUCCESS, CANCELLED, backoff_delay, classify_error, retry_after_seconds
+from llm_hedging import LatencyTracker, HedgeBudget, HEDGE_QUANTILE
+from llm_metrics import MetricsLog, UsageTotals
 
 _api_base = (
     os.getenv('OPENAI_API_BASE')
@@ -23,6 +31,26 @@ OPENAI_API_KEY = [k.strip() for k in _api_key.split(",") if k.strip()]
 OPENROUTER_HTTP_REFERER = os.getenv("OPENROUTER_HTTP_REFERER") or os.getenv("OPENROUTER_SITE_URL")
 OPENROUTER_X_TITLE = os.getenv("OPENROUTER_X_TITLE") or os.getenv("OPENROUTER_APP_NAME")
 
+# opt-in LLM answer cache of run_chat, SWRBENCH_LLM_CACHE_REPLAY=1 makes it read-only (misses never reach the API)
+LLM_CACHE_PATH = os.getenv("SWRBENCH_LLM_CACHE")
+LLM_CACHE_REPLAY = os.getenv("SWRBENCH_LLM_CACHE_REPLAY", "0").lower() in ("1", "true", "yes")
+_llm_cache = None
+_endpoint_pool = None
+_endpoint_pool_lock = threading.Lock()
+
+# opt-in metrics JSONL of the run_chat calls (tokens, latency, retries, endpoint), SWRBENCH_STAGE tags them
+LLM_METRICS_PATH = os.getenv("SWRBENCH_LLM_METRICS")
+_llm_metrics = None
+# token usage of the answered calls of this process, e.g. to log the prompt cache hit ratio at the end of a stage
+llm_usage = UsageTotals()
+
+# seconds per LLM request attempt; SWRBENCH_LLM_HEDGE_BUDGET > 0 enables hedging (see configure_llm_calls)
+LLM_TIMEOUT = float(os.getenv("SWRBENCH_LLM_TIMEOUT", "600"))
+_latencies = LatencyTracker()
+_hedge_budget = HedgeBudget(float(os.getenv("SWRBENCH_LLM_HEDGE_BUDGET", "0")))
+# runs the hedged requests of run_chat, its threads are only started when hedging is used
+_hedge_executor = ThreadPoolExecutor(max_workers=256, thread_name_prefix="llm-hedge")
+
 def save_jsonl(filename, data):
     with open(filename, 'w', encoding='utf-8') as f:
         for item in data:
@@ -32,6 +60,13 @@ def load_jsonl(filename):
     with open(filename, 'r', encoding='utf-8') as f:
         return [json.loads(line) for line in f]
 
+def iter_jsonl(filename):
+    # one row at a time, for files too big to be loaded with load_jsonl
+    with open(filename, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
 def load_json(filename):
     with open(filename, 'r', encoding='utf-8') as f:
         return json.load(f)
@@ -44,14 +79,17 @@ class RateLimiter:
     def __init__(self, calls_per_second=3):
         self.min_interval = 1.0 / calls_per_second
         self.last_call = 0
+        self.lock = threading.Lock()
 
     def __call__(self):
-        now = time.time()
-        elapsed = now - self.last_call
-        wait = max(self.min_interval - elapsed, 0)
-        if wait > 0:
-            time.sleep(wait)
-        self.last_call = time.time()
+        # reserve the next slot under the lock and sleep outside of it, so that concurrent callers are spaced
+        # by min_interval instead of all waking up at the same time
+        with self.lock:
+            now = time.time()
+            slot = max(self.last_call + self.min_interval, now)
+            self.last_call = slot
+        if slot > now:
+            time.sleep(slot - now)
 
 rate_limiter = RateLimiter()
 
@@ -63,65 +101,323 @@ def retry_function(func, *args, **kwargs):
     return func(*args, **kwargs)
 
 
-def run_chat(model, messages, temperature=0.6, max_tokens=None, response_format=None, max_retries=15):
-    client = None
+def set_llm_cache(path, replay=False):
+    """Enable the LLM answer cache of run_chat for this process (path None disables it); the hit statistics are logged at exit."""
+    global _llm_cache
+    if _llm_cache is not None:
+        _llm_cache.close()
+    _llm_cache = LLMCache(path, replay=replay) if path else None
+    return _llm_cache
+
+
+def get_llm_cache():
+    return _llm_cache
+
+
+@atexit.register
+def _log_llm_cache_stats():
+    if _llm_cache is not None:
+        logger.info(f"LLM cache {_llm_cache.path}: {_llm_cache.stats()}")
+
+
+def _cached_answer(model, messages, temperature, max_tokens, response_format, sample_index):
+    """ :returns (key to store the answer under or None, cached answer, True if the API must not be called) """
+    cache = _llm_cache
+    if cache is None:
+        return None, None, False
+    key = None
+    if cache.cacheable(temperature, sample_index):
+        key = cache.key(model, messages, temperature, max_tokens, response_format, sample_index)
+        answer = cache.get(key)
+        if answer is not None:
+            return key, answer, True
+    else:
+        cache.skip()
+    if cache.replay:
+        logger.warning(f"LLM request for {model} not in the cache (replay mode), skipping it")
+        return key, None, True
+    return key, None, False
+
+
+def run_chat(model, messages, temperature=0.6, max_tokens=None, response_format=None, max_retries=15, sample_index=None,
+             timeout=None):
+    """
+    Return the answer of the model, or None if it failed. When the LLM cache is enabled, greedy requests are replayed
+    from it; requests with a non-zero temperature only when sample_index (the i-th sample of the same prompt) is set.
+    timeout (seconds, LLM_TIMEOUT by default) bounds each attempt.
+    """
+    start = time.time()
+    key, answer, done = _cached_answer(model, messages, temperature, max_tokens, response_format, sample_index)
+    if done:
+        _record_cached(model, start, answer)
+        return answer
+    answer = _chat_completion(model, messages, temperature, max_tokens, response_format, max_retries, timeout or LLM_TIMEOUT)
+    if key is not None:
+        _llm_cache.put(key, model, answer)
+    return answer
+
+
+async def async_run_chat(model, messages, temperature=0.6, max_tokens=None, response_format=None, max_retries=15, sample_index=None,
+                         timeout=None):
+    """ Same as run_chat on AsyncOpenAI, a request waiting for the API holds no thread """
+    start = time.time()
+    key, answer, done = _cached_answer(model, messages, temperature, max_tokens, response_format, sample_index)
+    if done:
+        _record_cached(model, start, answer)
+        return answer
+    answer = await _async_chat_completion(model, messages, temperature, max_tokens, response_format, max_retries,
+                                          timeout or LLM_TIMEOUT)
+    if key is not None:
+        _llm_cache.put(key, model, answer)
+    return answer
+
+
+def configure_llm_calls(timeout=None, hedge_budget=None):
+    """
+    Set the per-attempt timeout (seconds) and the hedge budget (ratio of the requests that may be duplicated on
+    another endpoint once they run longer than the HEDGE_QUANTILE latency of their model, 0 disables hedging)
+    """
+    global LLM_TIMEOUT
+    if timeout is not None:
+        LLM_TIMEOUT = timeout
+    if hedge_budget is not None:
+        _hedge_budget.ratio = hedge_budget
+
+
+def set_llm_metrics(path, stage=None):
+    """
+    Write one line per run_chat call to the metrics JSONL at path (None disables it), see llm_metrics.py summarize.
+    stage tags the calls made outside of an llm_context(stage=...) block.
+    """
+    global _llm_metrics
+    if _llm_metrics is not None:
+        _llm_metrics.close()
+    _llm_metrics = MetricsLog(path, stage=stage) if path else None
+    return _llm_metrics
+
+
+def _record_call(model, status, start, attempts, result=None):
+    result = result or {}
+    if status == 'ok':
+        llm_usage.record(model, result.get('usage'))
+    if _llm_metrics is None:
+        return
+    _llm_metrics.record(model, status, start, attempts=attempts, endpoint=result.get('endpoint'),
+                        hedged=result.get('hedged', False), usage=result.get('usage'))
+
+
+def _record_cached(model, start, answer):
+    # answer None: replay mode miss
+    _record_call(model, 'cache_hit' if answer is not None else 'failed', start, 0)
+
+
+def get_endpoint_pool():
+    """ Process-wide EndpointPool over OPENAI_API_BASE x OPENAI_API_KEY """
+    global _endpoint_pool
+    with _endpoint_pool_lock:
+        if _endpoint_pool is None:
+            _endpoint_pool = EndpointPool(OPENAI_API_BASE, OPENAI_API_KEY)
+        return _endpoint_pool
+
+
+@atexit.register
+def _log_endpoint_stats():
+    if _endpoint_pool is not None:
+        logger.info(f"LLM endpoints: {_endpoint_pool.stats()}")
+    if _hedge_budget.hedges:
+        logger.info(f"LLM hedged requests: {_hedge_budget.stats()}")
+
+
+def _extra_headers():
+    extra_headers = {}
+    if OPENROUTER_HTTP_REFERER:
+        extra_headers["HTTP-Referer"] = OPENROUTER_HTTP_REFERER
+    if OPENROUTER_X_TITLE:
+        extra_headers["X-Title"] = OPENROUTER_X_TITLE
+    return extra_headers
+
+
+def _is_fatal_chat_error(e):
+    """ Errors that retrying won't fix """
+    if "invalid_request_error" in str(e):
+        logger.error(f"Invalid request error: {e}")
+        return True
+    if "sensitive words detected" in str(e):
+        logger.error(f"Sensitive words detected: {e}")
+        return True
+    return False
+
+
+def _hedge_after(model):
+    """ Seconds after which a request of the model gets hedged, None if it must not be """
+    if not _hedge_budget.enabled or len(get_endpoint_pool().endpoints) < 2:
+        return None
+    return _latencies.quantile(model, HEDGE_QUANTILE)
+
+
+def _chat_attempt(endpoint, params, timeout):
+    """ One request on an acquired endpoint, released with its outcome """
+    start = time.time()
+    try:
+        # pooled client, its keep-alive connections are reused by the next calls and threads
+        client = get_openai_client(endpoint.base_url, endpoint.api_key)
+        try:
+            response = client.chat.completions.create(extra_headers=_extra_headers(), extra_body={}, timeout=timeout, **params)
+        except TypeError as e:
+            # Backwards compatibility with older OpenAI Python SDKs that don't support extra_headers/extra_body,
+            # any other TypeError is a real failure and must not send the request again.
+            if "unexpected keyword argument" not in str(e):
+                raise
+            response = client.chat.completions.create(timeout=timeout, **params)
+        answer = response.choices[0].message.content
+    except Exception as e:
+        get_endpoint_pool().release(endpoint, classify_error(e), retry_after_seconds(e))
+        raise
+    get_endpoint_pool().release(endpoint, SUCCESS)
+    _latencies.record(params['model'], time.time() - start)
+    return {'answer': answer, 'usage': getattr(response, 'usage', None), 'endpoint': endpoint.base_url, 'hedged': False}
+
+
+def _hedged_chat(params, timeout):
+    """
+    Run a request, and when it is still running after the latency quantile of its model, a duplicate on another
+    endpoint (within the hedge budget): the first answer wins, the slower request finishes in the background.
+    :returns dict answer, usage, endpoint (base URL) and hedged (True if a duplicate was sent)
+    """
+    pool = get_endpoint_pool()
+    endpoint = pool.acquire()
+    _hedge_budget.record_request()
+    hedge_after = _hedge_after(params['model'])
+    if hedge_after is None:
+        return _chat_attempt(endpoint, params, timeout)
+    primary = _hedge_executor.submit(_chat_attempt, endpoint, params, timeout)
+    done, _ = wait([primary], timeout=hedge_after)
+    if done:
+        return primary.result()
+    hedge_endpoint = pool.try_acquire(exclude=endpoint)
+    if hedge_endpoint is None:
+        return primary.result()
+    if not _hedge_budget.try_spend():
+        pool.release(hedge_endpoint, CANCELLED)
+        return primary.result()
+    hedge = _hedge_executor.submit(_chat_attempt, hedge_endpoint, params, timeout)
+    pending = {primary, hedge}
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                if future is hedge:
+                    _hedge_budget.record_win()
+                return dict(future.result(), hedged=True)
+    # both failed, the primary error drives the retry
+    return primary.result()
+
+
+async def _async_chat_attempt(endpoint, params, timeout):
+    start = time.time()
+    try:
+        client = get_async_openai_client(endpoint.base_url, endpoint.api_key)
+        response = await client.chat.completions.create(extra_headers=_extra_headers(), extra_body={}, timeout=timeout, **params)
+        answer = response.choices[0].message.content
+    except asyncio.CancelledError:
+        get_endpoint_pool().release(endpoint, CANCELLED)
+        raise
+    except Exception as e:
+        get_endpoint_pool().release(endpoint, classify_error(e), retry_after_seconds(e))
+        raise
+    get_endpoint_pool().release(endpoint, SUCCESS)
+    _latencies.record(params['model'], time.time() - start)
+    return {'answer': answer, 'usage': getattr(response, 'usage', None), 'endpoint': endpoint.base_url, 'hedged': False}
+
+
+async def _async_hedged_chat(params, timeout):
+    """ _hedged_chat on the event loop, the slower request is cancelled """
+    pool = get_endpoint_pool()
+    endpoint = await pool.aacquire()
+    _hedge_budget.record_request()
+    hedge_after = _hedge_after(params['model'])
+    if hedge_after is None:
+        return await _async_chat_attempt(endpoint, params, timeout)
+    primary = asyncio.ensure_future(_async_chat_attempt(endpoint, params, timeout))
+    pending = {primary}
+    try:
+        done, _ = await asyncio.wait(pending, timeout=hedge_after)
+        if done:
+            return primary.result()
+        hedge_endpoint = pool.try_acquire(exclude=endpoint)
+        if hedge_endpoint is None:
+            return await primary
+        if not _hedge_budget.try_spend():
+            pool.release(hedge_endpoint, CANCELLED)
+            return await primary
+        hedge = asyncio.ensure_future(_async_chat_attempt(hedge_endpoint, params, timeout))
+        pending = {primary, hedge}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is hedge:
+                        _hedge_budget.record_win()
+                    return dict(task.result(), hedged=True)
+        return primary.result()
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+def _chat_completion(model, messages, temperature, max_tokens, response_format, max_retries, timeout):
+    params = dict(model=model, messages=messages, temperature=temperature, max_tokens=max_tokens,
+                  response_format=response_format)
+    start = time.time()
     for attempt in range(max_retries):
         try:
-            if not OPENAI_API_BASE:
-                raise ValueError("Missing OPENAI_API_BASE/OPENROUTER_BASE_URL")
-            if not OPENAI_API_KEY:
-                raise ValueError("Missing OPENAI_API_KEY/OPENROUTER_API_KEY")
-            base_url = random.choice(OPENAI_API_BASE)
-            api_key = random.choice(OPENAI_API_KEY)
-            client = OpenAI(
-                base_url=base_url,
-                api_key=api_key,
-            )
-            extra_headers = {}
-            if OPENROUTER_HTTP_REFERER:
-                extra_headers["HTTP-Referer"] = OPENROUTER_HTTP_REFERER
-            if OPENROUTER_X_TITLE:
-                extra_headers["X-Title"] = OPENROUTER_X_TITLE
-            try:
-                response = client.chat.completions.create(
-                    extra_headers=extra_headers,
-                    extra_body={},
-                    model=model,
-                    messages=messages,
-                    temperature=temperature,
-                    max_tokens=max_tokens,
-                    response_format=response_format
-                )
-            except TypeError:
-                # Backwards compatibility with older OpenAI Python SDKs that don't support extra_headers/extra_body.
-                response = client.chat.completions.create(
-                    model=model,
-                    messages=messages,
-                    temperature=temperature,
-                    max_tokens=max_tokens,
-                    response_format=response_format
-                )
-            answer = response.choices[0].message.content
-            return answer
+            result = _hedged_chat(params, timeout)
+            _record_call(model, 'ok', start, attempt + 1, result)
+            return result['answer']
         except Exception as e:
             logger.error(e)
-            if "invalid_request_error" in str(e):
-                logger.error(f"Invalid request error: {e}")
-                return None
-            if "sensitive words detected" in str(e):
-                logger.error(f"Sensitive words detected: {e}")
+            if _is_fatal_chat_error(e):
+                _record_call(model, 'failed', start, attempt + 1)
                 return None
-            delay = 2 * (2**attempt)
-            logger.warning(f"Failed to generate text, retrying after {delay} seconds ...")
+            # a throttled endpoint stays paused for its Retry-After, the retry may go to another one
+            delay = backoff_delay(attempt)
+            logger.warning(f"Failed to generate text, retrying after {delay:.1f} seconds ...")
             time.sleep(delay)
-        finally:
-            if client:
-                client.close()
                 
     logger.error(f"Failed to generate text after {max_retries} attempts.")
+    _record_call(model, 'failed', start, max_retries)
     return None
 
 
+async def _async_chat_completion(model, messages, temperature, max_tokens, response_format, max_retries, timeout):
+    params = dict(model=model, messages=messages, temperature=temperature, max_tokens=max_tokens,
+                  response_format=response_format)
+    start = time.time()
+    for attempt in range(max_retries):
+        try:
+            result = await _async_hedged_chat(params, timeout)
+            _record_call(model, 'ok', start, attempt + 1, result)
+            return result['answer']
+        except Exception as e:
+            logger.error(e)
+            if _is_fatal_chat_error(e):
+                _record_call(model, 'failed', start, attempt + 1)
+                return None
+            delay = backoff_delay(attempt)
+            logger.warning(f"Failed to generate text, retrying after {delay:.1f} seconds ...")
+            await asyncio.sleep(delay)
+
+    logger.error(f"Failed to generate text after {max_retries} attempts.")
+    _record_call(model, 'failed', start, max_retries)
+    return None
+
+
+if LLM_CACHE_PATH:
+    set_llm_cache(LLM_CACHE_PATH, replay=LLM_CACHE_REPLAY)
+if LLM_METRICS_PATH:
+    set_llm_metrics(LLM_METRICS_PATH, stage=os.getenv("SWRBENCH_STAGE"))
+
+
 def safe_parse_time(time_str, logging=None):
     if not time_str or time_str.strip() == '':
         return None
@@ -131,3 +427,32 @@ def safe_parse_time(time_str, logging=None):
         if logging:
             logging.warning(f"时间解析失败: {time_str} - {str(e)}")
         return None
+
+
+def build_pr_timeline(timeline_dict, review_comments_dict):
+    """Attach the review comment replies to their root comment and return the PR timeline sorted by date.
+
+    timeline_dict holds the timeline events keyed by id, review_comments_dict the review comments keyed by
+    comment id (each one with a 'reply' list already containing itself).
+    """
+    for id, comment in review_comments_dict.items():
+        if comment['in_reply_to_id'] is not None:
+            root_reply_id = comment['in_reply_to_id']
+            while review_comments_dict[root_reply_id]['in_reply_to_id'] is not None:
+                root_reply_id = review_comments_dict[root_reply_id]['in_reply_to_id']
+            review_comments_dict[root_reply_id]['reply'].append({
+                'id': comment['id'],
+                'user': comment['user'],
+                'body': comment['body'],
+                'created_at': comment['created_at']
+            })
+        else:
+            timeline_dict[f"review_comment_{id}"] = comment
+
+    timeline = sorted(timeline_dict.values(),
+                      key=lambda x: safe_parse_time(x.get('date') or x.get('created_at')) or datetime.min.replace(tzinfo=timezone.utc))
+    for item in timeline:
+        if item['type'] == 'review_comment':
+            item['reply'] = sorted(item['reply'],
+                                   key=lambda x: safe_parse_time(x.get('date') or x.get('created_at')) or datetime.min.replace(tzinfo=timezone.utc))
+    return timeline